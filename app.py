@@ -3,117 +3,286 @@
 Retirement Planner - Flask Web Application
 """
 
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
-from collections import defaultdict
+from flask import (Blueprint, Flask, Response, current_app, g, render_template, request, jsonify,
+                   session, redirect, stream_with_context, url_for)
+from flask.sessions import SecureCookieSessionInterface
+from collections import defaultdict, namedtuple
 from functools import wraps
 import os
+import numpy as np
 import secrets
+import threading
+import time
 from urllib.parse import urlparse
 
-app = Flask(__name__)
-app.secret_key = os.environ.get('SECRET_KEY', secrets.token_hex(16))
+from planner import batch, encoding, executor, history, metrics, solver, sweep
+from planner.amortization import property_schedule
+from planner.compiled import CompiledConfig
+from planner.cache import LRUCache
+from planner.engine import SCENARIOS, ProjectionEngine, summarize
+from planner.history import HistoryError
+from planner.incremental import resume
+from planner.jobs import JobLimitError, JobQueue, SQLiteJobStore
+from planner.milestones import MilestoneTable
+from planner.montecarlo import MonteCarloError, run_monte_carlo
+from planner.montecarlo import prepare as prepare_monte_carlo
+from planner.store import ConfigError, ConfigStore, SQLiteBackend
+from planner.solver import SolveError
+from planner.sweep import SweepError
+from planner.taxes import compile_taxes
+from planner.withdrawals import Proportional, Retired, compile_withdrawals
+
+# Routes and hooks; create_app() registers them on each app it builds
+bp = Blueprint('planner', __name__)
 
 # Auth is only enabled when both env vars are provided
 AUTH_USER = os.environ.get('ADMIN_USER', '')
 AUTH_PASS = os.environ.get('ADMIN_PASS', '')
 AUTH_ENABLED = bool(AUTH_USER and AUTH_PASS)
 
+# What create_app() builds alongside each app; requests reach it through stores()
+Stores = namedtuple('Stores', 'projection_cache config_store job_queue')
+
+# Yearly returns for backtests (see planner.history). A CSV is converted
+# to the .npy next to it by warm_up() or python -m planner.history; requests
+# only memory-map that .npy
+HISTORY_DATA = os.environ.get(
+    'HISTORY_DATA', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'returns.csv'))
+_history = {}
+_history_lock = threading.Lock()
+
+# Instrumentation (see planner.metrics): work counters inside the
+# calculators, a sampled share of requests profiled, and an optional
+# bearer token for scraping /api/metrics when auth is enabled
+metrics.enable_counters(os.environ.get('METRICS_COUNTERS', 'false').lower() in ('1', 'true'))
+profiler = metrics.SamplingProfiler(
+    rate=float(os.environ.get('PROFILE_SAMPLE_RATE', '0')),
+    top=int(os.environ.get('PROFILE_TOP', '20')),
+)
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+# Per-phase timings reveal server internals, so they are opt-in
+SERVER_TIMING = os.environ.get('SERVER_TIMING', 'false').lower() in ('1', 'true')
+
+def stores():
+    """The Stores of the app handling the current request"""
+    return current_app.extensions['planner']
+
+# Read when /api/metrics renders, from the app serving it
+metrics.registry.collected(
+    'planner_projection_cache_lookups_total', 'Projection cache lookups by result', 'counter',
+    lambda: {(result,): stores().projection_cache.stats()[result] for result in ('hits', 'misses')},
+    ('result',))
+metrics.registry.collected(
+    'planner_projection_cache_entries', 'Projections held in the cache', 'gauge',
+    lambda: stores().projection_cache.stats()['size'])
+metrics.registry.collected(
+    'planner_config_cache_entries', 'Compiled configs held in memory', 'gauge',
+    lambda: stores().config_store.cache.stats()['size'])
+metrics.registry.collected(
+    'planner_jobs_total', 'Background jobs by outcome', 'counter',
+    lambda: {(status,): count
+             for status, count in stores().job_queue.stats().items() if status != 'stored'},
+    ('status',))
+
+def request_timings():
+    """This request's metrics.Timings, started by the first phase to need it"""
+    if 'timings' not in g:
+        g.timings = metrics.Timings()
+    return g.timings
+
+def phase(name):
+    """Time a block as one phase of the current request"""
+    return request_timings().phase(name)
+
+class TimedSessionInterface(SecureCookieSessionInterface):
+    """Counts decoding the session cookie toward the 'session' phase"""
+
+    def open_session(self, app, request):
+        start = time.perf_counter()
+        opened = super().open_session(app, request)
+        request_timings().add('session', time.perf_counter() - start)
+        return opened
+
+def has_metrics_token():
+    """Whether the request carries 'Authorization: Bearer <METRICS_TOKEN>'"""
+    supplied = request.headers.get('Authorization', '')
+    return bool(METRICS_TOKEN) and secrets.compare_digest(supplied, f'Bearer {METRICS_TOKEN}')
+
+@bp.before_app_request
+def start_profile():
+    request_timings()
+    g.profile = profiler.start()
+
+@bp.after_app_request
+def record_timings(response):
+    """Server-Timing header, phase histograms and the sampled profile"""
+    timings = request_timings()
+    total = timings.elapsed()
+    if SERVER_TIMING or has_metrics_token():
+        response.headers['Server-Timing'] = timings.header(total)
+    # Label by view name, without the blueprint's prefix
+    endpoint = (request.endpoint or 'none').rpartition('.')[2]
+    metrics.request_seconds.observe(total, endpoint=endpoint)
+    for name, seconds in timings.phases.items():
+        metrics.phase_seconds.observe(seconds, endpoint=endpoint, phase=name)
+    profile = g.pop('profile', None)
+    if profile is not None:
+        current_app.logger.info('Profile of %s %s\n%s', request.method, request.path,
+                                profiler.report(profile))
+    return response
+
+@bp.teardown_app_request
+def stop_profile(exc):
+    # A request that failed before after_request must not leave its thread profiled
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profile.disable()
+
 def login_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
         if AUTH_ENABLED and not session.get('logged_in'):
             if request.path.startswith('/api/'):
                 return jsonify({'error': 'Unauthorized'}), 401
-            return redirect(url_for('login', next=request.path))
+            return redirect(url_for('.login', next=request.path))
         return f(*args, **kwargs)
     return decorated
 
+def session_owner():
+    """Identity of this session, which owns its background jobs"""
+    if 'owner' not in session:
+        session['owner'] = secrets.token_urlsafe(16)
+    return session['owner']
+
 class RetirementCalculator:
     def __init__(self, config_data):
         self.config = config_data
         self.current_year = 2025
         self.inflation_rate = config_data.get('inflation_rate', 2.5) / 100.0
+        # Milestone returns compiled once for every retirement age and scenario
+        self.returns = MilestoneTable(
+            config_data['milestones'],
+            [a['name'] for a in config_data['accounts'] if a['type'] != 'Real Estate'],
+        )
+        # Event and account indexes shared by every projection of this config
+        self.compiled = CompiledConfig(config_data)
+        # Withdrawal strategy and draw order (see planner.withdrawals)
+        self.withdrawals = compile_withdrawals(config_data)
+        # Property schedules do not depend on the scenario; compile them once
+        n_years = max(config_data['life_expectancy'] - config_data['current_age'] + 1, 0)
+        self.property_schedules = {
+            a['name']: property_schedule(a, n_years)
+            for a in config_data['accounts'] if a['type'] == 'Real Estate'
+        }
+        # Brackets for the opt-in tax on withdrawals (see planner.taxes)
+        rental_income = sum((s.net_income for s in self.property_schedules.values()),
+                            np.zeros(n_years))
+        self.taxes = compile_taxes(config_data, rental_income)
 
     def get_return_for_account_and_year(self, account_name, years_to_retirement, scenario='expected'):
         """Get the appropriate return rate for an account based on years to retirement"""
-        milestones = self.config['milestones'].get(account_name, [])
-
-        # Sort milestones by years_before_retirement (descending)
-        sorted_milestones = sorted(milestones, key=lambda x: x['years_before'], reverse=True)
-
-        # Find the applicable milestone
-        applicable_milestone = None
-        for milestone in sorted_milestones:
-            if years_to_retirement >= milestone['years_before']:
-                applicable_milestone = milestone
-                break
-
-        if not applicable_milestone:
-            # Use the most conservative (closest to retirement)
-            applicable_milestone = sorted_milestones[-1] if sorted_milestones else {'expected': 5.0, 'std_dev': 1.0}
-
-        expected_return = applicable_milestone['expected'] / 100.0
-        std_dev = applicable_milestone['std_dev'] / 100.0
-
-        if scenario == 'best':
-            return expected_return + std_dev
-        elif scenario == 'worst':
-            return expected_return - std_dev
-        else:
-            return expected_return
+        return self.returns.rate(account_name, years_to_retirement, scenario)
 
     def _get_accessible_balances(self, age, accounts_balance, ss_start_age):
         """Get account balances accessible at a given age, grouped by access phase"""
-        # Identify account types by looking up config
-        account_types = {}
-        for account in self.config['accounts']:
-            account_types[account['name']] = account['type']
-
-        accessible = {}
-        for name, balance in accounts_balance.items():
-            acct_type = account_types.get(name, '')
-            if acct_type == 'Real Estate':
-                continue  # Real estate is not withdrawable
-            if age < 59.5:
-                # Before 59.5: taxable + Roth IRA contributions (simplified: full Roth balance)
-                if acct_type in ('Taxable', 'Savings', 'Roth IRA'):
-                    accessible[name] = balance
-            elif age < ss_start_age:
-                # Before SS: taxable + retirement accounts (401k, IRA, Roth)
-                if acct_type in ('Taxable', 'Savings', '401k', 'IRA', 'Roth IRA'):
-                    accessible[name] = balance
-            else:
-                # After SS: all accounts
-                accessible[name] = balance
-
-        return accessible
+        # Before 59.5: taxable + Roth IRA contributions (simplified: full Roth balance)
+        # Before SS: taxable + retirement accounts (401k, IRA, Roth)
+        # After SS: all accounts; real estate is never withdrawable
+        return {
+            name: accounts_balance[name]
+            for name in self.compiled.accessible_names(age, ss_start_age)
+            if name in accounts_balance
+        }
 
     def calculate_withdrawal_amount(self, age, retirement_age, accounts_balance,
-                                     ss_start_age, initial_withdrawal, years_retired):
-        """Calculate withdrawal amount adjusted for inflation each year.
-        Uses target_retirement_income if configured, otherwise the 4% rule."""
+                                     ss_start_age, initial_withdrawal, years_retired,
+                                     retired=None):
+        """Desired income for a retired year from the config's withdrawal strategy.
+        initial_withdrawal uses target_retirement_income if configured, otherwise
+        the 4% rule; by default it grows with inflation. Strategies that follow
+        the balances read it from retired, a planner.withdrawals.Retired."""
         if age < retirement_age:
             return 0
 
-        return initial_withdrawal * ((1 + self.inflation_rate) ** years_retired)
+        if retired is None:
+            retired = Retired(initial_withdrawal, 0, initial_withdrawal, 0, 1.0, years_retired,
+                              self.config['life_expectancy'] - age + 1)
+        return float(self.withdrawals.strategy.amount(retired, self.inflation_rate))
 
     def distribute_withdrawal(self, age, total_withdrawal, accounts_balance, ss_start_age):
-        """Distribute withdrawal across accessible accounts proportionally"""
+        """Distribute withdrawal across accessible accounts in the config's draw order"""
         withdrawals = defaultdict(float)
         remaining = total_withdrawal
 
         accessible = self._get_accessible_balances(age, accounts_balance, ss_start_age)
         total_accessible = sum(accessible.values())
 
-        if total_accessible > 0:
+        order = self.withdrawals.order
+        if total_accessible > 0 and not isinstance(order, Proportional):
+            names = self.compiled.invest_names
+            pre = np.array([accounts_balance[name] for name in names], dtype=float)
+            mask = np.array([name in accessible for name in names], dtype=float)
+            drawn = order.draw(pre[None], mask, np.array([total_withdrawal]))[0].tolist()
+            for name, amount in zip(names, drawn):
+                if name in accessible and accounts_balance[name] > 0:
+                    withdrawals[name] = amount
+        elif total_accessible > 0:
             for name, balance in accessible.items():
                 if balance > 0:
                     withdrawals[name] = min((balance / total_accessible) * remaining, balance)
 
         return withdrawals
 
-    def project_scenario(self, retirement_age, scenario='expected'):
-        """Project portfolio for a given retirement age and scenario"""
+    def _depleted_year(self, year_offset, ss_start_age, ss_annual):
+        """One year after retirement with every investable balance at zero and
+        no more events for investable accounts.
+
+        Nothing is left to grow or draw, so the year follows directly from the
+        Social Security formula, the property schedules and the tax on
+        those. Returns the same values the full loop would compute for that
+        year.
+        """
+        year = self.current_year + year_offset
+        age = self.config['current_age'] + year_offset
+        events_this_year = self.compiled.events_in(year)
+
+        new_balances = {}
+        real_estate_income = 0
+        for account in self.config['accounts']:
+            account_name = account['name']
+            if account['type'] != 'Real Estate':
+                new_balances[account_name] = 0.0
+                continue
+            schedule = self.property_schedules[account_name]
+            if account.get('real_estate_mode', 'asset') == 'income':
+                real_estate_income += float(schedule.net_income[year_offset])
+            new_balances[account_name] = float(schedule.equity[year_offset])
+        for event in events_this_year:
+            if event['account'] in new_balances:
+                new_balances[event['account']] += event['amount']
+
+        ss_income = 0
+        if age >= ss_start_age:
+            ss_income = ss_annual * ((1 + self.inflation_rate) ** (age - ss_start_age))
+        tax = 0
+        if self.taxes is not None:
+            tax = float(self.taxes.tax(year_offset, 0.0, 0.0, ss_income,
+                                       (1 + self.inflation_rate) ** year_offset))
+        return new_balances, ss_income, real_estate_income, tax, events_this_year
+
+    def _count_work(self, full_years, depleted_years):
+        """Work counters for one projection (see planner.metrics)"""
+        metrics.calculator_years.inc(full_years, mode='full')
+        metrics.calculator_years.inc(depleted_years, mode='depleted')
+        for account_type in self.compiled.types:
+            metrics.calculator_account_years.inc(full_years, type=account_type)
+
+    def project_scenario(self, retirement_age, scenario='expected', summary_only=False):
+        """Project portfolio for a given retirement age and scenario.
+
+        With summary_only, return just the summary figures (see
+        planner.engine.summarize) without building the year-by-year dicts.
+        """
         current_age = self.config['current_age']
         life_expectancy = self.config['life_expectancy']
         ss_start_age = self.config['ss_start_age']
@@ -122,22 +291,60 @@ class RetirementCalculator:
 
         # Initialize account balances
         balances = {}
-        re_state = {}  # Track mutable real estate state per account
         for account in self.config['accounts']:
             if account['type'] == 'Real Estate':
                 balances[account['name']] = account.get('property_value', 0) - account.get('mortgage_balance', 0)
-                re_state[account['name']] = {
-                    'property_value': account.get('property_value', 0),
-                    'mortgage_balance': account.get('mortgage_balance', 0),
-                }
             else:
                 balances[account['name']] = account['current_balance']
 
-        # Track year-by-year results
+        # Track year-by-year results, or just the summary inputs
         projections = []
+        ages, totals, incomes = [], [], []
         initial_withdrawal = 0  # Set at retirement
 
-        for year_offset in range(life_expectancy - current_age + 1):
+        invest_names = self.compiled.invest_names
+        last_invest_event = self.compiled.last_invest_event_year
+        excluded_names = self.compiled.excluded_names
+        n_years = max(life_expectancy - current_age + 1, 0)
+        depleted_years = 0
+
+        # Strategies that follow the balances also see last year's withdrawal,
+        # the balance at retirement and this year's growth
+        dynamic = self.withdrawals.dynamic
+        previous_withdrawal = 0
+        initial_invested = 0
+
+        def record(year_offset, new_balances, contributions, employer_match, total_withdrawal,
+                   withdrawal_by_account, ss_income, real_estate_income, tax, events_this_year):
+            age = current_age + year_offset
+            # Compute total portfolio, excluding RE accounts flagged as excluded
+            total_portfolio = sum(v for k, v in new_balances.items() if k not in excluded_names)
+            total_income = total_withdrawal + ss_income + real_estate_income - tax
+            if summary_only:
+                ages.append(age)
+                totals.append(total_portfolio)
+                incomes.append(total_income)
+                return
+
+            # Store projection
+            projections.append({
+                'year': self.current_year + year_offset,
+                'age': age,
+                'years_to_retirement': retirement_age - age,
+                'balances': dict(new_balances),
+                'total_portfolio': total_portfolio,
+                'contributions': contributions,
+                'employer_match': employer_match,
+                'withdrawal': total_withdrawal,
+                'withdrawal_by_account': dict(withdrawal_by_account),
+                'ss_income': ss_income,
+                'real_estate_income': real_estate_income,
+                'taxes': tax,
+                'total_income': total_income,
+                'events': [e['description'] for e in events_this_year]
+            })
+
+        for year_offset in range(n_years):
             year = self.current_year + year_offset
             age = current_age + year_offset
             years_to_retirement = retirement_age - age
@@ -147,60 +354,25 @@ class RetirementCalculator:
             inflation_factor = (1 + self.inflation_rate) ** year_offset
 
             # Process one-time events for this year
-            events_this_year = [e for e in self.config['events'] if e['year'] == year]
+            events_this_year = self.compiled.events_in(year)
 
             # Calculate returns and contributions
             new_balances = {}
             contributions = {}
             employer_match = {}
             real_estate_income = 0
+            invested_before = invested_grown = 0
 
             for account in self.config['accounts']:
                 account_name = account['name']
                 balance = balances[account_name]
 
-                # Real estate accounts use dedicated logic
+                # Real estate accounts read the precomputed property schedule
                 if account['type'] == 'Real Estate':
-                    state = re_state[account_name]
-                    prop_value = state['property_value']
-                    mort_balance = state['mortgage_balance']
-                    mort_rate = account.get('mortgage_rate', 0) / 100.0
-                    mort_payment = account.get('mortgage_payment', 0)
-                    prop_tax = account.get('property_tax', 0)
-                    monthly_rent = account.get('monthly_rent', 0)
-
-                    # Appreciate property value
-                    appreciation_rate = account.get('appreciation_rate', 0) / 100.0
-                    prop_value *= (1 + appreciation_rate)
-
-                    # Amortize mortgage month by month
-                    monthly_rate = mort_rate / 12
-                    total_payments_made = 0
-                    for _ in range(12):
-                        if mort_balance <= 0:
-                            break
-                        interest = mort_balance * monthly_rate
-                        principal = min(mort_payment - interest, mort_balance)
-                        if principal < 0:
-                            principal = 0
-                        mort_balance -= principal
-                        total_payments_made += interest + principal
-
-                    mort_balance = max(0, mort_balance)
-
-                    # Net annual income (only for income properties)
-                    re_mode = account.get('real_estate_mode', 'asset')
-                    if re_mode == 'income':
-                        annual_rent = monthly_rent * 12
-                        net_income = annual_rent - total_payments_made - prop_tax
-                        real_estate_income += net_income
-
-                    # Persist updated state for next year
-                    state['property_value'] = prop_value
-                    state['mortgage_balance'] = mort_balance
-
-                    # Equity = property value - mortgage balance
-                    new_balances[account_name] = prop_value - mort_balance
+                    schedule = self.property_schedules[account_name]
+                    if account.get('real_estate_mode', 'asset') == 'income':
+                        real_estate_income += float(schedule.net_income[year_offset])
+                    new_balances[account_name] = float(schedule.equity[year_offset])
                     continue
 
                 # Get return rate
@@ -226,6 +398,9 @@ class RetirementCalculator:
 
                 # Apply returns to beginning balance, plus half-year return on contributions
                 investment_return = balance * return_rate
+                if dynamic:
+                    invested_before += balance
+                    invested_grown += balance * (1 + return_rate)
                 contribution_return = (contribution + match) * return_rate * 0.5
 
                 new_balances[account_name] = balance + investment_return + contribution + match + contribution_return
@@ -241,6 +416,7 @@ class RetirementCalculator:
             total_withdrawal = 0
             withdrawal_by_account = defaultdict(float)
             ss_income = 0
+            tax = 0
 
             if age >= retirement_age:
                 # Set initial desired income at retirement
@@ -250,14 +426,23 @@ class RetirementCalculator:
                         initial_withdrawal = target_income
                     else:
                         # Exclude real estate equity from 4% rule (not withdrawable)
-                        re_names = {a['name'] for a in self.config['accounts'] if a['type'] == 'Real Estate'}
+                        re_names = self.compiled.re_names
                         investable = sum(v for k, v in new_balances.items() if k not in re_names)
                         initial_withdrawal = investable * 0.04
 
+                retired = None
+                if dynamic:
+                    invested = sum(new_balances[name] for name in invest_names)
+                    if age == retirement_age:
+                        initial_invested = invested
+                    growth = invested_grown / invested_before if invested_before > 0 else 1.0
+                    retired = Retired(initial_withdrawal, initial_invested, previous_withdrawal,
+                                      invested, growth, years_retired, life_expectancy - age + 1)
                 desired_income = self.calculate_withdrawal_amount(
                     age, retirement_age, new_balances, ss_start_age,
-                    initial_withdrawal, years_retired
+                    initial_withdrawal, years_retired, retired
                 )
+                previous_withdrawal = desired_income
 
                 # Social Security covers part of desired income
                 # SS value is in today's dollars; adjust for inflation only from SS start
@@ -271,7 +456,16 @@ class RetirementCalculator:
                 # Cap withdrawal at accessible balance (not all accounts)
                 accessible = self._get_accessible_balances(age, new_balances, ss_start_age)
                 total_accessible = sum(accessible.values())
-                total_withdrawal = min(total_withdrawal, total_accessible)
+                if self.taxes is None:
+                    total_withdrawal = min(total_withdrawal, total_accessible)
+                else:
+                    # Gross up so the remainder is left after tax, capped the same way
+                    pre = np.array([[new_balances[name] for name in invest_names]])
+                    mask = np.array([name in accessible for name in invest_names], dtype=float)
+                    amount, _, paid, _ = self.taxes.gross_up(
+                        year_offset, pre, mask, np.array([total_withdrawal]), ss_income,
+                        inflation_factor, self.withdrawals.order)
+                    total_withdrawal, tax = float(amount[0]), float(paid[0])
 
                 withdrawal_by_account = self.distribute_withdrawal(
                     age, total_withdrawal, new_balances, ss_start_age
@@ -282,31 +476,26 @@ class RetirementCalculator:
                     new_balances[account_name] -= withdrawal
                     new_balances[account_name] = max(0, new_balances[account_name])
 
-            # Compute total portfolio, excluding RE accounts flagged as excluded
-            excluded_names = {a['name'] for a in self.config['accounts']
-                              if a['type'] == 'Real Estate' and a.get('exclude_from_portfolio')}
-            total_portfolio = sum(v for k, v in new_balances.items() if k not in excluded_names)
-
-            # Store projection
-            projection = {
-                'year': year,
-                'age': age,
-                'years_to_retirement': years_to_retirement,
-                'balances': dict(new_balances),
-                'total_portfolio': total_portfolio,
-                'contributions': contributions,
-                'employer_match': employer_match,
-                'withdrawal': total_withdrawal,
-                'withdrawal_by_account': dict(withdrawal_by_account),
-                'ss_income': ss_income,
-                'real_estate_income': real_estate_income,
-                'total_income': total_withdrawal + ss_income + real_estate_income,
-                'events': [e['description'] for e in events_this_year]
-            }
-
-            projections.append(projection)
+            record(year_offset, new_balances, contributions, employer_match, total_withdrawal,
+                   withdrawal_by_account, ss_income, real_estate_income, tax, events_this_year)
             balances = new_balances
 
+            # Once retired with every investable balance at zero, only Social
+            # Security, real estate and events move; fill in the rest directly
+            if (age >= retirement_age and not any(balances[name] for name in invest_names)
+                    and (last_invest_event is None or year >= last_invest_event)):
+                for offset in range(year_offset + 1, n_years):
+                    new_balances, ss_income, real_estate_income, tax, events = self._depleted_year(
+                        offset, ss_start_age, ss_annual)
+                    record(offset, new_balances, {}, {}, 0, {}, ss_income, real_estate_income,
+                           tax, events)
+                depleted_years = n_years - year_offset - 1
+                break
+
+        if metrics.counting:
+            self._count_work(n_years - depleted_years, depleted_years)
+        if summary_only:
+            return summarize(retirement_age, scenario, ages, totals, incomes)
         return projections
 
 def get_default_config():
@@ -401,119 +590,559 @@ def get_default_config():
         ]
     }
 
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
     if not AUTH_ENABLED:
-        return redirect(url_for('index'))
+        return redirect(url_for('.index'))
     if session.get('logged_in'):
-        return redirect(url_for('index'))
+        return redirect(url_for('.index'))
     error = None
     if request.method == 'POST':
         if (request.form.get('username') == AUTH_USER and
                 request.form.get('password') == AUTH_PASS):
             session['logged_in'] = True
-            next_page = request.args.get('next') or url_for('index')
+            session['owner'] = secrets.token_urlsafe(16)
+            next_page = request.args.get('next') or url_for('.index')
             # Validate that next_page is a local relative URL to prevent open redirects
             next_page = next_page.replace('\\', '')
             parsed = urlparse(next_page)
             if parsed.scheme or parsed.netloc:
-                next_page = url_for('index')
+                next_page = url_for('.index')
             return redirect(next_page)
         error = 'Invalid username or password.'
     return render_template('login.html', error=error)
 
-@app.route('/logout')
+@bp.route('/logout')
 def logout():
     session.pop('logged_in', None)
-    return redirect(url_for('login' if AUTH_ENABLED else 'index'))
+    session.pop('owner', None)
+    return redirect(url_for('.login' if AUTH_ENABLED else '.index'))
+
+def session_config():
+    """This session's StoredConfig, falling back to the defaults when it is
+    missing, expired or no longer valid.
+
+    A config left in the cookie by an older version is moved into the store
+    the first time the session is seen.
+    """
+    if 'config' in session:
+        legacy = session.pop('config')
+        try:
+            stored = stores().config_store.save(legacy)
+        except ConfigError:
+            current_app.logger.warning('Dropped an invalid config from a legacy session')
+        else:
+            session['config_id'] = stored.id
+            return stored
+    config_id = session.get('config_id')
+    try:
+        stored = stores().config_store.get(config_id) if config_id else None
+    except ConfigError:
+        current_app.logger.warning('Stored config %s no longer compiles; using the defaults',
+                                   config_id)
+        stored = None
+    return stored if stored is not None else stores().config_store.save(get_default_config())
+
+def remember_config(stored):
+    """Point the session at a stored config"""
+    if session.get('config_id') != stored.id:
+        session['config_id'] = stored.id
 
-@app.route('/')
+@bp.route('/')
 @login_required
 def index():
     """Main page - configuration form"""
-    if 'config' not in session:
-        session['config'] = get_default_config()
-    return render_template('index.html', config=session['config'], auth_enabled=AUTH_ENABLED)
+    stored = session_config()
+    remember_config(stored)
+    return render_template('index.html', config=stored.config, auth_enabled=AUTH_ENABLED)
 
-@app.route('/api/config', methods=['GET', 'POST'])
+@bp.route('/api/config', methods=['GET', 'POST'])
 @login_required
 def config_api():
     """Get or update configuration"""
     if request.method == 'POST':
-        session['config'] = request.json
+        try:
+            stored = stores().config_store.save(request.get_json(silent=True))
+        except ConfigError as exc:
+            return jsonify({'status': 'error', 'error': str(exc)}), 400
+        remember_config(stored)
         return jsonify({'status': 'success', 'message': 'Configuration saved'})
     else:
-        if 'config' not in session:
-            session['config'] = get_default_config()
-        return jsonify(session['config'])
+        stored = session_config()
+        remember_config(stored)
+        return jsonify(stored.config)
 
-@app.route('/api/reset', methods=['POST'])
+@bp.route('/api/reset', methods=['POST'])
 @login_required
 def reset_config():
     """Reset to default configuration"""
-    session['config'] = get_default_config()
-    return jsonify({'status': 'success', 'config': session['config']})
+    stored = stores().config_store.save(get_default_config())
+    remember_config(stored)
+    return jsonify({'status': 'success', 'config': stored.config})
 
-@app.route('/api/calculate', methods=['POST'])
+@bp.route('/api/calculate', methods=['POST'])
 @login_required
 def calculate():
     """Run calculations and return results"""
-    config = session.get('config', get_default_config())
-    
-    calculator = RetirementCalculator(config)
-    
-    results = {}
-    
-    for retirement_age in config['retirement_ages']:
-        results[retirement_age] = {
-            'expected': calculator.project_scenario(retirement_age, 'expected'),
-            'best': calculator.project_scenario(retirement_age, 'best'),
-            'worst': calculator.project_scenario(retirement_age, 'worst')
+    with phase('session'):
+        stored = session_config()
+    config = stored.config
+    options = request.get_json(silent=True) or {}
+
+    if options.get('mode') == 'monte_carlo':
+        return monte_carlo(stored, options)
+    if options.get('mode') == 'backtest':
+        return backtest(stored, options)
+
+    output = options.get('format', 'json')
+    dtype = options.get('dtype', 'float64')
+    error = format_error(output, dtype)
+    if error:
+        return error
+
+    if options.get('async'):
+        if output == 'binary' or options.get('stream'):
+            return jsonify({'error': 'async supports the json and columnar formats'}), 400
+        base_key = session.get('projection_key')
+        session['projection_key'] = stored.key
+        return submit_job('calculate', projection_job, stored, base_key, output,
+                          bool(options.get('lazy')))
+
+    if options.get('stream'):
+        if output == 'binary':
+            return jsonify({'error': 'stream supports the json and columnar formats'}), 400
+        return stream_projections(stored, output, bool(options.get('lazy')))
+
+    with phase('project'):
+        found, session['projection_key'] = calculate_projections(
+            stored, session.get('projection_key'))
+    jobs = [(age, scenario) for age in config['retirement_ages'] for scenario in SCENARIOS]
+    projections = [found[job] for job in jobs]
+    with phase('summary'):
+        summary = [projection.summary() for projection in projections]
+
+    with phase('serialize'):
+        if options.get('lazy'):
+            return jsonify(lazy_result(config, session['projection_key'], summary))
+        return encode_projections(config, projections, summary, output, dtype)
+
+@bp.route('/api/results/<result>/<int:retirement_age>/<scenario>')
+@login_required
+def projection_detail(result, retirement_age, scenario):
+    """Year-by-year detail for one projection of a lazy /api/calculate result.
+
+    result is the handle that call returned. It is only valid for the
+    config currently in the session; once the cache has dropped the
+    projection it is recomputed (or resumed) from that config.
+    """
+    stored = session_config()
+    config = stored.config
+    if (result != session.get('projection_key') or scenario not in SCENARIOS
+            or retirement_age not in config['retirement_ages']):
+        return jsonify({'error': 'Result not found; recalculate'}), 404
+
+    output = request.args.get('format', 'json')
+    dtype = request.args.get('dtype', 'float64')
+    error = format_error(output, dtype)
+    if error:
+        return error
+
+    job = (retirement_age, scenario)
+    found, _ = calculate_projections(stored, jobs=[job])
+    projection = found[job]
+    return encode_projections(config, [projection], [projection.summary()], output, dtype)
+
+def stream_projections(stored, output, lazy):
+    """Streaming mode of /api/calculate: one NDJSON line per projection.
+
+    A 'start' line carries the result handle, then each (retirement_age,
+    scenario) is sent as a 'projection' line with its summary row (and its
+    year-by-year detail unless lazy) as soon as it is computed; 'done' ends
+    the stream. Nothing is held once its line is written.
+    """
+    config, key = stored.config, stored.key
+    base_key = session.get('projection_key')
+    # The session cookie goes out with the headers, before the first line
+    session['projection_key'] = key
+
+    def lines():
+        yield {
+            'type': 'start',
+            'result': key,
+            'retirement_ages': config['retirement_ages'],
+            'scenarios': list(SCENARIOS),
         }
-    
-    # Calculate summary statistics
-    summary = []
-    for retirement_age in config['retirement_ages']:
-        for scenario in ['expected', 'best', 'worst']:
-            projections = results[retirement_age][scenario]
-            
-            # Find retirement year
-            retirement_proj = next((p for p in projections if p['age'] == retirement_age), None)
-            portfolio_at_retirement = retirement_proj['total_portfolio'] if retirement_proj else 0
-            
-            # Find age 85
-            age_85_proj = next((p for p in projections if p['age'] == 85), None)
-            portfolio_at_85 = age_85_proj['total_portfolio'] if age_85_proj else 0
-            
-            # Calculate average income from retirement to 85
-            retirement_to_85 = [p for p in projections if retirement_age <= p['age'] <= 85]
-            avg_income = sum(p['total_income'] for p in retirement_to_85) / len(retirement_to_85) if retirement_to_85 else 0
-            
-            # Find the last age where portfolio is still above $1000
-            last_positive = next((p for p in reversed(projections) if p['total_portfolio'] > 1000), None)
-            portfolio_lasts_until_age = last_positive['age'] if last_positive else 'N/A'
-
-            summary.append({
-                'retirement_age': retirement_age,
-                'scenario': scenario,
-                'portfolio_at_retirement': portfolio_at_retirement,
-                'avg_annual_income': avg_income,
-                'portfolio_at_85': portfolio_at_85,
-                'portfolio_lasts_until_age': portfolio_lasts_until_age
-            })
-    
-    return jsonify({
+        try:
+            for (retirement_age, scenario), projection in iter_projections(
+                    stored, base_key, batch_size=executor.worker_count()):
+                line = {
+                    'type': 'projection',
+                    'retirement_age': retirement_age,
+                    'scenario': scenario,
+                    'summary': projection.summary(),
+                }
+                if not lazy and output == 'columnar':
+                    line['columns'] = {name: values.tolist()
+                                       for name, values in encoding.columns(projection).items()}
+                elif not lazy:
+                    line['projection'] = projection.to_dicts()
+                yield line
+        except Exception:
+            current_app.logger.exception('Streaming calculation failed')
+            yield {'type': 'error', 'error': 'Calculation failed'}
+            return
+        yield {'type': 'done'}
+
+    body = stream_with_context(current_app.json.dumps(line) + '\n' for line in lines())
+    return Response(body, mimetype='application/x-ndjson')
+
+def format_error(output, dtype):
+    """400 response for an unknown format or dtype, or None"""
+    if output not in encoding.FORMATS:
+        return jsonify({'error': f"format must be one of {', '.join(encoding.FORMATS)}"}), 400
+    if dtype not in encoding.DTYPES:
+        return jsonify({'error': f"dtype must be one of {', '.join(encoding.DTYPES)}"}), 400
+    return None
+
+def lazy_result(config, key, summary):
+    """Summary only; details come from /api/results/<result>/... when viewed"""
+    return {
+        'result': key,
+        'retirement_ages': config['retirement_ages'],
+        'scenarios': list(SCENARIOS),
+        'summary': summary,
+    }
+
+def encode_projections(config, projections, summary, output, dtype):
+    """Response body for projections in one of encoding.FORMATS"""
+    if output == 'binary':
+        engine = projections[0].engine if projections else ProjectionEngine(config)
+        return Response(encoding.pack(engine, projections, summary, dtype),
+                        mimetype='application/octet-stream')
+    return jsonify(projection_payload(config, projections, summary, output))
+
+def projection_payload(config, projections, summary, output):
+    """JSON-ready results in the json or columnar format"""
+    if output == 'columnar':
+        engine = projections[0].engine if projections else ProjectionEngine(config)
+        return encoding.columnar(engine, projections, summary)
+
+    results = {}
+    for projection in projections:
+        results.setdefault(projection.retirement_age, {})[projection.scenario] = projection.to_dicts()
+
+    return {
         'projections': results,
         'summary': summary
-    })
+    }
+
+def calculate_projections(stored, base_key=None, jobs=None):
+    """Projections of a StoredConfig for jobs, by default every retirement
+    age and scenario.
+
+    Returns {(retirement_age, scenario): Projection} and the config's key;
+    see iter_projections.
+    """
+    return dict(iter_projections(stored, base_key, jobs)), stored.key
+
+def iter_projections(stored, base_key=None, jobs=None, batch_size=None):
+    """Yield (job, Projection) for each distinct job as soon as it is ready.
+
+    Each (retirement_age, scenario) is cached on its own under the config's
+    key, so adding a retirement age only projects the new one. Cached jobs
+    come first. Jobs missing from the cache are resumed from the projections
+    of the config hashed as base_key when those are still cached, so an
+    edit only redoes the years and accounts it touches. The rest are
+    projected batch_size at a time, or all at once by default.
+    """
+    config, key = stored.config, stored.key
+    if jobs is None:
+        jobs = [(age, scenario) for age in config['retirement_ages'] for scenario in SCENARIOS]
+
+    missing = []
+    for job in dict.fromkeys(jobs):
+        cached = stores().projection_cache.get((key,) + job)
+        if cached is not None:
+            yield job, cached
+        else:
+            missing.append(job)
+    if not missing:
+        return
 
-@app.route('/results')
+    engine = stored.engine
+    if base_key is not None and base_key != key:
+        remaining = []
+        for job in missing:
+            base = stores().projection_cache.get((base_key,) + job)
+            projection = resume(engine, base) if base is not None else None
+            if projection is None:
+                remaining.append(job)
+                continue
+            stores().projection_cache.put((key,) + job, projection)
+            yield job, projection
+        missing = remaining
+
+    step = batch_size or max(len(missing), 1)
+    for start in range(0, len(missing), step):
+        batch = missing[start:start + step]
+        for job, projection in zip(batch, executor.project_jobs(engine, batch)):
+            stores().projection_cache.put((key,) + job, projection)
+            yield job, projection
+
+@bp.route('/api/batch/calculate', methods=['POST'])
+@login_required
+def batch_calculate():
+    """Summaries for many plans at once: a list of configs, or a base config
+    plus override patches (see planner.batch)"""
+    options = request.get_json(silent=True) or {}
+    base = options.get('base')
+    plans = options.get('configs') if base is None else options.get('overrides', [{}])
+    if (base is None) == (options.get('configs') is None):
+        return jsonify({'error': 'give either configs or base with overrides'}), 400
+    if base is not None and not isinstance(base, dict):
+        return jsonify({'error': 'base must be a config object'}), 400
+    if not isinstance(plans, list) or not 1 <= len(plans) <= batch.MAX_PLANS:
+        return jsonify({'error': f'give between 1 and {batch.MAX_PLANS} plans'}), 400
+    output = options.get('format', 'json')
+    if output not in batch.FORMATS:
+        return jsonify({'error': f"format must be one of {', '.join(batch.FORMATS)}"}), 400
+    projections = bool(options.get('projections'))
+
+    if options.get('async'):
+        return submit_job('batch', batch_job, base, plans, projections, output)
+    return jsonify(batch_job(None, base, plans, projections, output))
+
+def batch_job(job, base, plans, projections, output):
+    """Batch results; reports progress per chunk of plans when run as a job"""
+    progress = job.progress if job is not None else None
+    return {'plans': len(plans),
+            'results': batch.run_batch(plans, base, projections, output, progress)}
+
+@bp.route('/api/sweep', methods=['POST'])
+@login_required
+def sweep_api():
+    """Sensitivity of the saved config to ranges of values (see planner.sweep)"""
+    config = session_config().config
+    options = request.get_json(silent=True) or {}
+    try:
+        plan = sweep.prepare(config, options.get('parameters'), options.get('retirement_age'),
+                             options.get('scenario', 'expected'))
+    except SweepError as exc:
+        return jsonify({'error': str(exc)}), 400
+
+    if options.get('async'):
+        return submit_job('sweep', sweep_job, config, plan)
+    try:
+        return jsonify(sweep_job(None, config, plan))
+    except ConfigError as exc:
+        return jsonify({'error': str(exc)}), 400
+
+def sweep_job(job, config, plan):
+    """Sweep results"""
+    return sweep.run(config, plan)
+
+@bp.route('/api/solve', methods=['POST'])
+@login_required
+def solve_api():
+    """Maximum sustainable withdrawal or earliest safe retirement age (see planner.solver)"""
+    stored = session_config()
+    options = request.get_json(silent=True) or {}
+    try:
+        plan = solver.prepare(stored.engine, options)
+    except SolveError as exc:
+        return jsonify({'error': str(exc)}), 400
+
+    if options.get('async'):
+        return submit_job('solve', solve_job, stored, plan)
+    return jsonify(solve_job(None, stored, plan))
+
+def solve_job(job, stored, plan):
+    """Solver results"""
+    return solver.run(stored.engine, plan)
+
+def monte_carlo(stored, options):
+    """Stochastic mode of /api/calculate: success rates and percentile bands"""
+    try:
+        paths, seed = prepare_monte_carlo(options)
+    except MonteCarloError as exc:
+        return jsonify({'error': str(exc)}), 400
+
+    if options.get('async'):
+        return submit_job('monte_carlo', monte_carlo_job, stored, paths, seed)
+    with phase('simulate'):
+        results = monte_carlo_job(None, stored, paths, seed)
+    with phase('serialize'):
+        return jsonify(results)
+
+def monte_carlo_job(job, stored, paths, seed):
+    """Monte Carlo results; reports progress per batch of paths when run as a job"""
+    progress = job.progress if job is not None else None
+    results = run_monte_carlo(stored.engine, stored.config['retirement_ages'], paths, seed,
+                              progress)
+    return {'mode': 'monte_carlo', **results}
+
+def history_dataset():
+    """The backtest dataset, mapped once per process; raises HistoryError"""
+    with _history_lock:
+        if 'dataset' not in _history:
+            _history['dataset'] = history.Dataset.open(HISTORY_DATA)
+        return _history['dataset']
+
+def backtest(stored, options):
+    """Historical mode of /api/calculate: every rolling window of the dataset"""
+    try:
+        plan = history.prepare(stored.engine, history_dataset(), options)
+    except HistoryError as exc:
+        return jsonify({'error': str(exc)}), 400
+
+    if options.get('async'):
+        return submit_job('backtest', backtest_job, stored, plan)
+    with phase('simulate'):
+        results = backtest_job(None, stored, plan)
+    with phase('serialize'):
+        return jsonify(results)
+
+def backtest_job(job, stored, plan):
+    """Backtest results; reports progress per retirement age when run as a job"""
+    progress = job.progress if job is not None else None
+    results = history.run(stored.engine, history_dataset(), stored.config['retirement_ages'],
+                          plan, progress)
+    return {'mode': 'backtest', **results}
+
+def projection_job(job, stored, base_key, output, lazy):
+    """Background version of /api/calculate, reporting progress per projection"""
+    config = stored.config
+    wanted = [(age, scenario) for age in config['retirement_ages'] for scenario in SCENARIOS]
+    total = len(set(wanted))
+    job.progress(0, total)
+    found = {}
+    for found_job, projection in iter_projections(
+            stored, base_key, batch_size=executor.worker_count()):
+        found[found_job] = projection
+        job.progress(len(found), total)
+    projections = [found[found_job] for found_job in wanted]
+    summary = [projection.summary() for projection in projections]
+    if lazy:
+        return lazy_result(config, stored.key, summary)
+    return projection_payload(config, projections, summary, output)
+
+def submit_job(kind, fn, *args):
+    """Queue fn for this session; 202 with the job's id and status"""
+    app = current_app._get_current_object()
+
+    def run(job, *args):
+        # The queue's threads are outside any request; give fn the app's context
+        with app.app_context():
+            return fn(job, *args)
+
+    try:
+        job = stores().job_queue.submit(session_owner(), kind, run, *args)
+    except JobLimitError as exc:
+        return jsonify({'error': str(exc)}), 429
+    return jsonify({**job.to_dict(), 'url': url_for('.job_status', job_id=job.id)}), 202
+
+@bp.route('/api/jobs/<job_id>', methods=['GET', 'DELETE'])
+@login_required
+def job_status(job_id):
+    """Progress and, once done, the result of a job; DELETE cancels it"""
+    if request.method == 'DELETE':
+        job = stores().job_queue.cancel(session_owner(), job_id)
+    else:
+        job = stores().job_queue.get(session_owner(), job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
+@bp.route('/api/metrics')
+def metrics_api():
+    """Request timings and counters in the Prometheus text format.
+
+    With auth enabled this needs a logged-in session or, for scrapers,
+    'Authorization: Bearer <METRICS_TOKEN>'.
+    """
+    if AUTH_ENABLED and not session.get('logged_in') and not has_metrics_token():
+        return jsonify({'error': 'Unauthorized'}), 401
+    return Response(metrics.registry.render(), content_type=metrics.CONTENT_TYPE)
+
+@bp.route('/api/cache/stats')
+@login_required
+def cache_stats():
+    """Hit/miss counters for the projection cache"""
+    return jsonify(stores().projection_cache.stats())
+
+@bp.route('/results')
 @login_required
 def results():
     """Results page"""
     return render_template('results.html', auth_enabled=AUTH_ENABLED)
 
+def warm_up(app):
+    """Compile the default config and project it into the app's cache, and
+    convert the backtest CSV if it is newer than its .npy.
+
+    Every new session starts on the default config, so the first requests
+    find its engine and projections ready. Under a preloading server (see
+    gunicorn.conf.py) this runs once in the master before it forks, and the
+    workers share the compiled tables copy-on-write.
+    """
+    try:
+        history.install(HISTORY_DATA)
+    except (HistoryError, OSError) as exc:
+        # Backtests answer 400 until the dataset is converted; serve the rest
+        app.logger.warning('Could not convert the backtest dataset %s: %s', HISTORY_DATA, exc)
+    with app.app_context():
+        stored = stores().config_store.save(get_default_config())
+        calculate_projections(stored)
+    return stored
+
+def create_app(warm=False):
+    """Build the app and its stores from the environment.
+
+    Each call returns a new app with its own projection cache, config store
+    and job queue; the process pool (CALC_WORKERS) is shared by the process.
+    Importing this module builds none of them. With warm, the default config
+    is compiled and projected before the app is returned (see warm_up).
+    """
+    app = Flask(__name__)
+    app.secret_key = os.environ.get('SECRET_KEY', secrets.token_hex(16))
+    app.session_interface = TimedSessionInterface()
+
+    db = os.environ.get('CONFIG_DB', 'configs.db')
+    app.extensions['planner'] = Stores(
+        # Projections keyed by (config hash, retirement_age, scenario)
+        projection_cache=LRUCache(
+            maxsize=int(os.environ.get('CACHE_SIZE', '256')),
+            ttl=float(os.environ.get('CACHE_TTL', '3600')),
+        ),
+        # Configs by id; the session cookie only holds the id
+        # Configs neither saved nor used for CONFIG_TTL seconds are deleted
+        config_store=ConfigStore(
+            SQLiteBackend(db, ttl=float(os.environ.get('CONFIG_TTL', str(90 * 24 * 3600)))),
+            cache_size=int(os.environ.get('CONFIG_CACHE_SIZE', '256')),
+        ),
+        # Background calculations submitted with async; each session may have
+        # JOB_LIMIT of them queued or running at once. Their state sits next
+        # to the configs, so any worker can report on or cancel a job
+        job_queue=JobQueue(
+            workers=int(os.environ.get('JOB_WORKERS', '2')),
+            per_owner=int(os.environ.get('JOB_LIMIT', '2')),
+            ttl=float(os.environ.get('JOB_TTL', '3600')),
+            store=SQLiteJobStore(db),
+        ),
+    )
+    app.register_blueprint(bp)
+    if warm:
+        # Inline, before the pool is sized, so a preloading master holds no
+        # pool when it forks; each server process starts its own (start_pool)
+        executor.init_pool(0)
+        warm_up(app)
+    # Worker processes for projection jobs; 0 or 1 runs them on the request thread
+    executor.init_pool(os.environ.get('CALC_WORKERS', '0'))
+    return app
+
 if __name__ == '__main__':
     debug = os.environ.get('FLASK_DEBUG', 'false').lower() == 'true'
     host = os.environ.get('FLASK_HOST', '127.0.0.1')
-    app.run(debug=debug, host=host, port=5005)
+    app = create_app()
+    executor.start_pool()
+    app.run(debug=debug, host=host, port=int(os.environ.get('PORT', '5005')))
@@ -0,0 +1,7 @@
+"""Benchmarks for the projection hot paths; run with python -m benchmarks.run."""
+
+import os
+
+# Benchmark configs are stored in memory, not in configs.db. Set here, before
+# any benchmark module imports the app
+os.environ.setdefault('CONFIG_DB', ':memory:')
@@ -0,0 +1,80 @@
+"""
+Synthetic configs for the benchmark matrix.
+
+Configs are built deterministically from their size parameters, so the same
+case always times the same work.
+"""
+
+import random
+
+from planner.engine import CURRENT_YEAR
+
+INVEST_TYPES = ('401k', 'IRA', 'Roth IRA', 'Taxable', 'Savings')
+LIFE_EXPECTANCY = 95
+
+
+def synthetic_config(accounts=5, horizon=50, ages=5, events=10, properties=1, seed=0):
+    """Config with `accounts` investable accounts, `horizon` projected years,
+    `ages` retirement ages, `events` one-time events and `properties` Real
+    Estate accounts"""
+    rng = random.Random(seed)
+    current_age = LIFE_EXPECTANCY - horizon + 1
+
+    config_accounts, milestones = [], {}
+    for i in range(accounts):
+        kind = INVEST_TYPES[i % len(INVEST_TYPES)]
+        name = f'{kind} {i + 1}'
+        config_accounts.append({
+            'name': name,
+            'type': kind,
+            'current_balance': rng.randrange(0, 500000, 1000),
+            'annual_contribution': rng.randrange(0, 20000, 500),
+            'employer_match': 5 if kind == '401k' else 0,
+            'contribution_limit': 23000,
+        })
+        expected = rng.uniform(4.0, 10.0)
+        milestones[name] = [
+            {'years_before': 15, 'expected': expected, 'std_dev': 2.5},
+            {'years_before': 5, 'expected': expected - 2, 'std_dev': 1.5},
+            {'years_before': 0, 'expected': expected - 3, 'std_dev': 1.0},
+        ]
+
+    for i in range(properties):
+        config_accounts.append({
+            'name': f'Property {i + 1}',
+            'type': 'Real Estate',
+            'property_value': rng.randrange(200000, 900000, 10000),
+            'mortgage_balance': rng.randrange(0, 400000, 10000),
+            'mortgage_rate': rng.uniform(3.0, 7.0),
+            'mortgage_payment': rng.randrange(1500, 4000, 100),
+            'property_tax': rng.randrange(2000, 9000, 500),
+            'monthly_rent': rng.randrange(1500, 4000, 100),
+            'appreciation_rate': 3,
+            'real_estate_mode': 'income' if i % 2 == 0 else 'asset',
+            'exclude_from_portfolio': i % 3 == 2,
+        })
+
+    names = [a['name'] for a in config_accounts]
+    config_events = [
+        {
+            'year': CURRENT_YEAR + rng.randrange(horizon),
+            'description': f'Event {i + 1}',
+            'amount': rng.randrange(-30000, 50000, 1000),
+            'account': rng.choice(names) if names else 'None',
+        }
+        for i in range(events)
+    ]
+
+    return {
+        'current_age': current_age,
+        'life_expectancy': LIFE_EXPECTANCY,
+        'ss_start_age': 67,
+        'ss_annual': 30000,
+        'salary': 120000,
+        'inflation_rate': 2.5,
+        'target_retirement_income': 0,
+        'retirement_ages': [current_age + (i + 1) * horizon // (ages + 1) for i in range(ages)],
+        'accounts': config_accounts,
+        'milestones': milestones,
+        'events': config_events,
+    }
@@ -0,0 +1,217 @@
+"""
+Load test for /api/calculate over HTTP.
+
+    python -m benchmarks.loadtest --url http://127.0.0.1:5005
+    python -m benchmarks.loadtest --compare      # development server, then gunicorn
+
+Each of --clients threads holds its own session and keep-alive connection
+and posts /api/calculate back to back for --duration seconds. With
+--configs N the clients first save one of N variants of the default config,
+so the server holds N configs rather than one. Reports requests per second,
+latency percentiles and the latency of the very first calculation, which
+a server that warms up before taking requests has cached.
+
+--compare starts `python app.py` (the Flask development server) and then
+gunicorn with gunicorn.conf.py on a free local port, loads each the same
+way and prints both. Both share a temporary config database. The servers
+must run without authentication.
+"""
+
+import argparse
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVERS = {
+    'dev': [sys.executable, 'app.py'],
+    'gunicorn': [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py'],
+}
+
+
+class Client:
+    """One session on one keep-alive connection"""
+
+    def __init__(self, url, timeout=60):
+        parsed = urlparse(url)
+        self.conn = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=timeout)
+        self.cookie = None
+
+    def request(self, method, path, body=None):
+        """(status, body bytes); keeps the session cookie the server sets"""
+        headers = {'Content-Type': 'application/json'}
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+        self.conn.request(method, path, body=None if body is None else json.dumps(body),
+                          headers=headers)
+        response = self.conn.getresponse()
+        data = response.read()
+        cookie = response.getheader('Set-Cookie')
+        if cookie:
+            self.cookie = cookie.split(';', 1)[0]
+        return response.status, data
+
+    def close(self):
+        self.conn.close()
+
+
+def variant(config, i):
+    """The default config with its salary nudged, distinct per i"""
+    return {**config, 'salary': config['salary'] + 1000 * i}
+
+
+def run_load(url, clients=8, duration=10.0, configs=1):
+    """Load url with clients sessions for duration seconds; see summarize()"""
+    setup = Client(url)
+    status, data = setup.request('GET', '/api/config')
+    if status != 200:
+        raise RuntimeError(f'GET /api/config returned {status}; is authentication enabled?')
+    default = json.loads(data)
+    # A fresh server's first calculation, which a warmed-up one has cached
+    began = time.perf_counter()
+    setup.request('POST', '/api/calculate', {})
+    first = time.perf_counter() - began
+    setup.close()
+
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    # Start the clock once every client has its session
+    deadline = [0.0]
+    start = threading.Barrier(
+        clients + 1, action=lambda: deadline.__setitem__(0, time.perf_counter() + duration))
+
+    def client(i):
+        session = Client(url)
+        try:
+            if configs > 1:
+                session.request('POST', '/api/config', variant(default, i % configs))
+            start.wait()
+            times, failed = [], 0
+            while time.perf_counter() < deadline[0]:
+                began = time.perf_counter()
+                try:
+                    status, _ = session.request('POST', '/api/calculate', {})
+                except (OSError, http.client.HTTPException):
+                    status = None
+                    session.close()
+                    session = Client(url)
+                times.append(time.perf_counter() - began)
+                failed += status != 200
+            with lock:
+                latencies.extend(times)
+                errors[0] += failed
+        finally:
+            session.close()
+
+    threads = [threading.Thread(target=client, args=(i,), daemon=True) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    start.wait(timeout=60)
+    began = deadline[0] - duration
+    for thread in threads:
+        thread.join()
+    return {**summarize(latencies, time.perf_counter() - began, errors[0]),
+            'first_ms': first * 1000}
+
+
+def summarize(latencies, seconds, errors):
+    """Request count, errors, requests per second and latency percentiles (ms)"""
+    ordered = sorted(latencies)
+
+    def percentile(p):
+        if not ordered:
+            return 0.0
+        return ordered[min(int(p / 100 * len(ordered)), len(ordered) - 1)] * 1000
+
+    return {
+        'requests': len(ordered),
+        'errors': errors,
+        'rps': len(ordered) / seconds if seconds > 0 else 0.0,
+        'p50_ms': percentile(50),
+        'p95_ms': percentile(95),
+        'p99_ms': percentile(99),
+    }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_up(url, timeout=30.0):
+    """Poll url until it answers; raises RuntimeError after timeout seconds"""
+    parsed = urlparse(url)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((parsed.hostname, parsed.port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f'{url} did not come up within {timeout:.0f}s')
+
+
+def start_server(kind, port, env):
+    """Start a local server of kind ('dev' or 'gunicorn') on port"""
+    env = {**os.environ, **env, 'FLASK_HOST': '127.0.0.1', 'PORT': str(port)}
+    for key in ('ADMIN_USER', 'ADMIN_PASS', 'FLASK_DEBUG'):
+        env.pop(key, None)
+    process = subprocess.Popen(SERVERS[kind], cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return process, f'http://127.0.0.1:{port}'
+
+
+def report(name, result):
+    print(f"{name:<10} {result['rps']:9.1f} req/s  p50 {result['p50_ms']:7.1f} ms  "
+          f"p95 {result['p95_ms']:7.1f} ms  p99 {result['p99_ms']:7.1f} ms  "
+          f"({result['requests']} requests, {result['errors']} errors; "
+          f"first {result['first_ms']:.1f} ms)")
+
+
+def compare(clients, duration, configs):
+    """Load the development server and then gunicorn; {kind: summarize()}"""
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {'CONFIG_DB': os.path.join(tmp, 'configs.db'), 'SECRET_KEY': 'loadtest'}
+        for kind in SERVERS:
+            process, url = start_server(kind, free_port(), env)
+            try:
+                wait_until_up(url)
+                results[kind] = run_load(url, clients, duration, configs)
+            finally:
+                process.terminate()
+                process.wait(timeout=30)
+            report(kind, results[kind])
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--url', help='server to load, e.g. http://127.0.0.1:5005')
+    target.add_argument('--compare', action='store_true',
+                        help='start and load the development server, then gunicorn')
+    parser.add_argument('--clients', type=int, default=8, help='concurrent sessions')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds of load per server')
+    parser.add_argument('--configs', type=int, default=1, help='distinct configs across clients')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        results = compare(args.clients, args.duration, args.configs)
+        if results.get('dev', {}).get('rps'):
+            print(f"\ngunicorn / dev: {results['gunicorn']['rps'] / results['dev']['rps']:.2f}x")
+    else:
+        report(args.url, run_load(args.url, args.clients, args.duration, args.configs))
+
+
+if __name__ == '__main__':
+    main()
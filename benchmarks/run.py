@@ -0,0 +1,204 @@
+"""
+Benchmark runner.
+
+    python -m benchmarks.run                # time the matrix, compare with the baseline
+    python -m benchmarks.run --save         # and record the results as the new baseline
+    python -m benchmarks.run --quick -k events
+
+Every case in CASES is a synthetic config; every benchmark in BENCHMARKS is
+timed on each case and reported as the best per-call time over several
+repeats. Results slower than --threshold times their baseline are flagged
+and make the run exit with status 1. Baselines are only comparable on the
+machine that recorded them, so none is committed: the first run on a
+machine reports its timings and suggests --save, which writes
+benchmarks/baseline.json for later runs to compare against.
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from datetime import UTC, datetime
+
+from app import RetirementCalculator, calculate_projections, create_app
+from benchmarks.configs import synthetic_config
+from planner.engine import SCENARIOS, ProjectionEngine
+from planner.store import compile_config
+
+# The app the view and serialization benchmarks run against
+app = create_app()
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+BASE_CASE = {'accounts': 5, 'horizon': 50, 'ages': 5, 'events': 10, 'properties': 1}
+
+# Each axis swept on its own from BASE_CASE, plus everything at its largest
+CASES = {
+    'base': {},
+    'accounts-1': {'accounts': 1},
+    'accounts-25': {'accounts': 25},
+    'accounts-100': {'accounts': 100},
+    'horizon-10': {'horizon': 10},
+    'horizon-80': {'horizon': 80},
+    'ages-1': {'ages': 1},
+    'ages-20': {'ages': 20},
+    'events-0': {'events': 0},
+    'events-100': {'events': 100},
+    'events-500': {'events': 500},
+    'properties-0': {'properties': 0},
+    'properties-10': {'properties': 10},
+    'largest': {'accounts': 100, 'horizon': 80, 'ages': 20, 'events': 500, 'properties': 10},
+}
+
+
+def bench_project_scenario(config):
+    """RetirementCalculator.project_scenario for one retirement age"""
+    calculator = RetirementCalculator(config)
+    retirement_age = config['retirement_ages'][0]
+    return lambda: calculator.project_scenario(retirement_age, 'expected')
+
+
+def bench_engine(config):
+    """Compile a ProjectionEngine and project every retirement age and scenario"""
+    def run():
+        engine = ProjectionEngine(config)
+        for retirement_age in config['retirement_ages']:
+            for scenario in SCENARIOS:
+                engine.project_arrays(retirement_age, scenario)
+    return run
+
+
+def bench_calculate_view(config):
+    """POST /api/calculate through the test client, starting from an empty cache"""
+    client = app.test_client()
+    assert client.post('/api/config', json=config).status_code == 200
+
+    def run():
+        app.extensions['planner'].projection_cache.clear()
+        response = client.post('/api/calculate')
+        assert response.status_code == 200
+    return run
+
+
+def bench_json_serialization(config):
+    """Serialize the default /api/calculate payload"""
+    with app.app_context():
+        found, _ = calculate_projections(compile_config(config))
+    projections = {}
+    for (retirement_age, scenario), projection in found.items():
+        projections.setdefault(retirement_age, {})[scenario] = projection.to_dicts()
+    payload = {'projections': projections,
+               'summary': [projection.summary() for projection in found.values()]}
+    return lambda: app.json.dumps(payload)
+
+
+BENCHMARKS = {
+    'project_scenario': bench_project_scenario,
+    'engine': bench_engine,
+    'calculate_view': bench_calculate_view,
+    'json_serialization': bench_json_serialization,
+}
+
+
+def measure(fn, repeat=5, min_time=0.2):
+    """Best per-call time of fn over `repeat` samples of at least min_time each"""
+    fn()
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        number *= 2
+    samples = [elapsed / number]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - start) / number)
+    return min(samples)
+
+
+def run_matrix(selected=None, repeat=5, min_time=0.2, report=print):
+    """Time every benchmark on every case; {'case:benchmark': seconds}"""
+    results = {}
+    for case, overrides in CASES.items():
+        config = synthetic_config(**{**BASE_CASE, **overrides})
+        for name, build in BENCHMARKS.items():
+            key = f'{case}:{name}'
+            if selected and selected not in key:
+                continue
+            results[key] = measure(build(config), repeat, min_time)
+            report(f'{key:<40} {results[key] * 1000:10.3f} ms')
+    return results
+
+
+def compare(results, baseline, threshold):
+    """(key, seconds, baseline seconds or None, ratio or None, regressed) per result"""
+    rows = []
+    for key, seconds in results.items():
+        previous = baseline.get(key)
+        ratio = seconds / previous if previous else None
+        rows.append((key, seconds, previous, ratio, ratio is not None and ratio > threshold))
+    return rows
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f).get('results', {})
+
+
+def save_baseline(path, results):
+    document = {
+        'created': datetime.now(UTC).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+    with open(path, 'w') as f:
+        json.dump(document, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='baseline JSON file')
+    parser.add_argument('--save', action='store_true', help='write results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='flag results slower than this multiple of the baseline')
+    parser.add_argument('--quick', action='store_true', help='fewer, shorter samples')
+    parser.add_argument('-k', dest='selected', help='only run case:benchmark keys containing this')
+    args = parser.parse_args(argv)
+
+    repeat, min_time = (3, 0.05) if args.quick else (5, 0.2)
+    results = run_matrix(args.selected, repeat, min_time)
+
+    baseline = load_baseline(args.baseline)
+    regressions = []
+    if baseline:
+        print(f'\nCompared with {args.baseline} (threshold {args.threshold:.2f}x):')
+        for key, seconds, previous, ratio, regressed in compare(results, baseline, args.threshold):
+            if ratio is None:
+                print(f'{key:<40} {"new":>10}')
+                continue
+            flag = '  REGRESSION' if regressed else ''
+            print(f'{key:<40} {ratio:9.2f}x{flag}')
+            if regressed:
+                regressions.append(key)
+    else:
+        print(f'\nNo baseline at {args.baseline}; run with --save to record one.')
+
+    if args.save:
+        save_baseline(args.baseline, {**baseline, **results})
+        print(f'Saved {len(results)} results to {args.baseline}')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,61 @@
+"""
+Gunicorn settings for serving the planner in production.
+
+    gunicorn -c gunicorn.conf.py
+
+The app is preloaded: the master builds it with app.create_app(warm=True),
+which also compiles the default config and caches its projections, then
+forks the workers. They share those pages copy-on-write instead of each
+building its own. gc.freeze() just before forking keeps the collector from
+touching (and so copying) the preloaded objects in every worker. A process
+pool cannot cross a fork, so each worker then starts its own CALC_WORKERS
+pool before it takes requests.
+
+Saved configs and background jobs live in CONFIG_DB, which every worker
+opens, so any worker can serve any session. The projection cache and the
+compiled config cache stay per worker. There is one worker per core by
+default, each with a few threads.
+
+Every setting below can be overridden from the environment. SIGHUP
+restarts the workers gracefully, each finishing its requests within
+WEB_GRACEFUL_TIMEOUT; with the app preloaded they come back with the code
+the master loaded, so deploy new code by restarting the master.
+"""
+
+import gc
+import os
+
+from planner import executor
+
+wsgi_app = 'app:create_app(warm=True)'
+preload_app = True
+
+bind = f"{os.environ.get('FLASK_HOST', '127.0.0.1')}:{os.environ.get('PORT', '5005')}"
+
+# Threads overlap requests, and numpy releases the GIL for much of a projection
+workers = int(os.environ.get('WEB_WORKERS', str(os.cpu_count() or 1)))
+threads = int(os.environ.get('WEB_THREADS', '4'))
+worker_class = 'gthread'
+
+keepalive = int(os.environ.get('WEB_KEEPALIVE', '5'))
+timeout = int(os.environ.get('WEB_TIMEOUT', '120'))
+graceful_timeout = int(os.environ.get('WEB_GRACEFUL_TIMEOUT', '30'))
+
+# Recycle workers after this many requests (0 never does); the jitter keeps
+# them from restarting all at once
+max_requests = int(os.environ.get('WEB_MAX_REQUESTS', '0'))
+max_requests_jitter = max_requests // 10
+
+accesslog = os.environ.get('WEB_ACCESS_LOG') or None
+errorlog = '-'
+
+
+def when_ready(server):
+    """Runs in the master after the app is loaded and before any fork"""
+    gc.collect()
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    """Runs in each worker before it takes requests: start its CALC_WORKERS pool"""
+    executor.start_pool()
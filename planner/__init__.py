@@ -0,0 +1,7 @@
+"""
+Retirement Planner - calculation engines shared by the Flask app
+"""
+
+from planner.engine import ProjectionEngine
+
+__all__ = ['ProjectionEngine']
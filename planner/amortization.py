@@ -0,0 +1,105 @@
+"""
+Closed-form mortgage amortization and property schedules.
+
+A mortgage paid monthly follows B[m] = B[m-1] * (1 + r) - P until the last
+payment clears it, so the balance after m payments and the payoff month have
+closed forms. Whole years of payments come from those instead of a
+twelve-step loop per year. A property's value, mortgage and rental income
+depend on nothing but the property, so one schedule per config serves every
+retirement age and scenario.
+"""
+
+import math
+from collections import namedtuple
+
+import numpy as np
+
+# Per-year interest and principal paid and the year-end balance; payoff_month
+# counts months from the start until the balance is cleared (0 when there is
+# no mortgage, None when the payment never covers the interest)
+Amortization = namedtuple('Amortization', 'interest principal balance payoff_month')
+
+# Per-year property value, year-end mortgage balance, equity, mortgage
+# payments and net rental income (zero unless the property is rented out)
+PropertySchedule = namedtuple(
+    'PropertySchedule', 'value mortgage_balance equity payments net_income payoff_month')
+
+
+def balance_after(balance, monthly_rate, payment, months):
+    """Balance left after `months` full payments (scalar or array of months)"""
+    if monthly_rate == 0:
+        return balance - payment * months
+    growth = (1 + monthly_rate) ** months
+    return balance * growth - payment * (growth - 1) / monthly_rate
+
+
+def payoff_month(balance, monthly_rate, payment):
+    """Month in which the final, partial payment clears the balance.
+
+    Assumes payment > monthly_rate * balance, so the balance falls every
+    month. The estimate is nudged so that the balance is still positive
+    after payoff - 1 full payments and not after payoff.
+    """
+    if monthly_rate == 0:
+        months = math.ceil(balance / payment)
+    else:
+        months = math.ceil(math.log(payment / (payment - monthly_rate * balance))
+                           / math.log1p(monthly_rate))
+    months = max(months, 1)
+    while months > 1 and balance_after(balance, monthly_rate, payment, months - 1) <= 0:
+        months -= 1
+    while balance_after(balance, monthly_rate, payment, months) > 0:
+        months += 1
+    return months
+
+
+def amortize(balance, monthly_rate, payment, n_years):
+    """Annual interest, principal and year-end balance of a monthly mortgage.
+
+    Each month interest accrues on the balance and the payment covers it
+    first; the principal part is capped at the balance and never negative.
+    """
+    if balance <= 0:
+        return Amortization(np.zeros(n_years), np.zeros(n_years), np.zeros(n_years), 0)
+    if payment <= monthly_rate * balance:
+        # Principal never moves; only the interest is paid
+        return Amortization(np.full(n_years, 12 * monthly_rate * balance), np.zeros(n_years),
+                            np.full(n_years, float(balance)), None)
+    if payment <= 0:
+        # Only possible with a negative rate: the balance shrinks by itself
+        remaining = balance_after(balance, monthly_rate, 0.0, 12 * np.arange(n_years + 1))
+        principal = remaining[:-1] - remaining[1:]
+        return Amortization(-principal, principal, remaining[1:], None)
+
+    payoff = payoff_month(balance, monthly_rate, payment)
+    months = 12 * np.arange(n_years + 1)
+    remaining = np.where(months < payoff,
+                         balance_after(balance, monthly_rate, payment, np.minimum(months, payoff - 1)),
+                         0.0)
+    principal = remaining[:-1] - remaining[1:]
+
+    full_payments = np.clip(np.minimum(months[1:], payoff - 1) - months[:-1], 0, 12)
+    final_payment = balance_after(balance, monthly_rate, payment, payoff - 1) * (1 + monthly_rate)
+    pays_off = (months[:-1] < payoff) & (payoff <= months[1:])
+    paid = full_payments * payment + np.where(pays_off, final_payment, 0.0)
+    return Amortization(paid - principal, principal, remaining[1:], payoff)
+
+
+def property_schedule(account, n_years):
+    """Year-by-year schedule of a Real Estate account"""
+    appreciation_rate = account.get('appreciation_rate', 0) / 100.0
+    value = account.get('property_value', 0) * (1 + appreciation_rate) ** np.arange(1, n_years + 1)
+
+    mortgage = amortize(account.get('mortgage_balance', 0),
+                        account.get('mortgage_rate', 0) / 100.0 / 12,
+                        account.get('mortgage_payment', 0), n_years)
+    payments = mortgage.interest + mortgage.principal
+
+    if account.get('real_estate_mode', 'asset') == 'income':
+        net_income = (account.get('monthly_rent', 0) * 12 - payments
+                      - account.get('property_tax', 0))
+    else:
+        net_income = np.zeros(n_years)
+
+    return PropertySchedule(value, mortgage.balance, value - mortgage.balance, payments,
+                            net_income, mortgage.payoff_month)
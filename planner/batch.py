@@ -0,0 +1,161 @@
+"""
+Batch evaluation of many plans.
+
+/api/batch/calculate takes either a list of configs or one base config plus a
+list of override patches. A patch maps paths such as
+'accounts[0].annual_contribution' or 'milestones.401k[1].expected' to new
+values.
+
+Plans are evaluated in chunks of CHUNK_PLANS on the shared pool. The engines
+in a chunk share one SharedTables. apply_patch copies only the containers
+along each patched path, so a patched config shares every untouched part
+with the base, and that identity is what lets the tables be reused. Configs
+listed separately first have equal milestones, events and property accounts
+interned to a single object. Each retirement age runs all its scenarios as
+one batched simulation. Only summaries come back unless projections are
+asked for.
+"""
+
+import copy
+import json
+import re
+
+from planner import encoding, executor
+from planner.compiled import SharedTables
+from planner.engine import SCENARIOS
+from planner.store import ConfigError, compile_engine
+
+MAX_PLANS = 5000
+
+# Plans per pool job; small enough to report progress, large enough that the
+# shared tables pay off
+CHUNK_PLANS = 100
+
+FORMATS = ('json', 'columnar')
+
+_PATH = re.compile(r'[^.\[\]]+(?:\.[^.\[\]]+|\[\d+\])*')
+_PART = re.compile(r'\[(\d+)\]|([^.\[\]]+)')
+
+
+class PatchError(ValueError):
+    """An override that cannot be applied to the base config"""
+
+
+def parse_path(path):
+    """'accounts[0].annual_contribution' -> ['accounts', 0, 'annual_contribution']"""
+    if not isinstance(path, str) or not _PATH.fullmatch(path):
+        raise PatchError(f'invalid path {path!r}')
+    return [int(index) if index else key for index, key in _PART.findall(path)]
+
+
+def _child(node, part, path):
+    if isinstance(part, int):
+        if not isinstance(node, list) or not 0 <= part < len(node):
+            raise PatchError(f'{path}: index {part} is out of range')
+    elif not isinstance(node, dict) or part not in node:
+        raise PatchError(f'{path}: no {part!r} to patch')
+    return node[part]
+
+
+def apply_patch(base, patch):
+    """Copy of base with each path in patch set to its value.
+
+    Only the containers along the patched paths are copied; everything else
+    is shared with base, so treat both as read-only. The last part of a path
+    may add a new key but never a list item.
+    """
+    if not isinstance(patch, dict):
+        raise PatchError('each override must map paths to values')
+    config = dict(base)
+    copied = {id(config)}
+    for path, value in patch.items():
+        parts = parse_path(path)
+        node = config
+        for part in parts[:-1]:
+            child = _child(node, part, path)
+            if not isinstance(child, (dict, list)):
+                raise PatchError(f'{path}: {part!r} is not an object or list')
+            if id(child) not in copied:
+                child = copy.copy(child)
+                copied.add(id(child))
+                node[part] = child
+            node = child
+        last = parts[-1]
+        if isinstance(last, int) or not isinstance(node, dict):
+            _child(node, last, path)
+        node[last] = value
+    return config
+
+
+def intern_shared(configs):
+    """Shallow copies of configs in which equal milestones, events and
+    property accounts are one shared object"""
+    seen = {}
+
+    def intern(kind, value):
+        return seen.setdefault((kind, json.dumps(value, sort_keys=True)), value)
+
+    interned = []
+    for config in configs:
+        if isinstance(config, dict):
+            config = dict(config)
+            for key in ('milestones', 'events'):
+                if key in config:
+                    config[key] = intern(key, config[key])
+            if isinstance(config.get('accounts'), list):
+                config['accounts'] = [
+                    intern('property', account)
+                    if isinstance(account, dict) and account.get('type') == 'Real Estate'
+                    else account
+                    for account in config['accounts']
+                ]
+        interned.append(config)
+    return interned
+
+
+def evaluate(config, tables, projections=False, output='json'):
+    """Summary rows (and optionally projections) of one plan"""
+    engine = compile_engine(config, tables)
+    found = [projection for retirement_age in config['retirement_ages']
+             for projection in engine.project_scenarios(retirement_age, SCENARIOS)]
+    summary = [projection.summary() for projection in found]
+    if not projections:
+        return {'summary': summary}
+    if output == 'columnar':
+        return encoding.columnar(engine, found, summary)
+    nested = {}
+    for projection in found:
+        nested.setdefault(projection.retirement_age, {})[projection.scenario] = \
+            projection.to_dicts()
+    return {'projections': nested, 'summary': summary}
+
+
+def evaluate_chunk(base, plans, projections, output):
+    """Worker entry point: evaluate plans with one set of shared tables.
+
+    With a base config the plans are override patches, otherwise configs.
+    A plan that fails validation gets an error entry instead of a result.
+    """
+    tables = SharedTables()
+    if base is None:
+        plans = intern_shared(plans)
+    results = []
+    for plan in plans:
+        try:
+            config = apply_patch(base, plan) if base is not None else plan
+            results.append(evaluate(config, tables, projections, output))
+        except (ConfigError, PatchError) as exc:
+            results.append({'error': str(exc)})
+    return results
+
+
+def run_batch(plans, base=None, projections=False, output='json', progress=None):
+    """Results for every plan, in order, each tagged with its index.
+
+    progress(done, total) is called per chunk of plans.
+    """
+    chunks = [plans[start:start + CHUNK_PLANS] for start in range(0, len(plans), CHUNK_PLANS)]
+    results = executor.run_jobs(
+        evaluate_chunk, [(base, chunk, projections, output) for chunk in chunks], progress)
+    flat = (result for chunk in results for result in chunk)
+    return [{'index': i, **result} for i, result in enumerate(flat)]
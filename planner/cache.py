@@ -0,0 +1,101 @@
+"""
+Result cache for projections.
+
+Results are keyed on a stable hash of the normalized config, so the same plan
+posted twice (or with keys in a different order, or with float noise from the
+browser) is only projected once. Entries live in a bounded in-process LRU
+with a TTL.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+# Significant digits kept when normalizing floats for hashing
+FLOAT_DIGITS = 12
+
+
+def canonical(value):
+    """Normalize a JSON-like value so equivalent configs compare equal.
+
+    Floats are rounded to FLOAT_DIGITS significant digits and integral floats
+    become ints (65.0 and 65 hash the same); dict keys are sorted on dump.
+    """
+    if isinstance(value, dict):
+        return {str(key): canonical(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [canonical(item) for item in value]
+    if isinstance(value, float):
+        rounded = float(f'{value:.{FLOAT_DIGITS}g}')
+        return int(rounded) if rounded.is_integer() else rounded
+    return value
+
+
+def config_hash(config):
+    """Stable hex digest of a config"""
+    payload = json.dumps(canonical(config), sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class LRUCache:
+    """Thread-safe LRU with a maximum entry count and a time-to-live.
+
+    Cached values are shared between callers and must be treated as
+    read-only.
+    """
+
+    def __init__(self, maxsize=256, ttl=3600.0, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.clock() - entry[0] > self.ttl:
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (self.clock(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
@@ -0,0 +1,121 @@
+"""
+Config metadata compiled once per request.
+
+The projection loop needs the same lookups every year: which events fall in
+this year, which accounts are real estate or excluded from the total, and
+which accounts can be drawn from at this age. CompiledConfig answers them
+from indexes built in one pass over the config, so a config with thousands
+of events costs O(events) overall rather than O(events) per year.
+"""
+
+from collections import defaultdict
+
+import numpy as np
+
+from planner.amortization import property_schedule
+from planner.milestones import MilestoneTable
+
+# Account types that can be drawn from before 59.5 and before Social Security
+EARLY_ACCESS_TYPES = ('Taxable', 'Savings', 'Roth IRA')
+PRE_SS_ACCESS_TYPES = ('Taxable', 'Savings', '401k', 'IRA', 'Roth IRA')
+
+# Access phases, in age order
+EARLY, PRE_SS, FULL = range(3)
+
+
+def access_phase(age, ss_start_age):
+    """EARLY before 59.5, PRE_SS before Social Security starts, FULL after"""
+    if age < 59.5:
+        return EARLY
+    if age < ss_start_age:
+        return PRE_SS
+    return FULL
+
+
+class CompiledConfig:
+    """Indexes over a config's accounts and events.
+
+    Accounts get integer ids in config order. Investable accounts (every
+    type but Real Estate) get their own ids, which is the column order of
+    the engine's arrays.
+    """
+
+    def __init__(self, config):
+        accounts = config['accounts']
+        self.names = [a['name'] for a in accounts]
+        self.ids = {name: i for i, name in enumerate(self.names)}
+        self.types = [a['type'] for a in accounts]
+
+        self.invest_names = [a['name'] for a in accounts if a['type'] != 'Real Estate']
+        self.invest_ids = {name: j for j, name in enumerate(self.invest_names)}
+        self.re_names = frozenset(a['name'] for a in accounts if a['type'] == 'Real Estate')
+        self.excluded_names = frozenset(
+            a['name'] for a in accounts
+            if a['type'] == 'Real Estate' and a.get('exclude_from_portfolio'))
+
+        # Investable accounts reachable in each phase, by name and as 0/1 masks
+        invest_types = [a['type'] for a in accounts if a['type'] != 'Real Estate']
+        self.phase_names = (
+            tuple(n for n, t in zip(self.invest_names, invest_types) if t in EARLY_ACCESS_TYPES),
+            tuple(n for n, t in zip(self.invest_names, invest_types) if t in PRE_SS_ACCESS_TYPES),
+            tuple(self.invest_names),
+        )
+        self.phase_masks = np.array([
+            [name in names for name in self.invest_names] for names in self.phase_names
+        ], dtype=float).reshape(3, len(self.invest_names))
+
+        self.events_by_year = defaultdict(list)
+        self.events_by_account = defaultdict(list)
+        for event in config['events']:
+            self.events_by_year[event['year']].append(event)
+            self.events_by_account[event['account']].append(event)
+        # After this year no event touches an investable account
+        self.last_invest_event_year = max(
+            (event['year'] for name in self.invest_names
+             for event in self.events_by_account.get(name, ())), default=None)
+
+    def events_in(self, year):
+        """Events in a year, in config order"""
+        return self.events_by_year.get(year, [])
+
+    def accessible_names(self, age, ss_start_age):
+        """Investable accounts that can be drawn from at age"""
+        return self.phase_names[access_phase(age, ss_start_age)]
+
+
+class SharedTables:
+    """Compiled tables shared between the engines of related configs.
+
+    Configs made by patching one base config keep every part the patch did
+    not touch as the very same object. Tables are therefore memoized on the
+    identity of their inputs, which costs nothing to check. Each entry holds
+    on to its inputs, so an id cannot be reused while the entry is alive.
+    Configs are treated as read-only once compiled.
+    """
+
+    def __init__(self):
+        self._entries = {}
+
+    def _memo(self, key, inputs, build):
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = (inputs, build())
+        return entry[1]
+
+    def milestone_table(self, milestones, account_names):
+        key = ('milestones', id(milestones), tuple(account_names))
+        return self._memo(key, milestones, lambda: MilestoneTable(milestones, account_names))
+
+    def compiled_config(self, config):
+        # CompiledConfig reads account names, types and exclusions, and the events
+        accounts = tuple((a['name'], a['type'], bool(a.get('exclude_from_portfolio')))
+                         for a in config['accounts'])
+        key = ('compiled', id(config['events']), accounts)
+        return self._memo(key, config['events'], lambda: CompiledConfig(config))
+
+    def property_schedule(self, account, n_years):
+        key = ('property', id(account), n_years)
+        return self._memo(key, account, lambda: property_schedule(account, n_years))
+
+    def __len__(self):
+        return len(self._entries)
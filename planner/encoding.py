@@ -0,0 +1,121 @@
+"""
+Compact encodings of /api/calculate results.
+
+The default response repeats a dict per year with every account name as a
+key. The columnar encoding sends one array per field per projection and
+lists the account names, years and ages once. The binary encoding packs
+the same columns into one little-endian buffer:
+
+    uint32 header length | JSON header, space-padded | float columns
+
+The padding puts the columns on an 8-byte boundary, so a browser can wrap
+each one in a Float64Array/Float32Array view without copying. Each
+projection is one (rows x years) block; header['layout'] maps a field to
+its [first row, row count] (one row for the header['series'] totals) and
+header['projections'] gives every block's byte offset from the start of
+the columns.
+"""
+
+import json
+import struct
+
+import numpy as np
+
+FORMATS = ('json', 'columnar', 'binary')
+DTYPES = ('float64', 'float32')
+
+# Per-year totals; the remaining fields have a row per account
+SERIES = ('total_portfolio', 'withdrawal', 'ss_income', 'real_estate_income', 'taxes',
+          'total_income')
+
+
+def columns(projection):
+    """Field name -> years-long vector or (accounts x years) matrix"""
+    engine = projection.engine
+    contributions, employer_match = engine.contributions(projection.retirement_age)
+    return {
+        'total_portfolio': projection.total_portfolio,
+        'withdrawal': projection.run.total_withdrawal[0],
+        'ss_income': engine.ss_schedule(projection.retirement_age),
+        'real_estate_income': engine.real_estate_income,
+        'taxes': projection.run.taxes[0],
+        'total_income': projection.total_income,
+        'balances': projection.balances,
+        'withdrawal_by_account': (projection.run.withdrawals[0] * projection.drawn_from()).T,
+        'contributions': contributions.T,
+        'employer_match': employer_match[:, engine.has_match].T,
+    }
+
+
+def metadata(engine):
+    """What every projection shares: account names, years, ages and events"""
+    return {
+        'years': (engine.current_year + np.arange(engine.n_years)).tolist(),
+        'ages': engine.ages.tolist(),
+        'accounts': engine.account_names,
+        'invest_accounts': engine.invest_names,
+        'match_accounts': [engine.invest_names[i] for i in np.flatnonzero(engine.has_match)],
+        'events': engine.event_descriptions,
+    }
+
+
+def columnar(engine, projections, summary):
+    """JSON-ready results with one array per field per (retirement_age, scenario)"""
+    nested = {}
+    for projection in projections:
+        fields = {name: values.tolist() for name, values in columns(projection).items()}
+        nested.setdefault(projection.retirement_age, {})[projection.scenario] = fields
+    return {'format': 'columnar', **metadata(engine), 'projections': nested, 'summary': summary}
+
+
+def layout(engine):
+    """Field name -> [first row, row count] within a projection's block"""
+    counts = dict.fromkeys(SERIES, 1)
+    counts['balances'] = len(engine.account_names)
+    counts['withdrawal_by_account'] = len(engine.invest_names)
+    counts['contributions'] = len(engine.invest_names)
+    counts['employer_match'] = int(engine.has_match.sum())
+    rows, start = {}, 0
+    for name, count in counts.items():
+        rows[name] = [start, count]
+        start += count
+    return rows
+
+
+def pack(engine, projections, summary, dtype='float64'):
+    """Binary results: see the module docstring for the layout"""
+    fields = layout(engine)
+    n_rows = sum(count for _, count in fields.values())
+    little_endian = np.dtype(dtype).newbyteorder('<')
+    blocks = np.zeros((len(projections), n_rows, engine.n_years), dtype=little_endian)
+    for block, projection in zip(blocks, projections):
+        for name, values in columns(projection).items():
+            start, count = fields[name]
+            block[start:start + count] = values
+
+    block_bytes = n_rows * engine.n_years * blocks.itemsize
+    header = {
+        'format': 'binary',
+        'dtype': dtype,
+        **metadata(engine),
+        'series': list(SERIES),
+        'layout': fields,
+        'projections': [
+            {'retirement_age': p.retirement_age, 'scenario': p.scenario, 'offset': i * block_bytes}
+            for i, p in enumerate(projections)
+        ],
+        'summary': summary,
+    }
+    encoded = json.dumps(header, separators=(',', ':')).encode()
+    encoded += b' ' * (-(4 + len(encoded)) % 8)
+    return struct.pack('<I', len(encoded)) + encoded + blocks.tobytes()
+
+
+def unpack(payload):
+    """Decode pack() output into (header, blocks); blocks[i] is projection i's rows"""
+    (length,) = struct.unpack_from('<I', payload)
+    header = json.loads(payload[4:4 + length])
+    little_endian = np.dtype(header['dtype']).newbyteorder('<')
+    data = np.frombuffer(payload, dtype=little_endian, offset=4 + length)
+    n_rows = sum(count for _, count in header['layout'].values())
+    return header, data.reshape(len(header['projections']), n_rows, len(header['years']))
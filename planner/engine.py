@@ -0,0 +1,864 @@
+"""
+Vectorized projection engine.
+
+Runs the same year-by-year model as RetirementCalculator.project_scenario, but
+keeps balances in an (accounts x years) array. Everything that does not depend
+on the withdrawal path (returns, contributions, employer match, events,
+inflation factors, Social Security, real estate) is precomputed as vectors, so
+the only per-year work left is the withdrawal step once retired.
+"""
+
+from collections import namedtuple
+from collections.abc import Mapping, Sequence
+
+import numpy as np
+
+from planner import metrics
+from planner.amortization import property_schedule
+from planner.compiled import EARLY, FULL, PRE_SS, CompiledConfig, access_phase
+
+# SCENARIOS is re-exported for callers that iterate the fixed scenarios
+from planner.milestones import SCENARIO_SHIFTS, SCENARIOS, MilestoneTable
+from planner.monthly import MONTHS, compile_monthly
+from planner.taxes import compile_taxes
+from planner.withdrawals import (
+    Constant,
+    Proportional,
+    Retired,
+    Withdrawals,
+    compile_withdrawals,
+)
+
+CURRENT_YEAR = 2025
+
+# Config keys a projection reads; everything else (retirement_ages, UI
+# state) is left out of the copy shipped to worker processes
+ENGINE_KEYS = (
+    'current_age', 'life_expectancy', 'ss_start_age', 'ss_annual', 'salary',
+    'inflation_rate', 'target_retirement_income', 'accounts', 'milestones', 'events',
+    'withdrawal_strategy', 'taxes', 'time_step', 'retirement_month',
+)
+
+# Output of simulate(): balances and withdrawals are (paths x years x
+# accounts); total_withdrawal, requested (the withdrawal the plan asked for
+# after Social Security, grossed up for tax) and taxes are (paths x years);
+# initial_withdrawal is per path
+Simulation = namedtuple(
+    'Simulation', 'balances withdrawals total_withdrawal requested initial_withdrawal taxes')
+
+# Withdrawals of a config without a withdrawal_strategy
+DEFAULT_WITHDRAWALS = Withdrawals(Constant(), Proportional())
+
+
+def compact_config(config):
+    """Picklable subset of a config holding just what the engine reads"""
+    return {key: config[key] for key in ENGINE_KEYS if key in config}
+
+
+def accumulate(balances, growth, inflows):
+    """Working years: b[t] = b[t-1] * g[t] + k[t] for each path and account.
+
+    There is no coupling between accounts before retirement, so the whole
+    stretch is solved at once from cumulative growth factors.
+    """
+    shape = (len(balances), growth.shape[1], balances.shape[1])
+    g = np.broadcast_to(growth, shape)
+    k = np.broadcast_to(inflows, shape)
+    cumulative = np.cumprod(g, axis=1)
+    if np.all(cumulative != 0):
+        return cumulative * (balances[:, None, :] + np.cumsum(k / cumulative, axis=1))
+
+    history = np.empty(shape)
+    b = balances
+    for t in range(shape[1]):
+        b = b * g[:, t] + k[:, t]
+        history[:, t] = b
+    return history
+
+
+def simulate(balances, growth, inflows, retire_index, access, ss_income,
+             target_income, inflation_rate, start=0, initial_withdrawal=None, strategy=None,
+             taxes=None):
+    """Run the projection loop for a batch of paths.
+
+    balances is the (paths x accounts) starting point. growth (1 + return) and
+    inflows (contributions, match, their half-year return and events) are
+    (paths x years x accounts) or broadcastable to it. access is a
+    (years x accounts) 0/1 mask of withdrawable accounts and ss_income the
+    per-year Social Security income once retired. access may also be given
+    per path as (paths x years x accounts), ss_income as (paths x years) and
+    target_income and inflation_rate as per-path vectors.
+
+    With start > 0 the run resumes from balances at the end of year
+    start - 1; initial_withdrawal must then be given if retirement came
+    before start. Years before start are left at zero. strategy is the
+    config's planner.withdrawals.Withdrawals and taxes its
+    planner.taxes.TaxTable. A dynamic strategy or taxes step through the
+    retired years (see _withdraw_each_year) and cannot resume after
+    retirement.
+    Returns a Simulation.
+    """
+    n_paths, n_accounts = balances.shape
+    n_years = access.shape[-2]
+    if metrics.counting:
+        metrics.engine_path_years.inc(n_paths * (n_years - start))
+        metrics.engine_account_years.inc(n_paths * (n_years - start) * n_accounts)
+    access = access if access.ndim == 3 else access[None]
+    history = np.zeros((n_paths, n_years, n_accounts))
+    withdrawals = np.zeros((n_paths, n_years, n_accounts))
+    total_withdrawal = np.zeros((n_paths, n_years))
+    requested = np.zeros((n_paths, n_years))
+    paid = np.zeros((n_paths, n_years))
+
+    n_working = min(max(retire_index, start), n_years)
+    if n_working > start:
+        history[:, start:n_working] = accumulate(
+            balances, growth[:, start:n_working], inflows[:, start:n_working])
+        balances = history[:, n_working - 1]
+
+    if n_working == n_years:
+        return Simulation(history, withdrawals, total_withdrawal, requested,
+                          np.zeros(n_paths), paid)
+
+    # Retired years: set the initial withdrawal from the first retired year
+    pre = balances * growth[:, n_working] + inflows[:, n_working]
+    if retire_index == n_working and np.ndim(target_income):
+        initial_withdrawal = np.where(target_income > 0, target_income, pre.sum(axis=1) * 0.04)
+    elif retire_index == n_working and target_income <= 0:
+        initial_withdrawal = pre.sum(axis=1) * 0.04
+    elif retire_index == n_working:
+        initial_withdrawal = np.full(n_paths, float(target_income))
+    elif retire_index < 0 or initial_withdrawal is None:
+        # Retirement age is before the first projected year: never set
+        initial_withdrawal = np.zeros(n_paths)
+
+    strategy = strategy if strategy is not None else DEFAULT_WITHDRAWALS
+    if strategy.dynamic or taxes is not None:
+        if n_working > max(retire_index, 0):
+            raise ValueError('withdrawals stepped year by year cannot resume after retirement')
+        run = Simulation(history, withdrawals, total_withdrawal, requested, initial_withdrawal, paid)
+        _withdraw_each_year(strategy, taxes, run, balances, growth, inflows, n_working,
+                            retire_index, access, ss_income, inflation_rate)
+        return run
+
+    years_retired = np.arange(n_years) - retire_index
+    inflation_rate = np.reshape(inflation_rate, (-1, 1))
+    desired = initial_withdrawal[:, None] * (1 + inflation_rate) ** years_retired[n_working:]
+    shortfall = np.maximum(desired - ss_income[..., n_working:], 0)
+    requested[:, n_working:] = shortfall
+
+    # The proportional draw only has to restart when something other than
+    # growth moves the balances: an event, a change of access phase, or a
+    # non-positive growth factor that could flip a balance's sign
+    restart = np.any(inflows != 0, axis=(0, 2)) | np.any(growth <= 0, axis=(0, 2))
+    restart[1:] |= np.any(access[:, 1:] != access[:, :-1], axis=(0, 2))
+    starts = [n_working] + [t for t in np.flatnonzero(restart) if t > n_working]
+
+    for first, end in zip(starts, starts[1:] + [n_years]):
+        if first > n_working:
+            pre = history[:, first - 1] * growth[:, first] + inflows[:, first]
+        post, drawn, amount = _draw_proportionally(
+            pre, growth[:, first + 1:end], access[:, first],
+            shortfall[:, first - n_working:end - n_working])
+        history[:, first:end] = post
+        withdrawals[:, first:end] = drawn
+        total_withdrawal[:, first:end] = amount
+
+    return Simulation(history, withdrawals, total_withdrawal, requested, initial_withdrawal, paid)
+
+
+def _withdraw_each_year(strategy, taxes, out, balances, growth, inflows, n_working,
+                        retire_index, access, ss_income, inflation_rate):
+    """Retired years of simulate() for a dynamic withdrawal strategy or with taxes.
+
+    The amount depends on each path's balance, so the years are stepped one
+    at a time, every path and account at once. out is the Simulation to
+    fill in from year n_working on; balances are the (paths x accounts)
+    balances going into that year.
+    """
+    history, drawn_out, total_withdrawal, requested, initial, paid = out
+    n_years = history.shape[1]
+    inflation_rate = np.asarray(inflation_rate, dtype=float)
+    initial_invested = np.zeros(len(initial))
+    previous = initial
+    for t in range(n_working, n_years):
+        grown = balances * growth[:, t]
+        pre = grown + inflows[:, t]
+        invested = pre.sum(axis=1)
+        if t == retire_index:
+            initial_invested = invested
+        before = balances.sum(axis=1)
+        portfolio_growth = np.divide(grown.sum(axis=1), before, out=np.ones_like(before),
+                                     where=before > 0)
+        retired = Retired(initial, initial_invested, previous, invested, portfolio_growth,
+                          t - retire_index, n_years - t)
+        desired = strategy.strategy.amount(retired, inflation_rate)
+        shortfall = np.maximum(desired - ss_income[..., t], 0)
+
+        mask = access[:, t]
+        if taxes is None:
+            amount = np.minimum(shortfall, (pre * mask).sum(axis=1))
+            drawn = strategy.order.draw(pre, mask, amount)
+            requested[:, t] = shortfall
+        else:
+            amount, drawn, paid[:, t], requested[:, t] = taxes.gross_up(
+                t, pre, mask, shortfall, ss_income[..., t], (1 + inflation_rate) ** t,
+                strategy.order)
+        balances = pre - drawn
+        history[:, t] = balances
+        drawn_out[:, t] = drawn
+        total_withdrawal[:, t] = amount
+        previous = desired
+
+
+def simulate_monthly(grid, balances, rates, paid_in, events, retire_index, access, ss_income,
+                     target_income, inflation_rate):
+    """simulate() on the monthly time step of grid, a planner.monthly.MonthlyGrid.
+
+    rates are (paths x years x accounts) and events (years x accounts).
+    paid_in and ss_income are the per-year totals of
+    ProjectionEngine.contributions() and ss_schedule(), spread evenly over
+    each year's working and retired months. target_income is per year.
+    The result is per year, like simulate()'s.
+    """
+    n_paths, n_accounts = balances.shape
+    n_years = access.shape[-2]
+    if metrics.counting:
+        metrics.engine_path_years.inc(n_paths * n_years)
+        metrics.engine_account_years.inc(n_paths * n_years * n_accounts)
+    access = access if access.ndim == 3 else access[None]
+    history = np.zeros((n_paths, n_years, n_accounts))
+    withdrawals = np.zeros((n_paths, n_years, n_accounts))
+    total_withdrawal = np.zeros((n_paths, n_years))
+    requested = np.zeros((n_paths, n_years))
+    initial_withdrawal = np.zeros(n_paths)
+
+    month_growth, log_growth = grid.compound(rates)
+    working_months = grid.working_months(retire_index, n_years).tolist()
+    n_working = min(max(retire_index, 0), n_years)
+    if n_working:
+        working = slice(0, n_working)
+        history[:, working] = accumulate(
+            balances, np.maximum(1 + rates[:, working], 0),
+            paid_in[..., working, :] / MONTHS
+            * grid.paid_in_factor(rates[:, working], log_growth[:, working], MONTHS)
+            + events[working])
+        balances = history[:, n_working - 1]
+
+    target_income = np.asarray(target_income, dtype=float)
+    inflation = 1 + np.reshape(inflation_rate, (-1, 1))
+    ss_income = np.asarray(ss_income, dtype=float)
+    first_retired = MONTHS * retire_index + grid.retirement_month - 1
+    for t in range(n_working, n_years):
+        g, worked = month_growth[:, t], working_months[t]
+        if worked:
+            balances = balances * g ** worked + paid_in[..., t, :] / worked * grid.paid_in_factor(
+                rates[:, t], log_growth[:, t], worked)
+        # Balances before each retired month's draw, had nothing been drawn
+        n_months = MONTHS - worked
+        grown = balances[:, None, :] * np.cumprod(
+            np.broadcast_to(g[:, None, :], (n_paths, n_months, n_accounts)), axis=1)
+        if t == retire_index:
+            initial_withdrawal = np.where(target_income > 0, target_income,
+                                          grown[:, 0].sum(axis=1) * 0.04)
+
+        months_retired = MONTHS * t + worked + np.arange(n_months) - first_retired
+        desired = initial_withdrawal[:, None] / MONTHS * inflation ** (months_retired / MONTHS)
+        shortfall = np.maximum(desired - np.reshape(ss_income[..., t], (-1, 1)) / n_months, 0)
+
+        mask = np.broadcast_to(access[:, t], (n_paths, n_accounts))
+        drawable = mask * (grown[:, 0] > 0)
+        drawable_total = np.matmul(grown, drawable[:, :, None])[..., 0]
+        fixed_total = np.matmul(grown, (mask - drawable)[:, :, None])[..., 0]
+        scale, share, amount = _scale_recurrence(drawable_total, fixed_total, shortfall)
+
+        drawn = np.matmul((scale * share)[:, None, :], grown)[:, 0] * drawable
+        kept = np.where(drawable > 0, (scale[:, -1] * (1 - share[:, -1]))[:, None], 1.0)
+        balances = grown[:, -1] * kept + events[t]
+        history[:, t] = balances
+        withdrawals[:, t] = drawn
+        total_withdrawal[:, t] = amount.sum(axis=1)
+        requested[:, t] = shortfall.sum(axis=1)
+
+    return Simulation(history, withdrawals, total_withdrawal, requested, initial_withdrawal,
+                      np.zeros((n_paths, n_years)))
+
+
+def _draw_proportionally(pre, growth, mask, shortfall):
+    """Withdraw proportionally from accessible accounts over a run of years.
+
+    pre is the (paths x accounts) balance going into the first year's
+    withdrawal and growth the factors for the remaining years. Every drawable
+    account loses the same share each year, so its balance is scale * Y where
+    Y is the balance grown with no withdrawals at all. That leaves a single
+    scalar recurrence per path instead of a per-account loop.
+    """
+    n_paths = pre.shape[0]
+    grown = np.empty((n_paths, shortfall.shape[1], pre.shape[1]))
+    grown[:, 0] = pre
+    if growth.shape[1]:
+        grown[:, 1:] = pre[:, None, :] * np.cumprod(
+            np.broadcast_to(growth, (n_paths,) + growth.shape[1:]), axis=1)
+
+    # Accessible accounts at or below zero count toward the accessible total
+    # but are never drawn from
+    drawable = mask * (pre > 0)
+    drawable_total = np.matmul(grown, drawable[:, :, None])[..., 0]
+    fixed_total = np.matmul(grown, (mask - drawable)[:, :, None])[..., 0]
+
+    scale, share, amount = _scale_recurrence(drawable_total, fixed_total, shortfall)
+    # Drawable balances end the year at scale * (1 - share) of grown and
+    # give up scale * share of it; the rest keep grown as it is
+    kept = np.where(drawable[:, None, :] > 0, (scale * (1 - share))[:, :, None], 1.0)
+    drawn = (scale * share)[:, :, None] * drawable[:, None, :]
+    return np.multiply(grown, kept, out=kept), np.multiply(grown, drawn, out=drawn), amount
+
+
+def _scale_recurrence(drawable_total, fixed_total, shortfall):
+    """Sequential part of the proportional draw: (scale, share, amount) per year.
+
+    scale is the factor applied to drawable balances going into each year,
+    share the fraction of them withdrawn that year and amount the withdrawal.
+
+    A year that takes everything drawable leaves scale at exactly zero, and
+    it stays there: a depleted path only has its fixed accounts left, which
+    do not depend on the recurrence. Once every path of a batch is depleted
+    the loop stops and the remaining years are filled in at once.
+    """
+    n_paths, n_years = shortfall.shape
+    if n_paths > 4 and not fixed_total.any():
+        return _scale_closed_form(drawable_total, shortfall)
+    if n_paths <= 4:
+        # Plain floats beat numpy's per-call overhead for a handful of paths
+        rows = []
+        for drawable_row, fixed_row, shortfall_row in zip(
+                drawable_total.tolist(), fixed_total.tolist(), shortfall.tolist()):
+            s = 1.0
+            scales, shares, amounts = [], [], []
+            for drawable_sum, fixed_sum, wanted in zip(drawable_row, fixed_row, shortfall_row):
+                accessible = s * drawable_sum + fixed_sum
+                amount = min(wanted, accessible)
+                share = amount / accessible if accessible > 0 else 0.0
+                scales.append(s)
+                shares.append(share)
+                amounts.append(amount)
+                s *= 1 - share
+            rows.append((scales, shares, amounts))
+        scale, share, amount = (np.array(column) for column in zip(*rows))
+        return scale, share, amount
+
+    scale = np.empty((n_paths, n_years))
+    share = np.zeros((n_paths, n_years))
+    amount = np.empty((n_paths, n_years))
+    s = np.ones(n_paths)
+    for j in range(n_years):
+        accessible = s * drawable_total[:, j] + fixed_total[:, j]
+        amount[:, j] = np.minimum(shortfall[:, j], accessible)
+        np.divide(amount[:, j], accessible, out=share[:, j], where=accessible > 0)
+        scale[:, j] = s
+        s = s * (1 - share[:, j])
+        if not s.any():
+            rest = slice(j + 1, None)
+            fixed = fixed_total[:, rest]
+            amount[:, rest] = np.minimum(shortfall[:, rest], fixed)
+            np.divide(amount[:, rest], fixed, out=share[:, rest], where=fixed > 0)
+            scale[:, rest] = 0.0
+            break
+    return scale, share, amount
+
+
+def _scale_closed_form(drawable_total, shortfall):
+    """_scale_recurrence() with nothing accessible at or below zero.
+
+    Each year then takes shortfall / drawable_total off the scale, so the
+    scale is one minus the running sum of those until the year that takes
+    everything, and zero after it.
+    """
+    taken = np.divide(shortfall, drawable_total, out=np.zeros_like(shortfall),
+                      where=drawable_total > 0)
+    scale = np.maximum(1 - (np.cumsum(taken, axis=1) - taken), 0)
+    accessible = scale * drawable_total
+    emptied = (accessible > 0) & (shortfall >= accessible)
+    gone = np.zeros_like(emptied)
+    gone[:, 1:] = np.logical_or.accumulate(emptied, axis=1)[:, :-1]
+    scale[gone] = 0.0
+    accessible[gone] = 0.0
+    amount = np.minimum(shortfall, accessible)
+    share = np.divide(amount, accessible, out=np.zeros_like(amount), where=accessible > 0)
+    return scale, share, amount
+
+
+def summarize(retirement_age, scenario, ages, total_portfolio, total_income):
+    """Headline figures of a projection from its per-year ages, total
+    portfolio and total income"""
+    by_age = dict(zip(ages, total_portfolio))
+    retirement_to_85 = [income for age, income in zip(ages, total_income)
+                        if retirement_age <= age <= 85]
+    avg_income = sum(retirement_to_85) / len(retirement_to_85) if retirement_to_85 else 0
+    # Last age where the portfolio is still above $1000
+    lasts_until = next((age for age, total in zip(reversed(ages), reversed(total_portfolio))
+                        if total > 1000), 'N/A')
+
+    return {
+        'retirement_age': retirement_age,
+        'scenario': scenario,
+        'portfolio_at_retirement': by_age.get(retirement_age, 0),
+        'avg_annual_income': avg_income,
+        'portfolio_at_85': by_age.get(85, 0),
+        'portfolio_lasts_until_age': lasts_until,
+    }
+
+
+class Projection(Sequence):
+    """One retirement age and scenario in array form.
+
+    run is the single-path Simulation it came from, which is also the
+    checkpoint incremental recomputation resumes from. Nothing else is
+    stored: per-year figures are derived from run and the engine's compiled
+    tables when asked for, so a cached projection costs a few arrays rather
+    than a dict per year.
+
+    A Projection is also a read-only sequence of YearView mappings, one per
+    year, that read like RetirementCalculator.project_scenario's dicts.
+    to_dicts() builds those dicts outright for the API boundary.
+    """
+
+    __slots__ = ('engine', 'retirement_age', 'run', 'scenario')
+
+    def __init__(self, engine, retirement_age, scenario, run):
+        self.engine = engine
+        self.retirement_age = retirement_age
+        self.scenario = scenario
+        self.run = run
+
+    def __getstate__(self):
+        # Worker processes send projections back without their engine; the
+        # receiver reattaches its own, compiled from the same config
+        return None, self.retirement_age, self.scenario, self.run
+
+    def __setstate__(self, state):
+        self.engine, self.retirement_age, self.scenario, self.run = state
+
+    def __len__(self):
+        return self.engine.n_years
+
+    def __getitem__(self, t):
+        if not -len(self) <= t < len(self):
+            raise IndexError('year out of range')
+        return YearView(self, t % len(self))
+
+    @property
+    def balances(self):
+        """(accounts x years) balances in config account order"""
+        engine = self.engine
+        balances = np.empty((len(engine.account_names), engine.n_years))
+        balances[engine.invest_rows] = self.run.balances[0].T
+        balances[engine.re_rows] = (engine.re_equity + engine.re_events).T
+        return balances
+
+    @property
+    def total_portfolio(self):
+        return self.engine.total_portfolio(self.run.balances[0])
+
+    @property
+    def total_income(self):
+        """Income after tax"""
+        return (self.run.total_withdrawal[0] + self.engine.ss_schedule(self.retirement_age)
+                + self.engine.real_estate_income - self.run.taxes[0])
+
+    def drawn_from(self):
+        """(years x investable accounts) mask of accounts listed in withdrawal_by_account.
+
+        Those are the accessible accounts with a positive balance going into
+        the withdrawal, in years where there was anything to draw from.
+        """
+        engine = self.engine
+        before = self.run.balances[0] + self.run.withdrawals[0]
+        accessible = (before * engine.access).sum(axis=1)
+        drawn_from = (engine.access > 0) & (before > 0) & (accessible > 0)[:, None]
+        drawn_from[engine.ages < self.retirement_age] = False
+        return drawn_from
+
+    def summary(self):
+        """Headline figures for the /api/calculate summary"""
+        return summarize(self.retirement_age, self.scenario, self.engine.ages.tolist(),
+                         self.total_portfolio.tolist(), self.total_income.tolist())
+
+    def to_dicts(self):
+        """Year-by-year dicts in RetirementCalculator.project_scenario's shape.
+
+        They are built fresh on every call and not kept, so serialize them
+        and let them go.
+        """
+        return self._build_dicts()
+
+    def _build_dicts(self):
+        engine = self.engine
+        names = engine.account_names
+        invest_names = engine.invest_names
+        match_names = [invest_names[i] for i in np.flatnonzero(engine.has_match)]
+        contributions, employer_match = engine.contributions(self.retirement_age)
+        ss_income = engine.ss_schedule(self.retirement_age)
+
+        balances = self.balances.T.tolist()
+        withdrawals = self.run.withdrawals[0].tolist()
+        drawn_from = self.drawn_from().tolist()
+        contributions = contributions.tolist()
+        employer_match = employer_match[:, engine.has_match].tolist()
+        total_portfolio = self.total_portfolio.tolist()
+        total_withdrawal = self.run.total_withdrawal[0].tolist()
+        re_income = engine.real_estate_income.tolist()
+        total_income = self.total_income.tolist()
+        taxes = self.run.taxes[0].tolist()
+        ss_income = ss_income.tolist()
+
+        projections = []
+        for t in range(engine.n_years):
+            age = engine.current_age + t
+            working = age < self.retirement_age
+            projections.append({
+                'year': engine.current_year + t,
+                'age': age,
+                'years_to_retirement': self.retirement_age - age,
+                'balances': dict(zip(names, balances[t])),
+                'total_portfolio': total_portfolio[t],
+                'contributions': dict(zip(invest_names, contributions[t])) if working else {},
+                'employer_match': dict(zip(match_names, employer_match[t])) if working else {},
+                'withdrawal': total_withdrawal[t],
+                'withdrawal_by_account': {
+                    name: amount
+                    for name, amount, drawn in zip(invest_names, withdrawals[t], drawn_from[t])
+                    if drawn
+                },
+                'ss_income': ss_income[t],
+                'real_estate_income': re_income[t],
+                'taxes': taxes[t],
+                'total_income': total_income[t],
+                'events': list(engine.event_descriptions[t]),
+            })
+        return projections
+
+
+class YearView(Mapping):
+    """One year of a Projection, read like a project_scenario dict.
+
+    Values are computed from the projection's arrays on access and equal
+    the matching entry of to_dicts().
+    """
+
+    __slots__ = ('index', 'projection')
+
+    KEYS = (
+        'year', 'age', 'years_to_retirement', 'balances', 'total_portfolio',
+        'contributions', 'employer_match', 'withdrawal', 'withdrawal_by_account',
+        'ss_income', 'real_estate_income', 'taxes', 'total_income', 'events',
+    )
+
+    def __init__(self, projection, index):
+        self.projection = projection
+        self.index = index
+
+    def __iter__(self):
+        return iter(self.KEYS)
+
+    def __len__(self):
+        return len(self.KEYS)
+
+    def __getitem__(self, key):
+        if key not in self.KEYS:
+            raise KeyError(key)
+        projection, t = self.projection, self.index
+        engine = projection.engine
+        age = engine.current_age + t
+        working = age < projection.retirement_age
+        if key == 'year':
+            return engine.current_year + t
+        if key == 'age':
+            return age
+        if key == 'years_to_retirement':
+            return projection.retirement_age - age
+        if key == 'balances':
+            return dict(zip(engine.account_names, projection.balances[:, t].tolist()))
+        if key == 'total_portfolio':
+            return projection.total_portfolio[t].item()
+        if key in ('contributions', 'employer_match'):
+            if not working:
+                return {}
+            contributions, employer_match = engine.contributions(projection.retirement_age)
+            if key == 'contributions':
+                return dict(zip(engine.invest_names, contributions[t].tolist()))
+            return {name: amount for name, amount, matched in zip(
+                engine.invest_names, employer_match[t].tolist(), engine.has_match) if matched}
+        if key == 'withdrawal':
+            return projection.run.total_withdrawal[0, t].item()
+        if key == 'withdrawal_by_account':
+            drawn_from = projection.drawn_from()[t]
+            return {name: amount for name, amount, drawn in zip(
+                engine.invest_names, projection.run.withdrawals[0, t].tolist(), drawn_from)
+                if drawn}
+        if key == 'ss_income':
+            return engine.ss_schedule(projection.retirement_age)[t].item()
+        if key == 'real_estate_income':
+            return engine.real_estate_income[t].item()
+        if key == 'taxes':
+            return projection.run.taxes[0, t].item()
+        if key == 'total_income':
+            return projection.total_income[t].item()
+        return list(engine.event_descriptions[t])
+
+    def __repr__(self):
+        return f'YearView({dict(self)!r})'
+
+
+class ProjectionEngine:
+    """Array-based counterpart of RetirementCalculator.project_scenario.
+
+    Everything that depends only on the config is compiled once in __init__,
+    so one engine can project any number of retirement ages and scenarios.
+    tables, a SharedTables, lets engines for related configs share their
+    milestone, event and property tables.
+    """
+
+    def __init__(self, config_data, tables=None):
+        self.config = config_data
+        self.tables = tables
+        self.current_year = CURRENT_YEAR
+        self.inflation_rate = config_data.get('inflation_rate', 2.5) / 100.0
+        self.current_age = config_data['current_age']
+        self.life_expectancy = config_data['life_expectancy']
+        self.ss_start_age = config_data['ss_start_age']
+        self.ss_annual = config_data['ss_annual']
+        self.salary = config_data.get('salary', 100000)
+        self.target_income = config_data.get('target_retirement_income', 0)
+
+        self.n_years = max(self.life_expectancy - self.current_age + 1, 0)
+        year_offsets = np.arange(self.n_years)
+        self.ages = self.current_age + year_offsets
+        self.inflation = (1 + self.inflation_rate) ** year_offsets
+
+        accounts = config_data['accounts']
+        self.account_names = [a['name'] for a in accounts]
+        self.invest_accounts = [a for a in accounts if a['type'] != 'Real Estate']
+        self.re_accounts = [a for a in accounts if a['type'] == 'Real Estate']
+        self.invest_names = [a['name'] for a in self.invest_accounts]
+        self.invest_rows = [i for i, a in enumerate(accounts) if a['type'] != 'Real Estate']
+        self.re_rows = [i for i, a in enumerate(accounts) if a['type'] == 'Real Estate']
+
+        self.portfolio_weights = np.array([
+            0.0 if a['type'] == 'Real Estate' and a.get('exclude_from_portfolio') else 1.0
+            for a in accounts
+        ])
+        self.start_balances = np.array(
+            [a['current_balance'] for a in self.invest_accounts], dtype=float)
+        self.base_contribution = np.array(
+            [min(a['annual_contribution'], a['contribution_limit']) for a in self.invest_accounts],
+            dtype=float)
+        self.has_match = np.array(
+            [a['type'] == '401k' and a['employer_match'] > 0 for a in self.invest_accounts],
+            dtype=bool)
+        self.match_rate = np.array(
+            [a['employer_match'] / 100.0 for a in self.invest_accounts], dtype=float)
+
+        self.compiled = (tables.compiled_config(config_data) if tables is not None
+                         else CompiledConfig(config_data))
+        self.withdrawals = compile_withdrawals(config_data)
+        # None on the default annual time step (see planner.monthly)
+        self.monthly = compile_monthly(config_data)
+        self._compile_access()
+        self._compile_returns()
+        self._compile_events()
+        self._compile_real_estate()
+        # Brackets for the opt-in tax on withdrawals (see planner.taxes)
+        self.taxes = compile_taxes(config_data, self.real_estate_income)
+
+    def _compile_access(self):
+        """(years x accounts) mask of accounts reachable at each age"""
+        phases = [access_phase(age, self.ss_start_age) for age in self.ages.tolist()]
+        self.access = self.compiled.phase_masks[phases].reshape(
+            self.n_years, len(self.invest_names))
+
+    def _compile_returns(self):
+        """Milestone returns by years_to_retirement, shared by every age and scenario"""
+        if self.tables is not None:
+            self.returns = self.tables.milestone_table(self.config['milestones'], self.invest_names)
+        else:
+            self.returns = MilestoneTable(self.config['milestones'], self.invest_names)
+
+    def _compile_events(self):
+        """Sum one-time events into (years x accounts) inflow matrices"""
+        self.invest_events = np.zeros((self.n_years, len(self.invest_accounts)))
+        self.re_events = np.zeros((self.n_years, len(self.re_accounts)))
+        self.event_descriptions = [[] for _ in range(self.n_years)]
+        invest_ids = self.compiled.invest_ids
+        re_ids = {a['name']: j for j, a in enumerate(self.re_accounts)}
+
+        for year, events in self.compiled.events_by_year.items():
+            t = year - self.current_year
+            if not 0 <= t < self.n_years:
+                continue
+            for event in events:
+                self.event_descriptions[t].append(event['description'])
+                if event['account'] in invest_ids:
+                    self.invest_events[t, invest_ids[event['account']]] += event['amount']
+                elif event['account'] in re_ids:
+                    self.re_events[t, re_ids[event['account']]] += event['amount']
+
+    def _compile_real_estate(self):
+        """Property equity and net rental income do not depend on the scenario"""
+        schedule_for = self.tables.property_schedule if self.tables is not None else property_schedule
+        schedules = [schedule_for(account, self.n_years) for account in self.re_accounts]
+        self.re_equity = np.zeros((self.n_years, len(self.re_accounts)))
+        self.real_estate_income = np.zeros(self.n_years)
+        for j, schedule in enumerate(schedules):
+            self.re_equity[:, j] = schedule.equity
+            self.real_estate_income += schedule.net_income
+
+        re_weights = self.portfolio_weights[self.re_rows]
+        self.re_portfolio = (self.re_equity + self.re_events) @ re_weights
+
+    def return_moments(self, retirement_age):
+        """(years x accounts) milestone expected return and std_dev"""
+        return self.returns.moments(retirement_age - self.ages)
+
+    def scenario_returns(self, retirement_age, scenario='expected'):
+        """(years x accounts) return rates for one retirement age and scenario"""
+        expected, std_dev = self.return_moments(retirement_age)
+        return expected + SCENARIO_SHIFTS.get(scenario, 0.0) * std_dev
+
+    def working_share(self, retirement_age):
+        """Share of each year spent working: 1 before retirement_age and 0
+        from then on, with a part year on the monthly time step"""
+        if self.monthly is not None:
+            return self.monthly.working_months(retirement_age - self.current_age,
+                                               self.n_years) / MONTHS
+        return (self.ages < retirement_age).astype(float)
+
+    def ss_schedule(self, retirement_age):
+        """Social Security income per year; only paid once retired"""
+        years_on_ss = self.ages - self.ss_start_age
+        retired = 1 - self.working_share(retirement_age)
+        growth = (1 + self.inflation_rate) ** np.maximum(years_on_ss, 0)
+        return np.where(years_on_ss >= 0, self.ss_annual * growth * retired, 0.0)
+
+    def contributions(self, retirement_age):
+        """(years x accounts) contributions and employer match while working"""
+        working = self.working_share(retirement_age)[:, None]
+        contributions = self.base_contribution * self.inflation[:, None] * working
+        max_match = (self.salary * self.inflation)[:, None] * self.match_rate * working
+        employer_match = np.where(self.has_match, np.minimum(contributions, max_match), 0.0)
+        return contributions, employer_match
+
+    def inputs(self, retirement_age, rates):
+        """Growth factors and inflows for rates shaped (years x accounts) or
+        (paths x years x accounts)"""
+        contributions, employer_match = self.contributions(retirement_age)
+        paid_in = contributions + employer_match
+        return 1 + rates, paid_in + paid_in * rates * 0.5 + self.invest_events
+
+    def run(self, retirement_age, rates):
+        """simulate() with rates shaped (years x accounts) or (paths x years x accounts)"""
+        contributions, employer_match = self.contributions(retirement_age)
+        n_paths = len(rates) if rates.ndim == 3 else 1
+        return self._simulate(
+            np.broadcast_to(self.start_balances, (n_paths, len(self.start_balances))),
+            rates, contributions + employer_match, retirement_age, self.access,
+            self.ss_schedule(retirement_age), self.target_income, self.inflation_rate,
+        )
+
+    def _simulate(self, balances, rates, paid_in, retirement_age, access, ss_income,
+                  target_income, inflation_rate):
+        """simulate() from return rates and per-year contributions plus match,
+        on the config's time step"""
+        retire_index = retirement_age - self.current_age
+        if self.monthly is not None:
+            return simulate_monthly(
+                self.monthly, balances, rates if rates.ndim == 3 else rates[None], paid_in,
+                self.invest_events, retire_index, access, ss_income, target_income,
+                inflation_rate)
+
+        growth = 1 + rates
+        inflows = paid_in + paid_in * rates * 0.5 + self.invest_events
+        return simulate(
+            balances, growth if growth.ndim == 3 else growth[None],
+            inflows if inflows.ndim == 3 else inflows[None], retire_index, access,
+            ss_income, target_income, inflation_rate,
+            strategy=self.withdrawals, taxes=self.taxes,
+        )
+
+    def run_variants(self, retirement_age, rates, n_variants, inflation_rate=None,
+                     target_income=None, ss_annual=None, ss_start_age=None, salary=None,
+                     current_balance=None, annual_contribution=None,
+                     contribution_limit=None, employer_match=None):
+        """run() for n_variants copies of this config that differ only in
+        the inputs given, one path per variant.
+
+        Scalar inputs are length n_variants vectors and account inputs are
+        (variants x investable accounts), both in config units (percentages
+        stay percentages). Inputs left as None keep the config's value. rates
+        is (years x accounts) and shared by every variant, or
+        (variants x years x accounts).
+        """
+        accounts = self.invest_accounts
+
+        def per_variant(value, default):
+            default = np.asarray(default, dtype=float)
+            value = default if value is None else np.asarray(value, dtype=float)
+            return np.broadcast_to(value, (n_variants,) + default.shape)
+
+        rate = per_variant(None if inflation_rate is None else np.asarray(inflation_rate) / 100.0,
+                           self.inflation_rate)
+        inflation = (1 + rate[:, None]) ** np.arange(self.n_years)
+        salary = per_variant(salary, self.salary)
+        balances = per_variant(current_balance, [a['current_balance'] for a in accounts])
+        base_contribution = np.minimum(
+            per_variant(annual_contribution, [a['annual_contribution'] for a in accounts]),
+            per_variant(contribution_limit, [a['contribution_limit'] for a in accounts]))
+        match_percent = per_variant(employer_match, [a['employer_match'] for a in accounts])
+        has_match = np.array([a['type'] == '401k' for a in accounts], dtype=bool) & (match_percent > 0)
+
+        working_share = self.working_share(retirement_age)
+        working = working_share[:, None]
+        contributions = base_contribution[:, None, :] * inflation[:, :, None] * working
+        max_match = ((salary[:, None] * inflation)[:, :, None]
+                     * (match_percent / 100.0)[:, None, :] * working)
+        employer_match = np.where(has_match[:, None, :], np.minimum(contributions, max_match), 0.0)
+
+        ss_start = per_variant(ss_start_age, self.ss_start_age)[:, None]
+        years_on_ss = self.ages - ss_start
+        ss_growth = (1 + rate[:, None]) ** np.maximum(years_on_ss, 0)
+        ss_income = np.where(
+            years_on_ss >= 0,
+            per_variant(ss_annual, self.ss_annual)[:, None] * ss_growth * (1 - working_share), 0.0)
+
+        access = self.access
+        if ss_start_age is not None:
+            phases = np.where(self.ages < 59.5, EARLY, np.where(self.ages < ss_start, PRE_SS, FULL))
+            access = self.compiled.phase_masks[phases]
+
+        return self._simulate(
+            balances, rates, contributions + employer_match, retirement_age, access, ss_income,
+            per_variant(target_income, self.target_income), rate,
+        )
+
+    def total_portfolio(self, balances):
+        """Total portfolio per year from simulated investable balances"""
+        return balances.sum(axis=-1) + self.re_portfolio
+
+    def project_arrays(self, retirement_age, scenario='expected'):
+        """Project one retirement age and scenario, returning a Projection"""
+        run = self.run(retirement_age, self.scenario_returns(retirement_age, scenario))
+        return Projection(self, retirement_age, scenario, run)
+
+    def project_scenarios(self, retirement_age, scenarios=SCENARIOS):
+        """Projections of several scenarios of one retirement age, run as one batch"""
+        expected, std_dev = self.return_moments(retirement_age)
+        shifts = np.array([SCENARIO_SHIFTS.get(scenario, 0.0) for scenario in scenarios])
+        run = self.run(retirement_age, expected + shifts[:, None, None] * std_dev)
+        return [
+            Projection(self, retirement_age, scenario, Simulation(*(field[i:i + 1] for field in run)))
+            for i, scenario in enumerate(scenarios)
+        ]
+
+    def project(self, retirement_age, scenario='expected'):
+        """Same output as RetirementCalculator.project_scenario"""
+        return self.project_arrays(retirement_age, scenario).to_dicts()
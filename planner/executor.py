@@ -0,0 +1,159 @@
+"""
+Shared process pool for independent projection jobs.
+
+(retirement_age, scenario) projections and Monte Carlo path chunks do not
+depend on each other, so /api/calculate can spread them over worker
+processes. The pool is sized once at startup (CALC_WORKERS); with 0 or 1
+workers jobs run inline on the calling thread, which is what the tests use.
+Each server process starts its own pool with start_pool() before taking
+requests, so no request waits for the workers to spawn and import numpy.
+"""
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from planner.engine import ProjectionEngine, compact_config
+
+
+class InlineExecutor:
+    """Runs each job on the calling thread, with the submit() surface of a pool"""
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        # A Future carries whatever fn raised, as in concurrent.futures
+        except Exception as exc:  # noqa: BLE001
+            future.set_exception(exc)
+        return future
+
+    def shutdown(self, wait=True):
+        pass
+
+
+_inline = InlineExecutor()
+_lock = threading.Lock()
+_workers = 0
+_pool = None
+_pool_pid = None
+
+
+def init_pool(workers):
+    """Size the shared pool; called once at app startup, before start_pool()"""
+    global _workers
+    shutdown_pool()
+    _workers = max(int(workers), 0)
+
+
+def worker_count():
+    return max(1, _workers)
+
+
+def is_parallel():
+    return _workers > 1
+
+
+def get_executor():
+    """The shared pool, created on first use in each process.
+
+    Worker processes are spawned rather than forked, so a pool never
+    inherits a forked copy of the server's threads or sockets.
+    """
+    global _pool, _pool_pid
+    if not is_parallel():
+        return _inline
+    with _lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ProcessPoolExecutor(
+                max_workers=_workers, mp_context=multiprocessing.get_context('spawn'))
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def start_pool():
+    """Start this process's pool and wait until every worker is up.
+
+    Workers spawn on demand, so one warm-up task per worker spawns them all;
+    unpickling it imports this module, and with it the engine and numpy.
+    """
+    pool = get_executor()
+    if is_parallel():
+        for future in [pool.submit(_ready) for _ in range(_workers)]:
+            future.result()
+
+
+def _ready():
+    return os.getpid()
+
+
+def shutdown_pool():
+    global _pool, _pool_pid
+    with _lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+        _pool_pid = None
+
+
+def run_jobs(fn, arg_lists, progress=None):
+    """Call fn(*args) for each args tuple on the shared pool; results in order.
+
+    progress(done, total) is called as each result is collected. If it
+    raises, jobs that have not started yet are cancelled.
+    """
+    if not is_parallel():
+        results = []
+        for args in arg_lists:
+            results.append(fn(*args))
+            if progress is not None:
+                progress(len(results), len(arg_lists))
+        return results
+
+    executor = get_executor()
+    futures = [executor.submit(fn, *args) for args in arg_lists]
+    results = []
+    try:
+        for future in futures:
+            results.append(future.result())
+            if progress is not None:
+                progress(len(results), len(futures))
+    finally:
+        for future in futures:
+            future.cancel()
+    return results
+
+
+def split(items, n_parts):
+    """Split items into at most n_parts contiguous, similarly sized batches"""
+    n_parts = max(min(n_parts, len(items)), 1)
+    size, extra = divmod(len(items), n_parts)
+    batches, start = [], 0
+    for i in range(n_parts):
+        end = start + size + (1 if i < extra else 0)
+        batches.append(items[start:end])
+        start = end
+    return batches
+
+
+def project_batch(config, jobs):
+    """Worker entry point: compile the config once, project each (age, scenario)"""
+    engine = ProjectionEngine(config)
+    return [engine.project_arrays(retirement_age, scenario) for retirement_age, scenario in jobs]
+
+
+def project_jobs(engine, jobs):
+    """Project every (retirement_age, scenario) job to a Projection, fanning out when pooled"""
+    if not is_parallel():
+        return [engine.project_arrays(retirement_age, scenario)
+                for retirement_age, scenario in jobs]
+
+    config = compact_config(engine.config)
+    batches = split(jobs, worker_count())
+    results = run_jobs(project_batch, [(config, batch) for batch in batches])
+    projections = [projection for batch in results for projection in batch]
+    # Projections come back without an engine; they share the caller's
+    for projection in projections:
+        projection.engine = engine
+    return projections
@@ -0,0 +1,299 @@
+"""
+Historical backtests.
+
+A backtest replays every rolling window of a yearly returns dataset through
+the projection engine: the plan starting in 1928, in 1929, and so on, each
+living through the actual sequence of returns and inflation that followed.
+
+The dataset is a CSV with a year column, an inflation column and one column
+per asset class (stocks, bonds, cash or anything else), all in percent.
+
+    python -m planner.history data/returns.csv
+
+converts it once to a .npy file of one record per year next to it, which is
+memory-mapped on load. Each window of an asset class is a view into that
+file, so nothing is copied until the windows are turned into rates.
+Conversion happens at deploy time, from that command or install(), never
+while serving: Dataset.open only maps a .npy that is already there.
+
+Each account follows one asset class, or a fixed mix of them, chosen by
+account name or type (DEFAULT_ASSET_CLASSES otherwise). Returns are made
+real by the same year's inflation, and the projection runs with zero
+inflation, so the whole backtest is in today's dollars: contributions,
+Social Security and the withdrawal keep their purchasing power, as the
+config's inflation_rate would otherwise do. Every window of a retirement
+age runs as one batch through ProjectionEngine.run_variants.
+"""
+
+import argparse
+import csv
+import os
+import tempfile
+from collections import namedtuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from planner.montecarlo import SHORTFALL_TOLERANCE
+from planner.montecarlo import summarize as summarize_paths
+
+# Asset class each account type follows unless the request says otherwise
+DEFAULT_ASSET_CLASSES = {
+    'Taxable': 'stocks',
+    '401k': 'stocks',
+    'IRA': 'stocks',
+    'Roth IRA': 'stocks',
+    'Savings': 'cash',
+}
+FALLBACK_ASSET_CLASS = 'stocks'
+
+# Columns every dataset has besides its asset classes
+YEAR = 'year'
+INFLATION = 'inflation'
+
+# A checked backtest request: (asset classes x investable accounts) weights,
+# the asset class names of its rows, and whether windows wrap around
+Backtest = namedtuple('Backtest', 'weights asset_classes wrap')
+
+
+class HistoryError(ValueError):
+    """A dataset or backtest request that cannot be used"""
+
+
+def read_csv(path):
+    """Structured array with one float64 field per column of a returns CSV"""
+    with open(path, newline='') as f:
+        reader = csv.reader(f)
+        try:
+            header = [name.strip() for name in next(reader)]
+        except StopIteration:
+            raise HistoryError(f'{path} is empty') from None
+        rows = [row for row in reader if any(cell.strip() for cell in row)]
+    if YEAR not in header or INFLATION not in header or len(header) < 3:
+        raise HistoryError(f'{path} needs {YEAR}, {INFLATION} and at least one asset class column')
+    if len(set(header)) != len(header):
+        raise HistoryError(f'{path} repeats a column name')
+
+    data = np.zeros(len(rows), dtype=[(name, 'f8') for name in header])
+    for i, row in enumerate(rows):
+        if len(row) != len(header):
+            raise HistoryError(f'{path} line {i + 2}: expected {len(header)} values')
+        try:
+            data[i] = tuple(float(cell) for cell in row)
+        except ValueError:
+            raise HistoryError(f'{path} line {i + 2}: values must be numbers') from None
+    data.sort(order=YEAR)
+    if len(data) == 0 or np.any(np.diff(data[YEAR]) != 1):
+        raise HistoryError(f'{path} must cover consecutive years, one row each')
+    return data
+
+
+def convert(csv_path, npy_path):
+    """Write the binary form of a returns CSV.
+
+    The file is written under a temporary name and renamed into place, so a
+    process mapping npy_path never sees it half written.
+    """
+    data = read_csv(csv_path)
+    directory = os.path.dirname(os.path.abspath(npy_path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(suffix='.npy', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, data)
+        os.replace(tmp_path, npy_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return data
+
+
+def npy_path(path):
+    """The .npy that Dataset.open maps for a dataset path"""
+    root, ext = os.path.splitext(path)
+    return root + '.npy' if ext == '.csv' else path
+
+
+def install(path):
+    """Convert a dataset CSV to the .npy next to it, unless that is up to date.
+
+    A .npy path, or a CSV that does not exist, is left alone. This writes
+    beside the CSV, so run it when deploying, not while serving.
+    """
+    target = npy_path(path)
+    if target != path and os.path.exists(path) and (
+            not os.path.exists(target) or os.path.getmtime(target) < os.path.getmtime(path)):
+        convert(path, target)
+    return target
+
+
+class Dataset:
+    """A memory-mapped returns dataset; see the module docstring"""
+
+    def __init__(self, data):
+        names = data.dtype.names or ()
+        if YEAR not in names or INFLATION not in names:
+            raise HistoryError(f'a returns dataset needs {YEAR} and {INFLATION} fields')
+        self.data = data
+        self.first_year = int(data[YEAR][0])
+        self.asset_classes = tuple(name for name in names if name not in (YEAR, INFLATION))
+
+    @classmethod
+    def open(cls, path):
+        """Map a .npy written by convert(); for a .csv, the .npy next to it.
+
+        Nothing is written, so this is safe on a read-only filesystem and
+        from several processes at once.
+        """
+        target = npy_path(path)
+        if not os.path.exists(target):
+            if target != path and os.path.exists(path):
+                raise HistoryError(
+                    f'the historical returns dataset has not been converted; '
+                    f'run python -m planner.history {path}')
+            raise HistoryError('no historical returns dataset is installed')
+        return cls(np.load(target, mmap_mode='r'))
+
+    def __len__(self):
+        return len(self.data)
+
+    def starts(self, n_years, wrap=False):
+        """Offsets of the windows of n_years; with wrap, every year starts one
+        and runs on from the first year once it reaches the end"""
+        if wrap:
+            return np.arange(len(self))
+        return np.arange(max(len(self) - n_years + 1, 0))
+
+    def windows(self, column, n_years, wrap=False):
+        """(windows x n_years) of one column, a view of the file unless wrap"""
+        values = self.data[column]
+        if wrap:
+            offsets = (np.arange(len(self))[:, None] + np.arange(n_years)) % len(self)
+            return np.asarray(values)[offsets]
+        if n_years > len(self):
+            return np.empty((0, n_years))
+        return sliding_window_view(values, n_years)
+
+    def real_returns(self, n_years, wrap=False, asset_classes=None):
+        """(asset classes x windows x n_years) returns after inflation, as fractions"""
+        inflation = 1 + self.windows(INFLATION, n_years, wrap) / 100.0
+        return np.stack([(1 + self.windows(name, n_years, wrap) / 100.0) / inflation - 1
+                         for name in (asset_classes or self.asset_classes)])
+
+
+def _mix(spec, asset_classes, account):
+    """{asset class: weight} from a name or a mapping of weights"""
+    mix = {spec: 1.0} if isinstance(spec, str) else spec
+    if not isinstance(mix, dict) or not mix:
+        raise HistoryError(f'{account}: give an asset class or weights by asset class')
+    for name, weight in mix.items():
+        if name not in asset_classes:
+            raise HistoryError(f"{account}: unknown asset class {name!r}; "
+                               f"the dataset has {', '.join(asset_classes)}")
+        if isinstance(weight, bool) or not isinstance(weight, (int, float)) or weight < 0:
+            raise HistoryError(f'{account}: weights must be non-negative numbers')
+    if abs(sum(mix.values()) - 1) > 1e-6:
+        raise HistoryError(f'{account}: weights must add up to 1')
+    return mix
+
+
+def prepare(engine, dataset, options):
+    """Check a backtest request against a compiled config; raises HistoryError.
+
+    options['asset_classes'] maps account names or account types to an asset
+    class, or to weights by asset class such as {"stocks": 0.6, "bonds": 0.4}.
+    A name wins over a type. options['wrap'] also starts windows in the last
+    years of the dataset, wrapping around to its first years.
+    """
+    wrap = bool(options.get('wrap', False))
+    if engine.n_years == 0:
+        raise HistoryError('life_expectancy is before current_age')
+    if not len(dataset.starts(engine.n_years, wrap)):
+        raise HistoryError(f'the dataset covers {len(dataset)} years, fewer than the '
+                           f'{engine.n_years} this plan projects; pass "wrap": true')
+
+    overrides = options.get('asset_classes') or {}
+    if not isinstance(overrides, dict):
+        raise HistoryError('asset_classes must map account names or types to asset classes')
+    names = dataset.asset_classes
+    weights = np.zeros((len(names), len(engine.invest_accounts)))
+    for j, account in enumerate(engine.invest_accounts):
+        spec = overrides.get(account['name'], overrides.get(account['type']))
+        if spec is None:
+            spec = DEFAULT_ASSET_CLASSES.get(account['type'], FALLBACK_ASSET_CLASS)
+            if spec not in names:
+                spec = names[0]
+        for name, weight in _mix(spec, names, account['name']).items():
+            weights[names.index(name), j] = weight
+
+    used = np.flatnonzero(weights.any(axis=1))
+    return Backtest(weights[used], tuple(names[i] for i in used), wrap)
+
+
+def rates(engine, dataset, plan):
+    """(windows x years x accounts) real return rates of every window"""
+    real = dataset.real_returns(engine.n_years, plan.wrap, plan.asset_classes)
+    return np.einsum('cwy,ca->wya', real, plan.weights)
+
+
+def run(engine, dataset, retirement_ages, plan, progress=None):
+    """Backtest every window for each retirement age; see the module docstring.
+
+    Each age's result is planner.montecarlo.summarize over the windows, plus
+    per window its start year, the age it first failed to fund the
+    withdrawal (None if never) and the portfolio left at life_expectancy.
+    progress(done, total) is called after each retirement age.
+    """
+    window_rates = rates(engine, dataset, plan)
+    n_windows = len(window_rates)
+    start_years = (dataset.first_year + dataset.starts(engine.n_years, plan.wrap)).tolist()
+    no_inflation = np.zeros(n_windows)
+
+    results = []
+    for retirement_age in retirement_ages:
+        run = engine.run_variants(retirement_age, window_rates, n_windows,
+                                  inflation_rate=no_inflation)
+        failed = run.total_withdrawal < run.requested - SHORTFALL_TOLERANCE
+        failure_index = np.where(failed.any(axis=1), failed.argmax(axis=1), -1)
+        total_portfolio = engine.total_portfolio(run.balances)
+
+        result = summarize_paths(engine, retirement_age, total_portfolio, failure_index)
+        result['windows'] = {
+            'start_year': start_years,
+            'failed_at_age': [None if i < 0 else int(engine.ages[i])
+                              for i in failure_index.tolist()],
+            'final_portfolio': total_portfolio[:, -1].tolist(),
+        }
+        results.append(result)
+        if progress is not None:
+            progress(len(results), len(retirement_ages))
+
+    return {
+        'windows': n_windows,
+        'wrap': plan.wrap,
+        'first_year': dataset.first_year,
+        'last_year': dataset.first_year + len(dataset) - 1,
+        'asset_classes': {
+            account['name']: {name: float(weight) for name, weight
+                              in zip(plan.asset_classes, plan.weights[:, j]) if weight}
+            for j, account in enumerate(engine.invest_accounts)
+        },
+        'ages': engine.ages.tolist(),
+        'results': results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Convert a returns CSV for backtests')
+    parser.add_argument('csv', help='year, inflation and asset class columns, in percent')
+    parser.add_argument('npy', nargs='?',
+                        help='memory-mappable output file (default: the .npy next to the CSV)')
+    args = parser.parse_args(argv)
+    npy = args.npy or npy_path(args.csv)
+    data = convert(args.csv, npy)
+    print(f'{npy}: {len(data)} years from {int(data[YEAR][0])}, '
+          f"asset classes {', '.join(Dataset(data).asset_classes)}")
+
+
+if __name__ == '__main__':
+    main()
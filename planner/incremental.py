@@ -0,0 +1,114 @@
+"""
+Incremental recomputation of projections.
+
+A cached Projection keeps every year's investable balances, which double as
+per-year checkpoints. When the config changes, resume() compares the old and
+new compiled inputs and only redoes what the change can reach:
+
+- Working years have no coupling between accounts, so an account whose
+  returns, contributions and events are unchanged keeps its cached
+  trajectory; a changed one is rebuilt from the year before its first
+  change (an event in 2040 restarts that account from its 2039 balance).
+- Withdrawals couple the accounts once retired, so the retired phase is
+  rerun for every account from the first year anything differs, and never
+  before retirement.
+
+Real estate depends on nothing but the property itself and comes straight
+from the new engine.
+"""
+
+import numpy as np
+
+from planner.engine import Projection, accumulate, simulate
+
+
+def first_change(old, new, axis=0):
+    """Index of the first differing entry along axis, len(old) where none differ"""
+    changed = np.not_equal(old, new)
+    if changed.ndim > 1:
+        changed = changed.any(axis=tuple(range(1, changed.ndim)))
+    return int(changed.argmax()) if changed.any() else len(changed)
+
+
+def is_compatible(old, new):
+    """Whether projections from old line up year-for-year and account-for-account
+    with new, and new's retired phase can be resumed (its withdrawal strategy
+    is not dynamic and it has no taxes); both must be on the annual time step"""
+    return (old.current_age == new.current_age
+            and old.n_years == new.n_years
+            and old.invest_names == new.invest_names
+            and not new.withdrawals.dynamic
+            and new.taxes is None
+            and old.monthly is None and new.monthly is None)
+
+
+def resume(engine, base):
+    """Project base's retirement age and scenario under engine's config.
+
+    base is a Projection computed from an earlier config. Returns a new
+    Projection, or None when the two configs are too different to share
+    checkpoints (another current age or horizon, or accounts added, removed
+    or reordered).
+    """
+    old = base.engine
+    if not is_compatible(old, engine):
+        return None
+
+    retirement_age, scenario = base.retirement_age, base.scenario
+    retire_index = retirement_age - engine.current_age
+    n_years = engine.n_years
+    n_working = min(max(retire_index, 0), n_years)
+
+    old_growth, old_inflows = old.inputs(retirement_age, old.scenario_returns(retirement_age, scenario))
+    growth, inflows = engine.inputs(retirement_age, engine.scenario_returns(retirement_age, scenario))
+
+    # First changed year per account; a new starting balance changes year 0
+    changed = (old_growth != growth) | (old_inflows != inflows)
+    first_dirty = np.where(changed.any(axis=0), changed.argmax(axis=0), n_years)
+    first_dirty[old.start_balances != engine.start_balances] = 0
+
+    history = base.run.balances[0].copy()
+    for first in np.unique(first_dirty[first_dirty < n_working]):
+        columns = np.flatnonzero(first_dirty == first)
+        start = engine.start_balances if first == 0 else history[first - 1]
+        history[first:n_working, columns] = accumulate(
+            start[None, columns], growth[None, first:n_working, columns],
+            inflows[None, first:n_working, columns])[0]
+
+    # The retired phase restarts at the first year anything reaches it
+    triggers = [
+        int(first_dirty.min()) if len(first_dirty) else n_years,
+        first_change(old.access, engine.access),
+        first_change(old.ss_schedule(retirement_age), engine.ss_schedule(retirement_age)),
+    ]
+    if (old.target_income != engine.target_income
+            or old.inflation_rate != engine.inflation_rate
+            or old.config.get('withdrawal_strategy') != engine.config.get('withdrawal_strategy')
+            or old.config.get('taxes') != engine.config.get('taxes')):
+        triggers.append(n_working)
+    retired_start = max(min(triggers), n_working)
+
+    if retired_start >= n_years:
+        run = base.run._replace(balances=history[None])
+        return Projection(engine, retirement_age, scenario, run)
+
+    balances = engine.start_balances if retired_start == 0 else history[retired_start - 1]
+    tail = simulate(
+        balances[None], growth[None], inflows[None], retire_index, engine.access,
+        engine.ss_schedule(retirement_age), engine.target_income, engine.inflation_rate,
+        start=retired_start, initial_withdrawal=base.run.initial_withdrawal,
+    )
+
+    def splice(cached, fresh):
+        merged = cached.copy()
+        merged[:, retired_start:] = fresh[:, retired_start:]
+        return merged
+
+    run = tail._replace(
+        balances=splice(history[None], tail.balances),
+        withdrawals=splice(base.run.withdrawals, tail.withdrawals),
+        total_withdrawal=splice(base.run.total_withdrawal, tail.total_withdrawal),
+        requested=splice(base.run.requested, tail.requested),
+        taxes=splice(base.run.taxes, tail.taxes),
+    )
+    return Projection(engine, retirement_age, scenario, run)
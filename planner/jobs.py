@@ -0,0 +1,407 @@
+"""
+Background jobs for long-running calculations.
+
+A big Monte Carlo run or projection sweep can take seconds, which would tie
+up a server worker for the whole time. JobQueue runs such calculations on a
+small thread pool instead. The request gets a job id straight away and the
+caller polls for progress and the result.
+
+Each job belongs to an owner, the session identity of the caller. Owners
+only see their own jobs and can have at most per_owner jobs queued or
+running at once. A job function takes the Job as its first argument and
+reports progress through job.progress(done, total). That call is also where
+a cancelled job stops: it raises JobCancelled.
+
+The pool and the store are constructor arguments. Any object with
+submit(fn, *args) can stand in for the pool, and anything with the
+MemoryJobStore methods can stand in for the store. MemoryJobStore keeps jobs
+in the process. SQLiteJobStore keeps their state, progress and results in a
+database every server worker opens, so a job runs on the worker that
+accepted it but can be polled and cancelled from any of them, and the
+per-owner limit counts the jobs of all workers.
+"""
+
+import json
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = 'queued', 'running', 'done', 'failed', 'cancelled'
+ACTIVE = (QUEUED, RUNNING)
+
+
+class JobCancelled(Exception):
+    """Raised inside a job function once its job has been cancelled"""
+
+
+class JobLimitError(Exception):
+    """The owner already has the maximum number of active jobs"""
+
+
+class Job:
+    """One queued calculation and its progress, result or error"""
+
+    def __init__(self, owner, kind, created, job_id=None):
+        self.id = job_id if job_id is not None else secrets.token_urlsafe(12)
+        self.owner = owner
+        self.kind = kind
+        self.created = created
+        self.finished_at = None
+        self.status = QUEUED
+        self.done = 0
+        self.total = None
+        self.result = None
+        self.error = None
+        # The store that holds this job; set when it is added to one
+        self.store = None
+        self._cancel = threading.Event()
+        self._finished = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def progress(self, done, total):
+        """Record progress; raises JobCancelled once the job is cancelled"""
+        if self._cancel.is_set() or (
+                self.store is not None and self.store.progress(self, done, total)):
+            self._cancel.set()
+            raise JobCancelled()
+        self.done = done
+        self.total = total
+
+    def cancel(self):
+        self._cancel.set()
+
+    def wait(self, timeout=None):
+        """Block until the job has finished; True unless the timeout ran out"""
+        return self._finished.wait(timeout)
+
+    def finish(self, status, clock_time, result=None, error=None):
+        self.status = status
+        self.result = result
+        self.error = error
+        self.finished_at = clock_time
+        self._finished.set()
+
+    def to_dict(self):
+        """JSON-ready status; the result is included once the job is done"""
+        data = {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'progress': {'done': self.done, 'total': self.total},
+        }
+        if self.status == DONE:
+            data['result'] = self.result
+        if self.error is not None:
+            data['error'] = self.error
+        return data
+
+
+class MemoryJobStore:
+    """Jobs held in a dict in this process"""
+
+    def __init__(self):
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def add(self, job, limit):
+        """Add a job unless its owner already has limit active ones; True if added"""
+        with self._lock:
+            if sum(1 for other in self._jobs.values()
+                   if other.owner == job.owner and other.status in ACTIVE) >= limit:
+                return False
+            self._jobs[job.id] = job
+            job.store = self
+            return True
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def start(self, job):
+        """Mark a queued job running; False if it was cancelled first"""
+        with self._lock:
+            if job.status != QUEUED:
+                return False
+            job.status = RUNNING
+            return True
+
+    def progress(self, job, done, total):
+        """Nothing to record for a job held here; True if it is cancelled"""
+        return job.cancelled
+
+    def finish(self, job, status, finished_at, result=None, error=None, states=ACTIVE):
+        """Finish a job whose status is one of states; True if it was"""
+        with self._lock:
+            if job.status not in states:
+                return False
+            job.finish(status, finished_at, result, error)
+            return True
+
+    def cancel(self, job):
+        job.cancel()
+
+    def active_count(self, owner):
+        with self._lock:
+            return sum(1 for job in self._jobs.values()
+                       if job.owner == owner and job.status in ACTIVE)
+
+    def prune(self, before):
+        """Drop finished jobs that finished before the given clock time"""
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job.finished_at is not None and job.finished_at < before]
+            for job_id in expired:
+                del self._jobs[job_id]
+            return len(expired)
+
+    def __len__(self):
+        return len(self._jobs)
+
+
+class SQLiteJobStore:
+    """Jobs as rows of one SQLite table, shared by every process that opens it.
+
+    get() returns a snapshot of the row; the process running a job keeps
+    its own Job and writes each progress report through to the row, which
+    is also where it picks up a cancel made elsewhere. A job whose row has
+    not changed for the queue's ttl was lost with its worker, and prune()
+    marks it failed. Like SQLiteBackend, a forked worker opens its own
+    connection, and an in-memory database is private to its process.
+    """
+
+    def __init__(self, path=':memory:', clock=time.time):
+        self.path = path
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._connect()
+        with self._lock:
+            if path != ':memory:':
+                self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS jobs ('
+                'id TEXT PRIMARY KEY, owner TEXT NOT NULL, kind TEXT NOT NULL, '
+                'status TEXT NOT NULL, done INTEGER NOT NULL, total INTEGER, '
+                'result TEXT, error TEXT, cancel INTEGER NOT NULL DEFAULT 0, '
+                'created REAL NOT NULL, updated REAL NOT NULL, finished_at REAL)')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS jobs_owner ON jobs (owner, status)')
+
+    def _connect(self):
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        # Progress is written often and is worthless after a crash, so
+        # commits need not wait for the disk
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._pid = os.getpid()
+
+    def _connection(self):
+        """This process's connection; call with the lock held"""
+        if self._pid != os.getpid() and self.path != ':memory:':
+            self._connect()
+        return self._conn
+
+    def add(self, job, limit):
+        """Add a job unless its owner already has limit active ones; True if added"""
+        with self._lock:
+            conn = self._connection()
+            # Count and insert in one write transaction, so workers submitting
+            # for the same owner at once cannot both pass the limit
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                active = conn.execute(
+                    'SELECT COUNT(*) FROM jobs WHERE owner = ? AND status IN (?, ?)',
+                    (job.owner, *ACTIVE)).fetchone()[0]
+                if active >= limit:
+                    return False
+                conn.execute(
+                    'INSERT INTO jobs (id, owner, kind, status, done, total, created, updated) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    (job.id, job.owner, job.kind, job.status, job.done, job.total,
+                     job.created, self.clock()))
+            finally:
+                conn.execute('COMMIT')
+        job.store = self
+        return True
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._connection().execute(
+                'SELECT id, owner, kind, status, done, total, result, error, cancel, '
+                'created, finished_at FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        job_id, owner, kind, status, done, total, result, error, cancel, created, finished_at = row
+        job = Job(owner, kind, created, job_id)
+        job.done, job.total = done, total
+        if cancel:
+            job.cancel()
+        if status in ACTIVE:
+            job.status = status
+        else:
+            job.finish(status, finished_at, None if result is None else json.loads(result), error)
+        return job
+
+    def start(self, job):
+        """Mark a queued job running; False if it was cancelled first"""
+        with self._lock:
+            conn = self._connection()
+            started = conn.execute(
+                'UPDATE jobs SET status = ?, updated = ? WHERE id = ? AND status = ?',
+                (RUNNING, self.clock(), job.id, QUEUED)).rowcount
+            row = None if started else conn.execute(
+                'SELECT status, finished_at FROM jobs WHERE id = ?', (job.id,)).fetchone()
+        if started:
+            job.status = RUNNING
+            return True
+        # Cancelled while queued, perhaps by another process; catch this
+        # process's Job up with the row
+        job.cancel()
+        status, finished_at = row if row is not None else (CANCELLED, self.clock())
+        job.finish(status, finished_at)
+        return False
+
+    def progress(self, job, done, total):
+        """Record progress in the job's row; True if it has been cancelled"""
+        with self._lock:
+            row = self._connection().execute(
+                'UPDATE jobs SET done = ?, total = ?, updated = ? WHERE id = ? RETURNING cancel',
+                (done, total, self.clock(), job.id)).fetchone()
+        return row is None or bool(row[0])
+
+    def finish(self, job, status, finished_at, result=None, error=None, states=ACTIVE):
+        """Finish a job whose status is one of states; True if it was"""
+        payload = None if result is None else json.dumps(result, separators=(',', ':'))
+        marks = ', '.join('?' * len(states))
+        with self._lock:
+            finished = self._connection().execute(
+                'UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, updated = ? '
+                f'WHERE id = ? AND status IN ({marks})',
+                (status, payload, error, finished_at, self.clock(), job.id, *states)).rowcount
+        if finished:
+            job.finish(status, finished_at, result, error)
+        return bool(finished)
+
+    def cancel(self, job):
+        """Ask a job to stop, wherever it runs"""
+        job.cancel()
+        with self._lock:
+            self._connection().execute('UPDATE jobs SET cancel = 1 WHERE id = ?', (job.id,))
+
+    def active_count(self, owner):
+        with self._lock:
+            return self._connection().execute(
+                'SELECT COUNT(*) FROM jobs WHERE owner = ? AND status IN (?, ?)',
+                (owner, *ACTIVE)).fetchone()[0]
+
+    def prune(self, before):
+        """Fail jobs abandoned since before, and drop finished jobs that
+        finished before the given clock time"""
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                'UPDATE jobs SET status = ?, error = ?, finished_at = ? '
+                'WHERE status IN (?, ?) AND updated < ?',
+                (FAILED, 'Calculation was interrupted', self.clock(), *ACTIVE, before))
+            return conn.execute(
+                'DELETE FROM jobs WHERE finished_at < ?', (before,)).rowcount
+
+    def __len__(self):
+        with self._lock:
+            return self._connection().execute('SELECT COUNT(*) FROM jobs').fetchone()[0]
+
+
+class JobQueue:
+    """Runs job functions in the background with per-owner limits.
+
+    Finished jobs stay available for ttl seconds and are then pruned on a
+    later submit. The clock must be the store's, which for a shared store
+    is wall-clock time.
+    """
+
+    def __init__(self, workers=2, per_owner=2, ttl=3600.0, store=None, pool=None,
+                 clock=time.time):
+        self.per_owner = per_owner
+        self.ttl = ttl
+        self.clock = clock
+        self.store = store if store is not None else MemoryJobStore()
+        self.pool = pool if pool is not None else ThreadPoolExecutor(
+            max_workers=max(int(workers), 1), thread_name_prefix='job')
+        self._lock = threading.Lock()
+        self._counts = dict.fromkeys(('submitted', DONE, FAILED, CANCELLED), 0)
+        # Jobs this process has accepted and not yet finished running
+        self._local = {}
+
+    def submit(self, owner, kind, fn, *args):
+        """Queue fn(job, *args) for owner and return the Job"""
+        self.store.prune(self.clock() - self.ttl)
+        job = Job(owner, kind, self.clock())
+        if not self.store.add(job, self.per_owner):
+            raise JobLimitError(
+                f'At most {self.per_owner} jobs can be queued or running at once')
+        with self._lock:
+            self._counts['submitted'] += 1
+            self._local[job.id] = job
+        self.pool.submit(self._run, job, fn, args)
+        return job
+
+    def _run(self, job, fn, args):
+        try:
+            if not self.store.start(job):
+                return
+            try:
+                result = fn(job, *args)
+            except JobCancelled:
+                self._finish(job, CANCELLED)
+            except Exception:
+                logger.exception('Job %s failed', job.id)
+                self._finish(job, FAILED, error='Calculation failed')
+            else:
+                self._finish(job, DONE, result=result)
+        finally:
+            with self._lock:
+                self._local.pop(job.id, None)
+
+    def _finish(self, job, status, result=None, error=None, states=ACTIVE):
+        if self.store.finish(job, status, self.clock(), result, error, states):
+            with self._lock:
+                self._counts[status] += 1
+
+    def get(self, owner, job_id):
+        """The owner's job with this id, or None"""
+        job = self._local.get(job_id)
+        if job is None:
+            job = self.store.get(job_id)
+        return job if job is not None and job.owner == owner else None
+
+    def wait(self, job_id, timeout=None):
+        """Block until a job has finished; True unless the timeout ran out.
+
+        Only a job running in this process can be waited for; one running
+        elsewhere counts as finished once its stored status says so.
+        """
+        job = self._local.get(job_id)
+        if job is None:
+            job = self.store.get(job_id)
+        return job is not None and job.wait(timeout)
+
+    def cancel(self, owner, job_id):
+        """Cancel the owner's job; returns it, or None if there is no such job.
+
+        A queued job is cancelled at once. A running one stops at its next
+        progress report.
+        """
+        job = self.get(owner, job_id)
+        if job is None:
+            return None
+        self.store.cancel(job)
+        self._finish(job, CANCELLED, states=(QUEUED,))
+        return job
+
+    def stats(self):
+        return {**self._counts, 'stored': len(self.store)}
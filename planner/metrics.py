@@ -0,0 +1,261 @@
+"""
+Request timing, work counters and sampling profiles.
+
+Each request carries a Timings that its phases add to (session decoding,
+projection, summary building, serialization). The phases go into
+process-wide histograms, and to the client in a Server-Timing header when
+that is enabled or the request carries the metrics token. /api/metrics renders the histograms in the
+Prometheus text format together with the cache and job counters.
+
+Work counters tally what the calculators do: years projected in full or
+filled in after depletion, account-years by account type, and simulated
+path-years and account-years in the engine. Counting is off unless
+enable_counters() is called (METRICS_COUNTERS=1), and even then it is one
+update per projection rather than per loop iteration.
+
+SamplingProfiler runs cProfile on a random share of requests and logs
+their top functions by own time.
+"""
+
+import cProfile
+import io
+import logging
+import pstats
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Histogram bucket bounds in seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class _Metric:
+    """Values by label values; subclasses say how a value is updated and rendered"""
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def _pairs(self, key, *extra):
+        return list(zip(self.label_names, key)) + list(extra)
+
+
+class Counter(_Metric):
+    """Totals that only go up"""
+
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return [(self.name + _labels(self._pairs(key)), value) for key, value in values]
+
+
+class Histogram(_Metric):
+    """Observations counted into cumulative buckets, with their sum and count"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def count(self, **labels):
+        entry = self._values.get(self._key(labels))
+        return entry[2] if entry is not None else 0
+
+    def samples(self):
+        with self._lock:
+            values = sorted((key, (list(counts), total, n))
+                            for key, (counts, total, n) in self._values.items())
+        lines = []
+        for key, (counts, total, n) in values:
+            for bound, count in zip(self.buckets, counts):
+                lines.append((self.name + '_bucket' + _labels(self._pairs(key, ('le', bound))),
+                              count))
+            lines.append((self.name + '_bucket' + _labels(self._pairs(key, ('le', '+Inf'))), n))
+            lines.append((self.name + '_sum' + _labels(self._pairs(key)), total))
+            lines.append((self.name + '_count' + _labels(self._pairs(key)), n))
+        return lines
+
+
+class Collected:
+    """Values read from elsewhere at scrape time: collect() returns
+    {label values tuple: value}, or a single value when there are no labels"""
+
+    def __init__(self, name, help, kind, collect, labels=()):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.label_names = tuple(labels)
+        self.collect = collect
+
+    def samples(self):
+        values = self.collect()
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [(self.name + _labels(list(zip(self.label_names, key))), value)
+                for key, value in sorted(values.items())]
+
+
+class Registry:
+    """Metrics rendered together by /api/metrics"""
+
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f'{metric.name} is already registered')
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def collected(self, name, help, kind, collect, labels=()):
+        return self.register(Collected(name, help, kind, collect, labels))
+
+    def render(self):
+        """Prometheus text exposition format"""
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(f'{name} {value}' for name, value in metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+request_seconds = registry.histogram(
+    'planner_request_seconds', 'Time spent handling requests', ('endpoint',))
+phase_seconds = registry.histogram(
+    'planner_phase_seconds', 'Time spent in each phase of a request', ('endpoint', 'phase'))
+
+calculator_years = registry.counter(
+    'planner_calculator_years_total',
+    'Years projected by RetirementCalculator, in full or filled in after depletion', ('mode',))
+calculator_account_years = registry.counter(
+    'planner_calculator_account_years_total',
+    'Account-years projected by RetirementCalculator', ('type',))
+engine_path_years = registry.counter(
+    'planner_engine_path_years_total', 'Path-years simulated by the projection engine')
+engine_account_years = registry.counter(
+    'planner_engine_account_years_total', 'Path-account-years simulated by the projection engine')
+
+# Read by the calculators before they count anything
+counting = False
+
+
+def enable_counters(enabled=True):
+    global counting
+    counting = bool(enabled)
+
+
+class Timings:
+    """Phase durations of one request, in the order they were first seen"""
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.started = clock()
+        self.phases = {}
+
+    def add(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, name):
+        start = self.clock()
+        try:
+            yield
+        finally:
+            self.add(name, self.clock() - start)
+
+    def elapsed(self):
+        return self.clock() - self.started
+
+    def header(self, total=None):
+        """Server-Timing header value, durations in milliseconds"""
+        entries = list(self.phases.items())
+        if total is not None:
+            entries.append(('total', total))
+        return ', '.join(f'{name};dur={seconds * 1000:.3f}' for name, seconds in entries)
+
+
+class SamplingProfiler:
+    """cProfile for a random share (rate) of requests.
+
+    start() returns a running profile for a sampled request, or None.
+    report() stops it and returns its top functions by own time.
+    """
+
+    def __init__(self, rate=0.0, top=20, random=random.random):
+        self.rate = float(rate)
+        self.top = int(top)
+        self.random = random
+
+    @property
+    def enabled(self):
+        return self.rate > 0
+
+    def start(self):
+        if not self.enabled or self.random() >= self.rate:
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is already active on this thread
+            return None
+        return profile
+
+    def report(self, profile):
+        profile.disable()
+        out = io.StringIO()
+        pstats.Stats(profile, stream=out).sort_stats('tottime').print_stats(self.top)
+        return out.getvalue()
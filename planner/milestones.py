@@ -0,0 +1,96 @@
+"""
+Compiled milestone return tables.
+
+An account's return depends only on how many years remain until retirement,
+through a piecewise-constant milestone rule. MilestoneTable evaluates that
+rule once per config on each stretch of years between the breakpoints of
+all accounts, so the table grows with the number of milestones rather than
+the years they span, and a lookup is a bisect into the breakpoints and an
+index into a list instead of a sort and scan.
+The same table serves every retirement age and scenario, RetirementCalculator,
+ProjectionEngine and the Monte Carlo paths.
+"""
+
+import bisect
+import math
+
+import numpy as np
+
+# Multiple of the milestone std_dev added to the expected return per scenario
+SCENARIO_SHIFTS = {'expected': 0.0, 'best': 1.0, 'worst': -1.0}
+SCENARIOS = tuple(SCENARIO_SHIFTS)
+
+DEFAULT_MILESTONE = {'expected': 5.0, 'std_dev': 1.0}
+
+
+def milestone_for(milestones, years_to_retirement):
+    """Pick the milestone that applies at years_to_retirement"""
+    sorted_milestones = sorted(milestones, key=lambda x: x['years_before'], reverse=True)
+    for milestone in sorted_milestones:
+        if years_to_retirement >= milestone['years_before']:
+            return milestone
+    # Use the most conservative (closest to retirement)
+    return sorted_milestones[-1] if sorted_milestones else DEFAULT_MILESTONE
+
+
+class MilestoneTable:
+    """Per-account expected return and std_dev by years_to_retirement.
+
+    expected and std_dev are (stretches x accounts) arrays as fractions;
+    row() maps a years_to_retirement to its row. Lookups assume integer
+    years_to_retirement, which is all whole-year ages produce.
+    """
+
+    def __init__(self, milestones, account_names):
+        self.account_names = list(account_names)
+        self.columns = {name: j for j, name in enumerate(self.account_names)}
+        # An integer year reaches a milestone once it is at least the
+        # rounded-up years_before; row k covers the years from the k-th
+        # breakpoint to the next, row 0 everything below the first
+        self.breakpoints = sorted({math.ceil(m['years_before']) for name in self.account_names
+                                   for m in milestones.get(name, [])})
+        if self.breakpoints:
+            span = [self.breakpoints[0] - 1] + self.breakpoints
+        else:
+            span = [0]
+        self.size = len(span)
+
+        self.expected = np.empty((self.size, len(self.account_names)))
+        self.std_dev = np.empty((self.size, len(self.account_names)))
+        for j, name in enumerate(self.account_names):
+            account_milestones = milestones.get(name, [])
+            for k, years_to_retirement in enumerate(span):
+                milestone = milestone_for(account_milestones, years_to_retirement)
+                self.expected[k, j] = milestone['expected'] / 100.0
+                self.std_dev[k, j] = milestone['std_dev'] / 100.0
+
+        # Plain float lists per scenario and account for scalar lookups
+        self._rates = {
+            scenario: {
+                name: (self.expected[:, j] + shift * self.std_dev[:, j]).tolist()
+                for j, name in enumerate(self.account_names)
+            }
+            for scenario, shift in SCENARIO_SHIFTS.items()
+        }
+        self._default_rates = {
+            scenario: (DEFAULT_MILESTONE['expected'] + shift * DEFAULT_MILESTONE['std_dev']) / 100.0
+            for scenario, shift in SCENARIO_SHIFTS.items()
+        }
+
+    def row(self, years_to_retirement):
+        """Table row(s) for integer years_to_retirement, scalar or array"""
+        return np.searchsorted(self.breakpoints, years_to_retirement, side='right')
+
+    def rate(self, account_name, years_to_retirement, scenario='expected'):
+        """Return rate for one account and year; unknown scenarios use expected"""
+        if scenario not in self._rates:
+            scenario = 'expected'
+        rates = self._rates[scenario].get(account_name)
+        if rates is None:
+            return self._default_rates[scenario]
+        return rates[bisect.bisect_right(self.breakpoints, years_to_retirement)]
+
+    def moments(self, years_to_retirement):
+        """Expected return and std_dev rows for an array of years_to_retirement"""
+        rows = self.row(years_to_retirement)
+        return self.expected[rows], self.std_dev[rows]
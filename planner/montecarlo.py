@@ -0,0 +1,145 @@
+"""
+Monte Carlo projections.
+
+Each path draws one standard normal shock per year and applies it to every
+account's milestone return (expected + shock * std_dev), the stochastic
+version of the +/- one std_dev best and worst scenarios. All paths for a
+retirement age run through engine.simulate as a single batch.
+"""
+
+import secrets
+
+import numpy as np
+
+from planner import executor
+from planner.engine import ProjectionEngine, compact_config
+
+PERCENTILES = (5, 25, 50, 75, 95)
+
+DEFAULT_PATHS = 1000
+MAX_PATHS = 50000
+
+# Cap on paths x years x accounts per batch so the simulation arrays stay
+# around a hundred MB at most
+CHUNK_ELEMENTS = 2_000_000
+
+# A retired year fails when the portfolio covers less than this much of the
+# requested withdrawal
+SHORTFALL_TOLERANCE = 1.0
+
+
+class MonteCarloError(ValueError):
+    """A Monte Carlo request that cannot be run"""
+
+
+def _whole(options, key, default):
+    value = options.get(key, default)
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise MonteCarloError(f'{key} must be a whole number')
+    return value
+
+
+def prepare(options, seed=None):
+    """(paths, seed) of a request; raises MonteCarloError.
+
+    Both must be JSON integers: true, 3.9 or "42" are rejected rather than
+    coerced. seed is the default seed, None for a random one.
+    """
+    paths = _whole(options, 'paths', DEFAULT_PATHS)
+    if not 1 <= paths <= MAX_PATHS:
+        raise MonteCarloError(f'paths must be between 1 and {MAX_PATHS}')
+    if options.get('seed', seed) is not None:
+        seed = _whole(options, 'seed', seed)
+        if seed < 0:
+            raise MonteCarloError('seed must be non-negative')
+    return paths, seed
+
+
+def chunk_sizes(engine, n_paths):
+    """Split n_paths into batches; depends only on the config so seeds reproduce"""
+    per_path = max(engine.n_years * len(engine.invest_names), 1)
+    size = max(CHUNK_ELEMENTS // per_path, 1)
+    return [min(size, n_paths - start) for start in range(0, n_paths, size)]
+
+
+def simulate_chunk(engine, retirement_ages, n_paths, seed):
+    """Run one batch of paths for every retirement age.
+
+    The same yearly shocks are reused across retirement ages, so differences
+    between ages are not just noise. Returns {retirement_age: (total_portfolio,
+    failure_index)}, where failure_index is the first year the plan could not
+    be funded or -1.
+    """
+    rng = np.random.default_rng(seed)
+    shocks = rng.standard_normal((n_paths, engine.n_years))[:, :, None]
+
+    results = {}
+    for retirement_age in retirement_ages:
+        expected, std_dev = engine.return_moments(retirement_age)
+        run = engine.run(retirement_age, expected + shocks * std_dev)
+        failed = run.total_withdrawal < run.requested - SHORTFALL_TOLERANCE
+        failure_index = np.where(failed.any(axis=1), failed.argmax(axis=1), -1)
+        results[retirement_age] = (engine.total_portfolio(run.balances), failure_index)
+    return results
+
+
+def simulate_chunk_job(config, retirement_ages, n_paths, seed):
+    """Worker entry point for one batch of paths"""
+    return simulate_chunk(ProjectionEngine(config), retirement_ages, n_paths, seed)
+
+
+def summarize(engine, retirement_age, total_portfolio, failure_index):
+    """Success probability, percentile bands and failure-age histogram"""
+    bands = np.percentile(total_portfolio, PERCENTILES, axis=0)
+    retired = engine.ages >= retirement_age
+    counts = np.bincount(failure_index[failure_index >= 0], minlength=engine.n_years)
+
+    return {
+        'retirement_age': retirement_age,
+        'success_probability': float(np.mean(failure_index < 0)),
+        'percentiles': {f'p{p}': band.tolist() for p, band in zip(PERCENTILES, bands)},
+        'failure_ages': {
+            'age': engine.ages[retired].tolist(),
+            'count': counts[retired].tolist(),
+        },
+    }
+
+
+def run_monte_carlo(engine, retirement_ages, n_paths, seed=None, progress=None):
+    """Simulate n_paths random return paths for each retirement age.
+
+    Batches get independent child seeds spawned from one SeedSequence, so the
+    same seed always reproduces the same paths. Without a seed a random one
+    is picked and reported back (53 bits, so it survives a JSON round trip
+    through JavaScript). progress(done, total) is called after each batch.
+    """
+    if seed is None:
+        seed = secrets.randbits(53)
+    seed_sequence = np.random.SeedSequence(seed)
+    sizes = chunk_sizes(engine, n_paths)
+    children = seed_sequence.spawn(len(sizes))
+    if executor.is_parallel():
+        config = compact_config(engine.config)
+        chunks = executor.run_jobs(simulate_chunk_job, [
+            (config, retirement_ages, size, child) for size, child in zip(sizes, children)
+        ], progress)
+    else:
+        chunks = []
+        for size, child in zip(sizes, children):
+            chunks.append(simulate_chunk(engine, retirement_ages, size, child))
+            if progress is not None:
+                progress(len(chunks), len(sizes))
+
+    results = []
+    for retirement_age in retirement_ages:
+        total_portfolio = np.concatenate([chunk[retirement_age][0] for chunk in chunks])
+        failure_index = np.concatenate([chunk[retirement_age][1] for chunk in chunks])
+        results.append(summarize(engine, retirement_age, total_portfolio, failure_index))
+
+    return {
+        'paths': n_paths,
+        'seed': seed,
+        'years': (engine.current_year + np.arange(engine.n_years)).tolist(),
+        'ages': engine.ages.tolist(),
+        'results': results,
+    }
@@ -0,0 +1,91 @@
+"""
+Monthly time step.
+
+With "time_step": "monthly" in the config the engine runs on a grid of
+months instead of years:
+
+- returns compound each month at (1 + r) ** (1/12) of the year's rate, in
+  place of the annual half-year return on contributions;
+- contributions and employer match arrive at the end of each working
+  month, a twelfth of the year's amount each;
+- withdrawals and Social Security are paid monthly, and the withdrawal
+  grows with inflation month by month. Contributions and Social Security
+  still step up each January;
+- events land at the end of December, after that month's withdrawal.
+
+retirement_month (1-12, default 1) is the month of the year the
+retirement age is reached in which contributions stop and withdrawals
+start, so a plan can retire mid-year. The annual time step ignores it.
+
+The month growth factors g are computed once per run from the year's
+rates. Years before the retirement year collapse to one exact step each,
+growing by g**12 = 1 + r with the contributions worth 1 + g + ... + g**11
+times a month's, so the working phase costs what the annual engine does.
+From the retirement year on, planner.engine.simulate_monthly() steps a
+year at a time over every path at once, with that year's months in one
+array: the balances before each month's draw are the year's opening
+balances times powers of g, and the proportional draw only needs the
+per-path scale recurrence of the annual engine, run over months. Results
+come back per year, as December balances and each year's total
+withdrawals, so every caller of the engine sees the same Simulation
+either way.
+
+Only the constant withdrawal strategy with proportional draws and no taxes
+runs monthly; the other strategies and the tax decide a year at a time.
+"""
+
+import numpy as np
+
+from planner.taxes import parse as parse_taxes
+from planner.withdrawals import compile_withdrawals
+
+TIME_STEPS = ('annual', 'monthly')
+MONTHS = 12
+
+
+class MonthlyError(ValueError):
+    """A time_step or retirement_month that cannot be used"""
+
+
+class MonthlyGrid:
+    """Month-level layout of a config's years; see the module docstring"""
+
+    def __init__(self, retirement_month):
+        self.retirement_month = retirement_month
+
+    def working_months(self, retire_index, n_years):
+        """Months worked in each projected year, retirement coming in
+        retirement_month of year retire_index"""
+        months = MONTHS * (retire_index - np.arange(n_years)) + self.retirement_month - 1
+        return np.clip(months, 0, MONTHS)
+
+    def compound(self, rates):
+        """Month growth factors g = (1 + r) ** (1/12) for yearly rates, and
+        their logs; a year that loses everything leaves nothing to compound"""
+        with np.errstate(divide='ignore'):
+            log_growth = np.log1p(np.maximum(rates, -1)) / MONTHS
+        return np.exp(log_growth), log_growth
+
+    def paid_in_factor(self, rates, log_growth, months):
+        """1 + g + ... + g**(months - 1): what 1 paid in at each of months
+        month-ends is worth after the last one"""
+        # (g**months - 1) / (g - 1), in a form that holds up as g nears 1
+        return np.divide(np.expm1(months * log_growth), np.expm1(log_growth),
+                         out=np.full(np.shape(rates), float(months)), where=rates != 0)
+
+
+def compile_monthly(config):
+    """MonthlyGrid for a config, or None on the annual time step; raises
+    MonthlyError"""
+    time_step = config.get('time_step', 'annual')
+    if time_step not in TIME_STEPS:
+        raise MonthlyError(f"time_step must be one of {', '.join(TIME_STEPS)}")
+    month = config.get('retirement_month', 1)
+    if isinstance(month, bool) or not isinstance(month, int) or not 1 <= month <= MONTHS:
+        raise MonthlyError('retirement_month must be a whole number from 1 to 12')
+    if time_step == 'annual':
+        return None
+    if parse_taxes(config.get('taxes')) is not None or compile_withdrawals(config).dynamic:
+        raise MonthlyError('the monthly time_step needs the constant withdrawal strategy '
+                           'with proportional draws and no taxes')
+    return MonthlyGrid(month)
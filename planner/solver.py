@@ -0,0 +1,241 @@
+"""
+Solvers for the inputs users otherwise guess.
+
+max_withdrawal finds the largest target_retirement_income that a plan can
+sustain. earliest_retirement_age finds the first retirement age at which
+the configured target income holds. A plan holds when every retired year's
+withdrawal is fully funded and total_portfolio stays at or above a floor
+through life_expectancy.
+
+The check is either one deterministic scenario (expected, best or worst) or
+a Monte Carlo percentile. Scenario 'p10' asks that the plan hold on at least
+90% of paths drawn as in planner.montecarlo, with a fixed seed so every
+candidate faces the same paths.
+
+Both goals search over or hold to the target income, so they need a
+withdrawal strategy that follows it (constant or guardrails). Both searches
+assume that holding is monotone: a smaller withdrawal or a later retirement
+never makes things worse. The withdrawal search evaluates
+POINTS candidates per round as variants of one batched simulation, so a
+deterministic solve takes about six simulate calls. A Monte Carlo solve
+bisects with one candidate per round instead, because each candidate
+already carries all of its paths. The age search bisects over whole ages.
+
+Candidates are not stopped path by path at their first failure: a
+simulation is vectorized over the years, so cutting one path short saves
+no work. What does stop early is the batch's sequential draw, which ends
+once every path has run out of drawable money (the depletion short-circuit
+of the engine's scale recurrence), and the search, which drops every
+candidate above the first one that fails.
+"""
+
+import re
+from collections import namedtuple
+
+import numpy as np
+
+from planner.milestones import SCENARIOS
+from planner.montecarlo import SHORTFALL_TOLERANCE, MonteCarloError
+from planner.montecarlo import prepare as prepare_paths
+
+GOALS = ('max_withdrawal', 'earliest_retirement_age')
+
+# Candidates per round of the deterministic withdrawal search
+POINTS = 15
+
+# The withdrawal search stops once it is pinned down to this many dollars
+TOLERANCE = 1.0
+
+# Every candidate faces the same paths; paths defaults as in planner.montecarlo
+DEFAULT_SEED = 0
+
+_PERCENTILE = re.compile(r'p(\d{1,2})')
+
+# A checked solve request. percentile is None for a deterministic scenario;
+# paths and seed only apply to Monte Carlo
+Solve = namedtuple(
+    'Solve', 'goal scenario percentile floor retirement_age target_income paths seed')
+
+
+class SolveError(ValueError):
+    """A solve request that cannot be run"""
+
+
+def _number(options, key, default):
+    value = options.get(key, default)
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise SolveError(f'{key} must be a number')
+    return value
+
+
+def _whole(options, key, default):
+    value = options.get(key, default)
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise SolveError(f'{key} must be a whole number')
+    return value
+
+
+def prepare(engine, options):
+    """Check a solve request against a compiled config; raises SolveError"""
+    goal = options.get('goal')
+    if goal not in GOALS:
+        raise SolveError(f"goal must be one of {', '.join(GOALS)}")
+    if engine.n_years == 0:
+        raise SolveError('life_expectancy is before current_age')
+    strategy = engine.withdrawals.strategy
+    if not strategy.follows_target:
+        raise SolveError(f'the {strategy.name} withdrawal strategy does not use '
+                         f'target_retirement_income, so there is no target to solve for')
+
+    scenario = options.get('scenario', 'worst')
+    match = _PERCENTILE.fullmatch(scenario) if isinstance(scenario, str) else None
+    percentile = int(match.group(1)) if match else None
+    if scenario not in SCENARIOS and not (percentile is not None and 1 <= percentile <= 50):
+        raise SolveError(f"scenario must be one of {', '.join(SCENARIOS)} "
+                         f"or a Monte Carlo percentile from p1 to p50")
+
+    floor = _number(options, 'floor', 0)
+    try:
+        paths, seed = prepare_paths(options, DEFAULT_SEED)
+    except MonteCarloError as exc:
+        raise SolveError(str(exc)) from exc
+
+    retirement_age = None
+    target_income = None
+    if goal == 'max_withdrawal':
+        ages = engine.config['retirement_ages']
+        retirement_age = _whole(options, 'retirement_age', ages[0] if ages else None)
+        if not engine.current_age <= retirement_age <= engine.life_expectancy:
+            raise SolveError('retirement_age must be between current_age and life_expectancy')
+    else:
+        target_income = _number(options, 'target_income', engine.target_income)
+    return Solve(goal, scenario, percentile, floor, retirement_age, target_income, paths, seed)
+
+
+def holds(engine, run, retirement_age, floor):
+    """Per path of a run: every retired year funded and above floor"""
+    funded = run.total_withdrawal >= run.requested - SHORTFALL_TOLERANCE
+    above = engine.total_portfolio(run.balances) >= floor
+    retired = engine.ages >= retirement_age
+    return np.all((funded & above)[:, retired], axis=1)
+
+
+class _Checker:
+    """Share of paths on which candidate plans hold, counting evaluations"""
+
+    def __init__(self, engine, plan):
+        self.engine = engine
+        self.plan = plan
+        self.evaluations = 0
+        self.shocks = None
+        if plan.percentile is not None:
+            rng = np.random.default_rng(plan.seed)
+            self.shocks = rng.standard_normal((plan.paths, engine.n_years))[:, :, None]
+
+    @property
+    def required(self):
+        """Share of paths a candidate must hold on"""
+        return 1.0 if self.plan.percentile is None else 1 - self.plan.percentile / 100.0
+
+    def rates(self, retirement_age):
+        if self.shocks is None:
+            return self.engine.scenario_returns(retirement_age, self.plan.scenario)
+        expected, std_dev = self.engine.return_moments(retirement_age)
+        return expected + self.shocks * std_dev
+
+    def run(self, retirement_age, targets):
+        """Simulation of each target on every path, candidates outermost"""
+        rates = self.rates(retirement_age)
+        n_paths = 1 if rates.ndim == 2 else len(rates)
+        if rates.ndim == 3 and len(targets) > 1:
+            rates = np.broadcast_to(rates, (len(targets),) + rates.shape).reshape(
+                (-1,) + rates.shape[1:])
+        self.evaluations += len(targets)
+        return self.engine.run_variants(
+            retirement_age, rates, len(targets) * n_paths,
+            target_income=np.repeat(np.asarray(targets, dtype=float), n_paths))
+
+    def share(self, retirement_age, targets, run=None):
+        """Share of paths each target holds on"""
+        run = run if run is not None else self.run(retirement_age, targets)
+        held = holds(self.engine, run, retirement_age, self.plan.floor)
+        return held.reshape(len(targets), -1).mean(axis=1)
+
+    def feasible(self, retirement_age, targets, run=None):
+        return self.share(retirement_age, targets, run) >= self.required
+
+
+def max_withdrawal(engine, plan):
+    """Largest whole-dollar target_retirement_income that holds, or None"""
+    checker = _Checker(engine, plan)
+    retirement_age = plan.retirement_age
+    first = retirement_age - engine.current_age
+
+    # The smallest candidate also bounds the search: the first retired
+    # year's shortfall can never exceed everything invested that year
+    run = checker.run(retirement_age, [TOLERANCE])
+    if not checker.feasible(retirement_age, [TOLERANCE], run)[0]:
+        return None, checker
+    invested = (run.balances[:, first] + run.withdrawals[:, first]).sum(axis=1).max()
+    low = TOLERANCE
+    # On the monthly time step the first retired year may be a part year
+    retired = 1 - engine.working_share(retirement_age)[first]
+    high = ((invested + engine.ss_schedule(retirement_age)[first]) / retired
+            + SHORTFALL_TOLERANCE + TOLERANCE)
+
+    points = POINTS if checker.shocks is None else 1
+    while high - low > TOLERANCE:
+        candidates = np.linspace(low, high, points + 2)[1:-1]
+        ok = checker.feasible(retirement_age, candidates)
+        n_ok = len(ok) if ok.all() else int(np.argmin(ok))
+        if n_ok:
+            low = candidates[n_ok - 1]
+        if n_ok < len(candidates):
+            high = candidates[n_ok]
+    return int(low), checker
+
+
+def earliest_retirement_age(engine, plan):
+    """First retirement age at which the target income holds, or None"""
+    checker = _Checker(engine, plan)
+    target = [plan.target_income]
+    low, high = engine.current_age, engine.life_expectancy
+    if not checker.feasible(high, target)[0]:
+        return None, checker
+    while low < high:
+        middle = (low + high) // 2
+        if checker.feasible(middle, target)[0]:
+            high = middle
+        else:
+            low = middle + 1
+    return high, checker
+
+
+def run(engine, plan):
+    """Solve a prepared request; see the module docstring"""
+    solve = max_withdrawal if plan.goal == 'max_withdrawal' else earliest_retirement_age
+    value, checker = solve(engine, plan)
+
+    result = {
+        'goal': plan.goal,
+        'scenario': plan.scenario,
+        'floor': plan.floor,
+        plan.goal: value,
+        'evaluations': checker.evaluations,
+    }
+    if plan.goal == 'max_withdrawal':
+        result['retirement_age'] = plan.retirement_age
+    else:
+        result['target_income'] = plan.target_income
+    if plan.percentile is not None:
+        result.update(paths=plan.paths, seed=plan.seed)
+        if value is not None:
+            retirement_age, target = ((plan.retirement_age, value) if plan.goal == 'max_withdrawal'
+                                      else (value, plan.target_income))
+            result['success_probability'] = float(checker.share(retirement_age, [target])[0])
+    return result
+
+
+def solve(engine, options):
+    """prepare() and run() in one go"""
+    return run(engine, prepare(engine, options))
@@ -0,0 +1,235 @@
+"""
+Server-side config storage.
+
+The session cookie only carries a config id. The config itself lives in a
+ConfigStore. A config is validated and compiled into a ProjectionEngine once,
+when it is saved. The compiled form then sits in an in-memory LRU in front of
+the backend, so reading it back costs neither a parse nor a compile.
+
+Ids are a hash of the config's contents, so a stored config never changes
+under its id. Cached entries can never go stale, even with several server
+processes sharing one database, and identical configs share a row. A backend
+is anything with load(id), save(id, config), touch(id) and delete(id).
+SQLiteBackend keeps configs in a single table.
+
+Every edit saves a new row, so rows expire: a config neither saved nor
+used for the backend's ttl is deleted. ConfigStore touches the rows of the
+configs it serves at most once per touch_interval, so a session's config
+stays while the session is in use. A session whose config has gone falls
+back to the defaults.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+from planner.cache import LRUCache, config_hash
+from planner.engine import ProjectionEngine, compact_config
+from planner.monthly import MonthlyError, compile_monthly
+from planner.taxes import TaxError
+from planner.taxes import parse as parse_taxes
+from planner.withdrawals import StrategyError, compile_withdrawals
+
+REQUIRED_KEYS = (
+    'current_age', 'life_expectancy', 'ss_start_age', 'ss_annual',
+    'retirement_ages', 'accounts', 'milestones', 'events',
+)
+
+# Bounds on milestone fields: years_before in years either side of
+# retirement, expected return and std_dev in percent
+MAX_YEARS_BEFORE = 150
+MAX_RETURN = 1000
+
+# A saved config, the projection cache key of its engine inputs and the
+# engine compiled from it; all shared between requests and read-only
+StoredConfig = namedtuple('StoredConfig', 'id config key engine')
+
+
+class ConfigError(ValueError):
+    """A config that cannot be saved"""
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def validate(config):
+    """Check the shape of a config before it is compiled; raises ConfigError"""
+    if not isinstance(config, dict):
+        raise ConfigError('config must be a JSON object')
+    missing = [key for key in REQUIRED_KEYS if key not in config]
+    if missing:
+        raise ConfigError(f"config is missing {', '.join(missing)}")
+    for key in ('current_age', 'life_expectancy', 'ss_start_age'):
+        if not _is_int(config[key]):
+            raise ConfigError(f'{key} must be a whole number')
+    if not _is_number(config['ss_annual']):
+        raise ConfigError('ss_annual must be a number')
+    if not isinstance(config['retirement_ages'], list) or not all(
+            _is_int(age) for age in config['retirement_ages']):
+        raise ConfigError('retirement_ages must be a list of whole numbers')
+    if not isinstance(config['accounts'], list) or not all(
+            isinstance(a, dict) and isinstance(a.get('name'), str) and 'type' in a
+            for a in config['accounts']):
+        raise ConfigError('every account needs a name and a type')
+    if not isinstance(config['milestones'], dict):
+        raise ConfigError('milestones must be an object keyed by account name')
+    for name, milestones in config['milestones'].items():
+        _check_milestones(name, milestones)
+    if not isinstance(config['events'], list) or not all(
+            isinstance(e, dict) and _is_int(e.get('year')) and _is_number(e.get('amount'))
+            and 'account' in e
+            for e in config['events']):
+        raise ConfigError('every event needs a year, an amount and an account')
+    try:
+        compile_withdrawals(config)
+    except StrategyError as exc:
+        raise ConfigError(str(exc)) from exc
+    try:
+        parse_taxes(config.get('taxes'))
+    except TaxError as exc:
+        raise ConfigError(str(exc)) from exc
+    try:
+        compile_monthly(config)
+    except MonthlyError as exc:
+        raise ConfigError(str(exc)) from exc
+
+
+def _check_milestones(name, milestones):
+    if not isinstance(milestones, list) or not all(
+            isinstance(m, dict) and _is_int(m.get('years_before'))
+            and -MAX_YEARS_BEFORE <= m['years_before'] <= MAX_YEARS_BEFORE
+            and _is_number(m.get('expected')) and -100 < m['expected'] <= MAX_RETURN
+            and _is_number(m.get('std_dev')) and 0 <= m['std_dev'] <= MAX_RETURN
+            for m in milestones):
+        raise ConfigError(
+            f'milestones for {name} need whole-number years_before within '
+            f'{MAX_YEARS_BEFORE} of retirement, an expected return above -100 and '
+            f'a std_dev of at least 0, both percentages up to {MAX_RETURN}')
+
+
+def compile_engine(config, tables=None):
+    """Validate a config and compile its ProjectionEngine; raises ConfigError"""
+    validate(config)
+    try:
+        return ProjectionEngine(config, tables)
+    except (KeyError, TypeError, ValueError, IndexError) as exc:
+        raise ConfigError('config could not be compiled') from exc
+
+
+def compile_config(config):
+    """Validate a config and compile it into a StoredConfig"""
+    engine = compile_engine(config)
+    return StoredConfig(config_hash(config), config, config_hash(compact_config(config)), engine)
+
+
+class SQLiteBackend:
+    """Configs as JSON text in one SQLite table.
+
+    A connection must not be used on both sides of a fork, so a forked
+    server worker opens its own on first use. An in-memory database lives
+    in the process, so each worker keeps its own copy of it instead.
+    """
+
+    def __init__(self, path=':memory:', ttl=float('inf'), clock=time.time):
+        self.path = path
+        self.ttl = ttl
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._connect()
+        with self._lock:
+            if path != ':memory:':
+                self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS configs ('
+                'id TEXT PRIMARY KEY, config TEXT NOT NULL, updated REAL NOT NULL)')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS configs_updated ON configs (updated)')
+
+    def _connect(self):
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._pid = os.getpid()
+
+    def _connection(self):
+        """This process's connection; call with the lock held"""
+        if self._pid != os.getpid() and self.path != ':memory:':
+            self._connect()
+        return self._conn
+
+    def load(self, config_id):
+        with self._lock:
+            row = self._connection().execute(
+                'SELECT config FROM configs WHERE id = ?', (config_id,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def save(self, config_id, config):
+        """Store a config and delete the rows that have expired"""
+        payload = json.dumps(config, separators=(',', ':'))
+        now = self.clock()
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                'INSERT INTO configs (id, config, updated) VALUES (?, ?, ?) '
+                'ON CONFLICT(id) DO UPDATE SET updated = excluded.updated',
+                (config_id, payload, now))
+            if self.ttl != float('inf'):
+                conn.execute('DELETE FROM configs WHERE updated < ?', (now - self.ttl,))
+
+    def touch(self, config_id):
+        """Mark a config as in use, restarting its ttl"""
+        with self._lock:
+            self._connection().execute(
+                'UPDATE configs SET updated = ? WHERE id = ?', (self.clock(), config_id))
+
+    def delete(self, config_id):
+        with self._lock:
+            self._connection().execute('DELETE FROM configs WHERE id = ?', (config_id,))
+
+    def __len__(self):
+        with self._lock:
+            return self._connection().execute('SELECT COUNT(*) FROM configs').fetchone()[0]
+
+
+class ConfigStore:
+    """Compiled configs by id: an LRU read-through cache over a backend"""
+
+    def __init__(self, backend, cache_size=256, touch_interval=3600.0):
+        self.backend = backend
+        self.cache = LRUCache(maxsize=cache_size, ttl=float('inf'))
+        # Ids whose rows were touched within the last touch_interval seconds
+        self._touched = LRUCache(maxsize=cache_size, ttl=touch_interval)
+
+    def get(self, config_id):
+        """The StoredConfig saved under config_id, or None; raises
+        ConfigError if the stored config no longer compiles"""
+        stored = self.cache.get(config_id)
+        if stored is None:
+            config = self.backend.load(config_id)
+            if config is None:
+                return None
+            stored = compile_config(config)
+            self.cache.put(config_id, stored)
+        self._touch(config_id)
+        return stored
+
+    def save(self, config):
+        """Validate, compile and store a config; raises ConfigError"""
+        stored = self.cache.get(config_hash(config))
+        if stored is None:
+            stored = compile_config(config)
+            self.backend.save(stored.id, config)
+            self.cache.put(stored.id, stored)
+            self._touched.put(stored.id, True)
+        self._touch(stored.id)
+        return stored
+
+    def _touch(self, config_id):
+        if self._touched.get(config_id) is None:
+            self.backend.touch(config_id)
+            self._touched.put(config_id, True)
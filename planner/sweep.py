@@ -0,0 +1,246 @@
+"""
+Sensitivity sweeps.
+
+A sweep varies one or more config paths over ranges of values. For one
+retirement age and scenario it reports METRICS twice. The tornado moves each
+parameter alone to the low and high end of its range, with the rest of the
+config as saved. The grid covers every combination of values, which makes a
+heatmap for two parameters.
+
+Most inputs worth varying (SCALAR_FIELDS and ACCOUNT_FIELDS of investable
+accounts) only change numbers that feed simulate. Every grid point that agrees on everything else is therefore one
+path of a single ProjectionEngine.run_variants call. Any other path changes
+what the engine compiles. Grid points are grouped by their values for those
+paths, and each group gets its own engine, patched from the base config
+with shared tables.
+"""
+
+import itertools
+from collections import namedtuple
+
+import numpy as np
+
+from planner.batch import PatchError, apply_patch, parse_path
+from planner.compiled import SharedTables
+from planner.milestones import SCENARIOS
+from planner.store import compile_engine
+
+METRICS = ('portfolio_lasts_until_age', 'portfolio_at_85')
+
+MAX_PARAMETERS = 6
+MAX_STEPS = 200
+MAX_POINTS = 10000
+
+# Top-level config keys handled by run_variants, and its argument for each
+SCALAR_FIELDS = {
+    'inflation_rate': 'inflation_rate',
+    'target_retirement_income': 'target_income',
+    'ss_annual': 'ss_annual',
+    'ss_start_age': 'ss_start_age',
+    'salary': 'salary',
+}
+# Investable account fields handled by run_variants
+ACCOUNT_FIELDS = ('current_balance', 'annual_contribution', 'contribution_limit', 'employer_match')
+
+
+# A checked sweep request: (path, values) per parameter, the retirement age
+# and the scenario
+Sweep = namedtuple('Sweep', 'parameters retirement_age scenario')
+
+
+class SweepError(ValueError):
+    """A sweep request that cannot be run"""
+
+
+def _number(value):
+    """Integral floats become ints, so generated ages stay whole numbers"""
+    value = round(float(value), 10)
+    return int(value) if value.is_integer() else value
+
+
+def parameter_values(spec):
+    """(path, values) from {'path', 'values'} or {'path', 'start', 'stop', 'steps'}"""
+    if not isinstance(spec, dict):
+        raise SweepError('each parameter must be an object with a path')
+    path = spec.get('path')
+    try:
+        parse_path(path)
+    except PatchError as exc:
+        raise SweepError(str(exc)) from exc
+    try:
+        if 'values' in spec:
+            values = [_number(value) for value in spec['values']]
+        else:
+            steps = int(spec.get('steps', 11))
+            if not 2 <= steps <= MAX_STEPS:
+                raise SweepError(f'{path}: steps must be between 2 and {MAX_STEPS}')
+            values = [_number(value) for value in
+                      np.linspace(float(spec['start']), float(spec['stop']), steps)]
+    except (KeyError, TypeError, ValueError) as exc:
+        if isinstance(exc, SweepError):
+            raise
+        raise SweepError(f'{path}: give numeric values, or start, stop and steps') from exc
+    if not 1 <= len(values) <= MAX_STEPS:
+        raise SweepError(f'{path}: give between 1 and {MAX_STEPS} values')
+    return path, values
+
+
+def vector_field(config, path):
+    """run_variants argument and investable account index for path, or None"""
+    parts = parse_path(path)
+    if len(parts) == 1 and parts[0] in SCALAR_FIELDS:
+        return SCALAR_FIELDS[parts[0]], None
+    if (len(parts) == 3 and parts[0] == 'accounts' and isinstance(parts[1], int)
+            and parts[2] in ACCOUNT_FIELDS and parts[1] < len(config['accounts'])
+            and config['accounts'][parts[1]]['type'] != 'Real Estate'):
+        return parts[2], config['accounts'][parts[1]]['name']
+    return None
+
+
+def metrics(engine, run):
+    """METRICS per path of a run; portfolio_lasts_until_age is NaN when the
+    portfolio never tops $1000, as Projection.summary reports 'N/A'"""
+    total = engine.total_portfolio(run.balances)
+    above = total > 1000
+    last = total.shape[1] - 1 - np.argmax(above[:, ::-1], axis=1)
+    lasts_until = np.where(above.any(axis=1), engine.ages[last], np.nan)
+    at_85 = np.flatnonzero(engine.ages == 85)
+    portfolio_at_85 = total[:, at_85[0]] if len(at_85) else np.zeros(len(total))
+    return {'portfolio_lasts_until_age': lasts_until, 'portfolio_at_85': portfolio_at_85}
+
+
+def _variant_inputs(engine, fields, patches):
+    """run_variants keyword arguments for the patches of one group"""
+    n = len(patches)
+    config = engine.config
+    defaults = {
+        'inflation_rate': config.get('inflation_rate', 2.5),
+        'target_income': engine.target_income,
+        'ss_annual': engine.ss_annual,
+        'ss_start_age': engine.ss_start_age,
+        'salary': engine.salary,
+    }
+    inputs = {}
+    for path, (name, account) in fields.items():
+        rows = [i for i, patch in enumerate(patches) if path in patch]
+        if not rows:
+            continue
+        values = [patches[i][path] for i in rows]
+        if account is None:
+            array = inputs.setdefault(name, np.full(n, float(defaults[name])))
+            array[rows] = values
+        else:
+            array = inputs.setdefault(name, np.tile(
+                np.array([a[name] for a in engine.invest_accounts], dtype=float), (n, 1)))
+            array[rows, engine.compiled.invest_ids[account]] = values
+    return inputs
+
+
+def evaluate(config, retirement_age, scenario, patches):
+    """METRICS arrays, one entry per patch ({path: value}; missing paths keep
+    the config's value)"""
+    paths = list(dict.fromkeys(path for patch in patches for path in patch))
+    fields = {}
+    for path in paths:
+        field = vector_field(config, path)
+        if field is not None:
+            fields[path] = field
+    structural = [path for path in paths if path not in fields]
+
+    groups = {}
+    for i, patch in enumerate(patches):
+        key = tuple((path, patch[path]) for path in structural if path in patch)
+        groups.setdefault(key, []).append(i)
+
+    results = {metric: np.empty(len(patches)) for metric in METRICS}
+    tables = SharedTables()
+    for key, rows in groups.items():
+        engine = compile_engine(apply_patch(config, dict(key)), tables)
+        inputs = _variant_inputs(engine, fields, [patches[i] for i in rows])
+        run = engine.run_variants(retirement_age, engine.scenario_returns(retirement_age, scenario),
+                                  len(rows), **inputs)
+        for metric, values in metrics(engine, run).items():
+            results[metric][rows] = values
+    return results
+
+
+def _jsonable(values):
+    return [None if np.isnan(v) else (int(v) if float(v).is_integer() else float(v))
+            for v in np.asarray(values, dtype=float).ravel().tolist()]
+
+
+def prepare(config, parameters, retirement_age=None, scenario='expected'):
+    """Check a sweep request against a config; raises SweepError"""
+    if not isinstance(parameters, list) or not 1 <= len(parameters) <= MAX_PARAMETERS:
+        raise SweepError(f'give between 1 and {MAX_PARAMETERS} parameters')
+    swept = [parameter_values(spec) for spec in parameters]
+    paths = [path for path, _ in swept]
+    if len(set(paths)) != len(paths):
+        raise SweepError('each path can only be swept once')
+    try:
+        apply_patch(config, {path: values[0] for path, values in swept})
+    except PatchError as exc:
+        raise SweepError(str(exc)) from exc
+    shape = tuple(len(values) for _, values in swept)
+    if int(np.prod(shape)) > MAX_POINTS:
+        raise SweepError(f'the grid has more than {MAX_POINTS} points')
+    if scenario not in SCENARIOS:
+        raise SweepError(f"scenario must be one of {', '.join(SCENARIOS)}")
+    if retirement_age is None:
+        retirement_age = config['retirement_ages'][0] if config['retirement_ages'] else None
+    if isinstance(retirement_age, bool) or not isinstance(retirement_age, int):
+        raise SweepError('retirement_age must be a whole number')
+    return Sweep(swept, retirement_age, scenario)
+
+
+def run(config, plan):
+    """Tornado and grid of METRICS for a prepared Sweep; see the module docstring.
+
+    Raises ConfigError when a patched config does not compile.
+    """
+    swept, retirement_age, scenario = plan
+    paths = [path for path, _ in swept]
+    shape = tuple(len(values) for _, values in swept)
+
+    # One batch: the saved config, each parameter at both ends, then the grid
+    ends = [(path, min(values), max(values)) for path, values in swept]
+    patches = [{}]
+    for path, low, high in ends:
+        patches += [{path: low}, {path: high}]
+    patches += [dict(zip(paths, combo)) for combo in itertools.product(*(v for _, v in swept))]
+    results = evaluate(config, retirement_age, scenario, patches)
+
+    base = {metric: _jsonable(values[:1])[0] for metric, values in results.items()}
+    tornado = {}
+    for metric, values in results.items():
+        bars = []
+        for k, (path, low, high) in enumerate(ends):
+            low_result, high_result = _jsonable(values[1 + 2 * k:3 + 2 * k])
+            bars.append({'path': path, 'low_value': low, 'high_value': high,
+                         'low': low_result, 'high': high_result})
+        tornado[metric] = sorted(bars, key=lambda bar: -_swing(bar, base[metric]))
+    grid_start = 1 + 2 * len(ends)
+    grid = {metric: np.array(_jsonable(values[grid_start:]), dtype=object).reshape(shape).tolist()
+            for metric, values in results.items()}
+
+    return {
+        'retirement_age': retirement_age,
+        'scenario': scenario,
+        'parameters': [{'path': path, 'values': values} for path, values in swept],
+        'base': base,
+        'tornado': tornado,
+        'grid': grid,
+    }
+
+
+def sweep(config, parameters, retirement_age=None, scenario='expected'):
+    """prepare() and run() in one go"""
+    return run(config, prepare(config, parameters, retirement_age, scenario))
+
+
+def _swing(bar, base):
+    """Spread of a tornado bar; a missing end counts as no change"""
+    ends = [value if value is not None else base for value in (bar['low'], bar['high'])]
+    if None in ends:
+        return 0.0
+    return abs(ends[1] - ends[0])
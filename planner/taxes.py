@@ -0,0 +1,222 @@
+"""
+Federal income tax on retirement withdrawals.
+
+Opt in with a taxes object in the config:
+
+    "taxes": {"filing_status": "married_joint", "taxable_gain_share": 50, "state_rate": 4}
+
+Each retired year is taxed as one return:
+
+- 401k and IRA (and any other type's) withdrawals, net rental income and the taxable part of
+  Social Security are ordinary income, taxed on the ordinary brackets after
+  the standard deduction (with the extra amount for 65 and over).
+- taxable_gain_share percent of a Taxable account withdrawal is a long-term
+  gain, stacked on top of ordinary income in the LTCG brackets. Roth IRA
+  and Savings withdrawals are not taxed.
+- Up to 85% of Social Security is taxable, by the provisional income rules.
+  Those thresholds are fixed in law and not indexed.
+- state_rate is a flat rate on the same taxable income.
+
+Brackets and deductions are TAX_YEAR figures. A TaxTable holds them as
+arrays compiled once per config and indexes them to each year by the
+inflation factor from TAX_YEAR, per path when the paths inflate
+differently. Working years are not taxed: contributions come out of a
+salary the planner does not model.
+
+The withdrawal is grossed up so that what is left after the year's tax
+meets the desired income. Spendable income rises with every dollar drawn
+(the top marginal rate, even with Social Security phasing in, stays well
+below 100%), so gross_up() bisects for it, a fixed GROSS_UP_ITERATIONS
+steps for every path at once, and finishes with one linear step: the tax
+is piecewise linear in the withdrawal.
+"""
+
+import numpy as np
+
+from planner.withdrawals import Proportional
+
+TAX_YEAR = 2025
+
+FILING_STATUSES = ('single', 'married_joint')
+
+# Lower bounds of the ordinary income brackets and their rates
+ORDINARY_BRACKETS = {
+    'single': (0, 11925, 48475, 103350, 197300, 250525, 626350),
+    'married_joint': (0, 23850, 96950, 206700, 394600, 501050, 751600),
+}
+ORDINARY_RATES = (0.10, 0.12, 0.22, 0.24, 0.32, 0.35, 0.37)
+
+# Lower bounds of the 0%, 15% and 20% long-term capital gains brackets
+LTCG_BRACKETS = {
+    'single': (0, 48350, 533400),
+    'married_joint': (0, 96700, 600050),
+}
+LTCG_RATES = (0.0, 0.15, 0.20)
+
+# Standard deduction including the additional amount for filers 65 and
+# over (both spouses when married)
+STANDARD_DEDUCTION = {'single': 15750 + 2000, 'married_joint': 31500 + 2 * 1600}
+
+# Provisional income where 50% and 85% of Social Security become taxable
+SS_THRESHOLDS = {'single': (25000, 34000), 'married_joint': (32000, 44000)}
+
+# Withdrawals from any other investable type are ordinary income
+TAX_FREE_TYPES = ('Roth IRA', 'Savings')
+GAINS_TYPE = 'Taxable'
+
+GROSS_UP_ITERATIONS = 16
+
+# Cap on state_rate, which keeps the marginal share of tax below 100%
+MAX_STATE_RATE = 15
+
+DEFAULTS = {'filing_status': 'single', 'taxable_gain_share': 50.0, 'state_rate': 0.0}
+
+
+class TaxError(ValueError):
+    """A taxes config that cannot be used"""
+
+
+class Brackets:
+    """Progressive rates over brackets starting at lows, with the tax due at
+    each lower bound worked out once"""
+
+    def __init__(self, lows, rates):
+        self.lows = np.asarray(lows, dtype=float)
+        self.rates = np.asarray(rates, dtype=float)
+        self.base = np.concatenate([[0.0], np.cumsum(np.diff(self.lows) * self.rates[:-1])])
+
+    def __call__(self, income):
+        """Tax on income (any shape, non-negative)"""
+        i = np.searchsorted(self.lows, income, side='right') - 1
+        return self.base[i] + self.rates[i] * (income - self.lows[i])
+
+
+class TaxTable:
+    """A config's brackets and account tax treatment; see the module docstring.
+
+    account_types are the investable accounts in engine column order and
+    other_income the net rental income per year, taxed as ordinary income.
+    """
+
+    def __init__(self, spec, account_types, other_income):
+        status = spec['filing_status']
+        self.filing_status = status
+        self.ordinary = Brackets(ORDINARY_BRACKETS[status], ORDINARY_RATES)
+        self.ltcg = Brackets(LTCG_BRACKETS[status], LTCG_RATES)
+        self.deduction = float(STANDARD_DEDUCTION[status])
+        self.ss_thresholds = SS_THRESHOLDS[status]
+        self.state_rate = spec['state_rate'] / 100.0
+        self.other_income = np.asarray(other_income, dtype=float)
+
+        gain_share = spec['taxable_gain_share'] / 100.0
+        self.ordinary_weights = np.array(
+            [0.0 if t in TAX_FREE_TYPES or t == GAINS_TYPE else 1.0 for t in account_types])
+        self.gain_weights = np.array([gain_share if t == GAINS_TYPE else 0.0 for t in account_types])
+        # Highest share of an extra dollar of withdrawal that can go to tax:
+        # the top rates on the dollar and on the 85 cents of Social Security
+        # it can pull in
+        self.max_marginal = 1.85 * (self.ordinary.rates.max() + self.state_rate)
+
+    def tax(self, t, ordinary, gains, ss_income, index):
+        """Tax for year t on ordinary income and gains besides other_income,
+        with ss_income received; index is the inflation factor from TAX_YEAR"""
+        # Brackets scale with the index, so work in TAX_YEAR dollars and
+        # scale the tax back; only the Social Security thresholds move
+        scale = 1 / np.asarray(index, dtype=float)
+        ordinary = (ordinary + self.other_income[t]) * scale
+        gains = gains * scale
+        ss_income = ss_income * scale
+        low, high = self.ss_thresholds[0] * scale, self.ss_thresholds[1] * scale
+        provisional = ordinary + gains + 0.5 * ss_income
+        taxable_ss = np.minimum(
+            0.85 * ss_income,
+            np.minimum(0.5 * np.clip(provisional - low, 0, high - low), 0.5 * ss_income)
+            + 0.85 * np.maximum(provisional - high, 0))
+
+        income = ordinary + taxable_ss
+        taxable_ordinary = np.maximum(income - self.deduction, 0)
+        taxable = taxable_ordinary + np.maximum(gains - np.maximum(self.deduction - income, 0), 0)
+        # Gains sit on top of ordinary income in the LTCG brackets
+        owed = (self.ordinary(taxable_ordinary) + self.ltcg(taxable) - self.ltcg(taxable_ordinary)
+                + self.state_rate * taxable)
+        return owed / scale
+
+    def tax_on(self, t, drawn, ss_income, index):
+        """Tax for year t on (paths x accounts) withdrawals"""
+        return self.tax(t, drawn @ self.ordinary_weights, drawn @ self.gain_weights,
+                        ss_income, index)
+
+    def gross_up(self, t, pre, mask, needed, ss_income, index, order):
+        """Withdrawal that leaves needed (per path) after year t's tax.
+
+        pre are the (paths x accounts) balances before the withdrawal, mask
+        the accessible accounts and order the draw order. Returns (amount,
+        drawn, tax, requested): what is drawn, by account, the tax, and the
+        gross withdrawal the year called for, which is more than amount
+        when the accessible balance falls short.
+        """
+        accessible = np.maximum((pre * mask).sum(axis=-1), 0)
+        if isinstance(order, Proportional):
+            # Proportional draws split any amount the same way, so the tax
+            # only needs each account's share of a dollar
+            unit = order.draw(pre, mask, np.ones_like(accessible))
+            ordinary, gains = unit @ self.ordinary_weights, unit @ self.gain_weights
+
+            def tax_at(amount):
+                return self.tax(t, ordinary * amount, gains * amount, ss_income, index)
+        else:
+            def tax_at(amount):
+                return self.tax_on(t, order.draw(pre, mask, amount), ss_income, index)
+
+        # Tax never falls as more is drawn, so needed plus the tax on nothing
+        # more is a floor, and the marginal rate bounds the climb from there
+        low = np.minimum(needed + tax_at(np.zeros_like(accessible)), accessible)
+        net_low = low - tax_at(low)
+        high = np.minimum(low + np.maximum(needed - net_low, 0) / (1 - self.max_marginal),
+                          accessible)
+        net_high = high - tax_at(high)
+        feasible = net_high >= needed
+        for _ in range(GROSS_UP_ITERATIONS):
+            middle = (low + high) / 2
+            net = middle - tax_at(middle)
+            enough = net >= needed
+            high, net_high = np.where(enough, middle, high), np.where(enough, net, net_high)
+            low, net_low = np.where(enough, low, middle), np.where(enough, net_low, net)
+
+        # Tax is piecewise linear in the amount, so unless a bracket edge
+        # falls inside what is left of the interval this lands on the answer
+        span = net_high - net_low
+        share = np.divide(needed - net_low, span, out=np.ones_like(span), where=span > 0)
+        amount = np.where(feasible, low + np.clip(share, 0, 1) * (high - low), accessible)
+        tax = tax_at(amount)
+        requested = np.where(feasible, amount, needed + tax)
+        return amount, order.draw(pre, mask, amount), tax, requested
+
+
+def parse(spec):
+    """Checked taxes config with defaults filled in, or None when taxes are off;
+    raises TaxError"""
+    if spec is None or spec is False:
+        return None
+    if not isinstance(spec, dict):
+        raise TaxError('taxes must be an object')
+    unknown = set(spec) - set(DEFAULTS)
+    if unknown:
+        raise TaxError(f"taxes does not take {', '.join(sorted(unknown))}")
+    spec = {**DEFAULTS, **spec}
+    if spec['filing_status'] not in FILING_STATUSES:
+        raise TaxError(f"taxes filing_status must be one of {', '.join(FILING_STATUSES)}")
+    for key, top in (('taxable_gain_share', 100), ('state_rate', MAX_STATE_RATE)):
+        value = spec[key]
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not 0 <= value <= top:
+            raise TaxError(f'taxes {key} must be a percentage between 0 and {top}')
+    return spec
+
+
+def compile_taxes(config, other_income):
+    """TaxTable for a config and its net rental income per year, or None"""
+    spec = parse(config.get('taxes'))
+    if spec is None:
+        return None
+    types = [a['type'] for a in config['accounts'] if a['type'] != 'Real Estate']
+    return TaxTable(spec, types, other_income)
@@ -0,0 +1,230 @@
+"""
+Withdrawal strategies.
+
+A config's withdrawal_strategy picks how much to withdraw each retired year
+and in what order to draw it from the accessible accounts:
+
+    "withdrawal_strategy": {"type": "guardrails", "order": "ordered"}
+
+Types (parameters in percent, defaults in brackets):
+
+- constant: the first year's withdrawal grown with inflation. This is the
+  default and the only type the engine's closed-form draw handles.
+- fixed_percent: rate [4] of the investable balance every year.
+- vpw: variable percentage withdrawal. The balance is paid out as an
+  annuity at return_rate [4], one payment per year left to
+  life_expectancy with the first one this year.
+- guardrails: Guyton-Klinger. The withdrawal grows with inflation except
+  after a losing year with the rate above its initial rate. It is cut by
+  adjustment [10] when the withdrawal rate rises more than upper [20]
+  above the initial rate (not in the final FINAL_YEARS years), and raised
+  by adjustment when it falls more than lower [20] below it.
+
+Orders:
+
+- proportional: every accessible account gives up the same share (default).
+- ordered: taxable accounts and savings first, then 401k and IRA, then
+  Roth IRA. Accounts within a tier give up the same share.
+
+As before, the amount is the desired income and Social Security covers part
+of it. constant and guardrails start from target_retirement_income
+(follows_target); fixed_percent and vpw do not use it. Every method works on whole batches: arrays over paths, or over
+paths and accounts, so a dynamic strategy costs one vectorized step per
+retired year in Monte Carlo and sweeps. RetirementCalculator calls the same
+methods with plain floats for one path.
+"""
+
+from collections import namedtuple
+from types import MappingProxyType
+
+import numpy as np
+
+# Guardrail cuts stop this many years before life_expectancy
+FINAL_YEARS = 15
+
+# Draw tier of each account type under the ordered draw; other types sit
+# with the tax-deferred accounts
+ORDER_TIERS = {'Taxable': 0, 'Savings': 0, '401k': 1, 'IRA': 1, 'Roth IRA': 2}
+DEFAULT_TIER = 1
+
+# What a strategy sees in one retired year, per path. initial and
+# initial_invested are the first retired year's withdrawal and investable
+# balance, previous last year's withdrawal (initial in the first year),
+# invested this year's investable balance before the withdrawal and growth
+# the factor the investable balance grew by this year (1 in the first year).
+# years_left counts this year
+Retired = namedtuple(
+    'Retired', 'initial initial_invested previous invested growth years_retired years_left')
+
+
+class StrategyError(ValueError):
+    """A withdrawal_strategy that cannot be used"""
+
+
+class Constant:
+    """The first year's withdrawal grown with inflation"""
+
+    name = 'constant'
+    params = MappingProxyType({})
+    follows_target = True
+
+    def amount(self, retired, inflation_rate):
+        return retired.initial * ((1 + inflation_rate) ** retired.years_retired)
+
+
+class FixedPercent:
+    """A fixed share of the investable balance"""
+
+    name = 'fixed_percent'
+    params = MappingProxyType({'rate': 4.0})
+    follows_target = False
+
+    def __init__(self, rate):
+        self.rate = rate / 100.0
+
+    def amount(self, retired, inflation_rate):
+        return np.maximum(retired.invested, 0) * self.rate
+
+
+class VPW:
+    """The investable balance paid out as an annuity over the years left"""
+
+    name = 'vpw'
+    params = MappingProxyType({'return_rate': 4.0})
+    follows_target = False
+
+    def __init__(self, return_rate):
+        self.return_rate = return_rate / 100.0
+
+    def payout_rate(self, years_left):
+        """Share of the balance paid this year, the first of years_left
+        payments; the last year pays out everything"""
+        r = self.return_rate
+        if r == 0:
+            return 1.0 / years_left
+        return r / ((1 + r) * (1 - (1 + r) ** -years_left))
+
+    def amount(self, retired, inflation_rate):
+        return np.maximum(retired.invested, 0) * self.payout_rate(retired.years_left)
+
+
+class Guardrails:
+    """Guyton-Klinger decision rules around the initial withdrawal rate"""
+
+    name = 'guardrails'
+    params = MappingProxyType({'upper': 20.0, 'lower': 20.0, 'adjustment': 10.0})
+    follows_target = True
+
+    def __init__(self, upper, lower, adjustment):
+        self.upper = upper / 100.0
+        self.lower = lower / 100.0
+        self.adjustment = adjustment / 100.0
+
+    def amount(self, retired, inflation_rate):
+        if retired.years_retired == 0:
+            return retired.initial
+        invested = np.maximum(retired.invested, 0)
+        initial_rate = _rate(retired.initial, retired.initial_invested)
+        # No raise for inflation after a losing year while above the initial rate
+        frozen = (retired.growth < 1) & (_rate(retired.previous, invested) > initial_rate)
+        amount = np.where(frozen, retired.previous, retired.previous * (1 + inflation_rate))
+
+        rate = _rate(amount, invested)
+        cut = rate > initial_rate * (1 + self.upper)
+        if retired.years_left <= FINAL_YEARS:
+            cut = False
+        boost = rate < initial_rate * (1 - self.lower)
+        return amount * np.where(cut, 1 - self.adjustment, np.where(boost, 1 + self.adjustment, 1.0))
+
+
+def _rate(amount, balance):
+    """amount / balance, infinite where the balance is gone"""
+    amount, balance = np.asarray(amount, dtype=float), np.asarray(balance, dtype=float)
+    return np.divide(amount, balance, out=np.full(np.broadcast(amount, balance).shape, np.inf),
+                     where=balance > 0)
+
+
+class Proportional:
+    """Every accessible account with a positive balance gives up the same share"""
+
+    name = 'proportional'
+
+    def draw(self, pre, mask, amount):
+        """Withdrawals from pre (paths x accounts) balances, mask the accessible
+        accounts, amount (paths,) the total to draw"""
+        accessible = (pre * mask).sum(axis=-1)
+        share = np.divide(amount, accessible, out=np.zeros_like(accessible), where=accessible > 0)
+        return pre * (mask * (pre > 0)) * share[..., None]
+
+
+class Ordered:
+    """Tiers drawn one after another, proportionally within a tier"""
+
+    name = 'ordered'
+
+    def __init__(self, account_types):
+        tiers = np.array([ORDER_TIERS.get(t, DEFAULT_TIER) for t in account_types])
+        self.tiers = [(tiers == tier).astype(float) for tier in sorted(set(tiers.tolist()))]
+
+    def draw(self, pre, mask, amount):
+        positive = np.where(pre > 0, pre, 0.0) * mask
+        drawn = np.zeros_like(positive)
+        remaining = np.maximum(amount, 0)
+        for tier in self.tiers:
+            available = positive @ tier
+            take = np.minimum(remaining, available)
+            share = np.divide(take, available, out=np.zeros_like(available), where=available > 0)
+            drawn += positive * tier * share[..., None]
+            remaining = remaining - take
+        return drawn
+
+
+STRATEGIES = {cls.name: cls for cls in (Constant, FixedPercent, VPW, Guardrails)}
+ORDERS = ('proportional', 'ordered')
+
+
+class Withdrawals:
+    """The strategy and draw order of one config"""
+
+    def __init__(self, strategy, order):
+        self.strategy = strategy
+        self.order = order
+
+    @property
+    def dynamic(self):
+        """Whether the engine has to step through retired years one at a time"""
+        return not (isinstance(self.strategy, Constant) and isinstance(self.order, Proportional))
+
+
+def parse(spec, account_types):
+    """Withdrawals for a config's withdrawal_strategy (None for the default)
+    and its investable account types; raises StrategyError"""
+    spec = {} if spec is None else spec
+    if not isinstance(spec, dict):
+        raise StrategyError('withdrawal_strategy must be an object with a type')
+    kind = spec.get('type', 'constant')
+    if kind not in STRATEGIES:
+        raise StrategyError(f"withdrawal_strategy type must be one of {', '.join(STRATEGIES)}")
+    order = spec.get('order', 'proportional')
+    if order not in ORDERS:
+        raise StrategyError(f"withdrawal_strategy order must be one of {', '.join(ORDERS)}")
+
+    cls = STRATEGIES[kind]
+    unknown = set(spec) - {'type', 'order'} - set(cls.params)
+    if unknown:
+        raise StrategyError(f"{kind} does not take {', '.join(sorted(unknown))}")
+    params = {}
+    for key, default in cls.params.items():
+        value = spec.get(key, default)
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not 0 <= value <= 100:
+            raise StrategyError(f'{kind} {key} must be a percentage between 0 and 100')
+        params[key] = float(value)
+
+    return Withdrawals(cls(**params),
+                       Ordered(account_types) if order == 'ordered' else Proportional())
+
+
+def compile_withdrawals(config):
+    """Withdrawals of a config, for its investable accounts in config order"""
+    types = [a['type'] for a in config['accounts'] if a['type'] != 'Real Estate']
+    return parse(config.get('withdrawal_strategy'), types)
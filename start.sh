@@ -1,19 +1,25 @@
 #!/bin/bash
 
 # Retirement Planner Web App - Startup Script
+#
+#   ./start.sh          serve with gunicorn (see gunicorn.conf.py)
+#   ./start.sh --dev    run the Flask development server instead
 
 echo "🚀 Starting Retirement Planner Web App..."
 echo ""
-echo "The app will be available at: http://localhost:5000"
+echo "The app will be available at: http://localhost:${PORT:-5005}"
 echo ""
 echo "Press Ctrl+C to stop the server"
 echo ""
 
-# Check if Flask is installed
-if ! python3 -c "import flask" 2>/dev/null; then
-    echo "Flask not found. Installing dependencies..."
+# Check if Flask and gunicorn are installed
+if ! python3 -c "import flask, gunicorn" 2>/dev/null; then
+    echo "Flask or gunicorn not found. Installing dependencies..."
     pip install -r requirements.txt --break-system-packages
 fi
 
-# Start the Flask app
-python3 app.py
+if [ "$1" = "--dev" ]; then
+    python3 app.py
+else
+    exec python3 -m gunicorn -c gunicorn.conf.py
+fi
@@ -338,7 +338,7 @@ function renderMilestones() {
                 <div class="form-grid">
                     <div class="form-group">
                         <label>Years Before Retirement</label>
-                        <input type="number" value="${milestone.years_before}" onchange="updateMilestone('${accountName}', ${idx}, 'years_before', parseFloat(this.value))">
+                        <input type="number" step="1" value="${milestone.years_before}" onchange="updateMilestone('${accountName}', ${idx}, 'years_before', parseInt(this.value, 10))">
                     </div>
                     <div class="form-group">
                         <label>Expected Return (%)</label>
@@ -508,7 +508,8 @@ async function saveConfig() {
     });
 
     if (!response.ok) {
-        alert('Error saving configuration. Please try again.');
+        const result = await response.json().catch(() => ({}));
+        alert(result.error ? `Error saving configuration: ${result.error}` : 'Error saving configuration. Please try again.');
         return false;
     }
     return true;
@@ -518,12 +519,8 @@ async function calculateResults() {
     const saved = await saveConfig();
     if (!saved) return;
 
+    // The results page fetches its own (binary) results for the saved config
     document.getElementById('loading').style.display = 'flex';
-
-    const response = await fetch('/api/calculate', { method: 'POST' });
-    const results = await response.json();
-
-    sessionStorage.setItem('results', JSON.stringify(results));
     window.location.href = '/results';
 }
 
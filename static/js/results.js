@@ -1,24 +1,100 @@
 // Results page JavaScript
 
 let results = null;
+const projectionCache = new Map();
 let portfolioChart = null;
 let incomeChart = null;
 
-document.addEventListener('DOMContentLoaded', () => {
-    loadResults();
-    setupEventListeners();
-    renderDashboard();
-    renderProjections();
-});
+document.addEventListener('DOMContentLoaded', loadResults);
 
-function loadResults() {
-    const stored = sessionStorage.getItem('results');
-    if (!stored) {
-        alert('No results found. Please run calculations first.');
+// Summaries stream in one NDJSON line per projection, so the dashboard fills
+// in as they are computed; each projection's detail is fetched the first
+// time it is viewed
+async function loadResults() {
+    const response = await fetch('/api/calculate', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ lazy: true, stream: true })
+    });
+    if (!response.ok) {
+        alert('Calculation failed. Please check your configuration.');
         window.location.href = '/';
         return;
     }
-    results = JSON.parse(stored);
+    await readLines(response, message => {
+        if (message.type === 'start') {
+            results = { result: message.result, retirement_ages: message.retirement_ages, summary: [] };
+            setupEventListeners();
+        } else if (message.type === 'projection') {
+            results.summary.push(message.summary);
+            results.summary.sort((a, b) => a.retirement_age - b.retirement_age);
+            renderDashboard();
+            if (message.retirement_age === parseInt(document.getElementById('retirement-age-select').value)
+                && message.scenario === document.getElementById('scenario-detail-select').value) {
+                renderProjections();
+            }
+        } else if (message.type === 'error') {
+            alert('Calculation failed. Please check your configuration.');
+        }
+    });
+}
+
+// Call onMessage with each JSON line of the response body as it arrives
+async function readLines(response, onMessage) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffered = '';
+    for (;;) {
+        const { done, value } = await reader.read();
+        buffered += decoder.decode(value || new Uint8Array(), { stream: !done });
+        const lines = buffered.split('\n');
+        buffered = lines.pop();
+        lines.filter(line => line.trim()).forEach(line => onMessage(JSON.parse(line)));
+        if (done) break;
+    }
+    if (buffered.trim()) onMessage(JSON.parse(buffered));
+}
+
+async function loadProjection(retirementAge, scenario) {
+    const key = `${retirementAge}/${scenario}`;
+    if (!projectionCache.has(key)) {
+        const response = await fetch(`/api/results/${results.result}/${key}?format=binary`);
+        if (!response.ok) {
+            alert('These results have expired. Please run calculations again.');
+            window.location.href = '/';
+            return null;
+        }
+        projectionCache.set(key, decodeResults(await response.arrayBuffer()));
+    }
+    return projectionCache.get(key);
+}
+
+// Binary /api/calculate payload: uint32 header length, JSON header, then
+// float columns starting on an 8-byte boundary. Every field becomes a typed
+// array view over the response buffer, so nothing is copied.
+function decodeResults(buffer) {
+    const headerLength = new DataView(buffer).getUint32(0, true);
+    const header = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 4, headerLength)));
+    const ArrayType = header.dtype === 'float32' ? Float32Array : Float64Array;
+    const nYears = header.years.length;
+    const rowBytes = nYears * ArrayType.BYTES_PER_ELEMENT;
+    const dataStart = 4 + headerLength;
+
+    const projections = {};
+    header.projections.forEach(entry => {
+        const columns = {};
+        Object.entries(header.layout).forEach(([field, [start, count]]) => {
+            const rows = [];
+            for (let i = 0; i < count; i++) {
+                const offset = dataStart + entry.offset + (start + i) * rowBytes;
+                rows.push(new ArrayType(buffer, offset, nYears));
+            }
+            columns[field] = header.series.includes(field) ? rows[0] : rows;
+        });
+        projections[entry.retirement_age] = projections[entry.retirement_age] || {};
+        projections[entry.retirement_age][entry.scenario] = columns;
+    });
+    return { ...header, projections };
 }
 
 function setupEventListeners() {
@@ -27,7 +103,7 @@ function setupEventListeners() {
     document.getElementById('scenario-detail-select').addEventListener('change', renderProjections);
     
     // Populate retirement age dropdown
-    const retirementAges = Object.keys(results.projections).map(Number).sort((a, b) => a - b);
+    const retirementAges = [...new Set(results.retirement_ages)].sort((a, b) => a - b);
     const select = document.getElementById('retirement-age-select');
     retirementAges.forEach(age => {
         const option = document.createElement('option');
@@ -76,32 +152,34 @@ function renderDashboard() {
     renderInsights();
 }
 
-function renderProjections() {
+async function renderProjections() {
     const retirementAge = parseInt(document.getElementById('retirement-age-select').value);
     const scenario = document.getElementById('scenario-detail-select').value;
     
-    const projections = results.projections[retirementAge][scenario];
+    const detail = await loadProjection(retirementAge, scenario);
+    // Skip if the selection changed while this one was loading
+    if (!detail
+        || parseInt(document.getElementById('retirement-age-select').value) !== retirementAge
+        || document.getElementById('scenario-detail-select').value !== scenario) return;
+    const columns = detail.projections[retirementAge][scenario];
     
     // Update charts
-    updatePortfolioChart(projections);
-    updateIncomeChart(projections);
+    updatePortfolioChart(detail, columns);
+    updateIncomeChart(detail, columns, retirementAge);
     
     // Update table
-    updateProjectionTable(projections);
+    updateProjectionTable(detail, columns);
 }
 
-function updatePortfolioChart(projections) {
+function updatePortfolioChart(detail, columns) {
     const ctx = document.getElementById('portfolio-chart').getContext('2d');
     
     if (portfolioChart) {
         portfolioChart.destroy();
     }
     
-    // Get account names from first projection
-    const accountNames = Object.keys(projections[0].balances);
-    
     // Prepare datasets for each account
-    const datasets = accountNames.map((name, index) => {
+    const datasets = detail.accounts.map((name, index) => {
         const colors = [
             '#4472C4', '#ED7D31', '#A5A5A5', '#FFC000', '#5B9BD5',
             '#70AD47', '#264478', '#9E480E', '#636363', '#997300'
@@ -109,7 +187,7 @@ function updatePortfolioChart(projections) {
         
         return {
             label: name,
-            data: projections.map(p => p.balances[name]),
+            data: columns.balances[index],
             borderColor: colors[index % colors.length],
             backgroundColor: colors[index % colors.length] + '33',
             fill: false
@@ -119,7 +197,7 @@ function updatePortfolioChart(projections) {
     portfolioChart = new Chart(ctx, {
         type: 'line',
         data: {
-            labels: projections.map(p => p.year),
+            labels: detail.years,
             datasets: datasets
         },
         options: {
@@ -163,7 +241,7 @@ function updatePortfolioChart(projections) {
     });
 }
 
-function updateIncomeChart(projections) {
+function updateIncomeChart(detail, columns, retirementAge) {
     const ctx = document.getElementById('income-chart').getContext('2d');
     
     if (incomeChart) {
@@ -171,26 +249,27 @@ function updateIncomeChart(projections) {
     }
     
     // Show all years from retirement onward
-    const retirementProjections = projections.filter(p => p.years_to_retirement <= 0);
+    let retired = detail.ages.findIndex(age => age >= retirementAge);
+    if (retired < 0) retired = detail.ages.length;
     
     incomeChart = new Chart(ctx, {
         type: 'bar',
         data: {
-            labels: retirementProjections.map(p => p.year),
+            labels: detail.years.slice(retired),
             datasets: [
                 {
                     label: 'Portfolio Withdrawal',
-                    data: retirementProjections.map(p => p.withdrawal),
+                    data: columns.withdrawal.subarray(retired),
                     backgroundColor: '#4472C4'
                 },
                 {
                     label: 'Social Security',
-                    data: retirementProjections.map(p => p.ss_income),
+                    data: columns.ss_income.subarray(retired),
                     backgroundColor: '#70AD47'
                 },
                 {
                     label: 'Real Estate Income',
-                    data: retirementProjections.map(p => p.real_estate_income || 0),
+                    data: columns.real_estate_income.subarray(retired),
                     backgroundColor: '#ED7D31'
                 }
             ]
@@ -235,24 +314,25 @@ function updateIncomeChart(projections) {
     });
 }
 
-function updateProjectionTable(projections) {
+function updateProjectionTable(detail, columns) {
     const tbody = document.getElementById('projection-table-body');
     tbody.innerHTML = '';
     
-    projections.forEach(proj => {
+    detail.years.forEach((year, i) => {
         const row = document.createElement('tr');
         row.innerHTML = `
-            <td>${proj.year}</td>
-            <td>${proj.age}</td>
-            <td>${formatCurrency(proj.total_portfolio)}</td>
-            <td>${formatCurrency(proj.withdrawal)}</td>
-            <td>${formatCurrency(proj.ss_income)}</td>
-            <td>${formatCurrency(proj.real_estate_income || 0)}</td>
-            <td><strong>${formatCurrency(proj.total_income)}</strong></td>
+            <td>${year}</td>
+            <td>${detail.ages[i]}</td>
+            <td>${formatCurrency(columns.total_portfolio[i])}</td>
+            <td>${formatCurrency(columns.withdrawal[i])}</td>
+            <td>${formatCurrency(columns.ss_income[i])}</td>
+            <td>${formatCurrency(columns.real_estate_income[i])}</td>
+            <td>${formatCurrency(columns.taxes[i])}</td>
+            <td><strong>${formatCurrency(columns.total_income[i])}</strong></td>
         `;
         
         // Highlight when portfolio is depleted
-        if (proj.total_portfolio < 1000 && proj.withdrawal > 0) {
+        if (columns.total_portfolio[i] < 1000 && columns.withdrawal[i] > 0) {
             row.style.background = '#fff3cd';
             row.style.fontWeight = 'bold';
         }
@@ -318,6 +398,7 @@ function renderInsights() {
     
     // Income comparison
     const incomeRange = expectedSummary.map(s => s.avg_annual_income);
+    if (incomeRange.length === 0) return;
     const minIncome = Math.min(...incomeRange);
     const maxIncome = Math.max(...incomeRange);
     
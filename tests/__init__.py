@@ -0,0 +1,5 @@
+import os
+
+# Keep stored configs in memory rather than in configs.db. Set here, before
+# conftest or any test module imports the app
+os.environ.setdefault("CONFIG_DB", ":memory:")
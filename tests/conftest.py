@@ -1,6 +1,10 @@
 import pytest
-from app import app as flask_app
 
+from app import create_app
+
+flask_app = create_app()
+# The app's projection cache, config store and job queue
+stores = flask_app.extensions["planner"]
 
 MINIMAL_CONFIG = {
     "current_age": 40,
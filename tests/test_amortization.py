@@ -0,0 +1,110 @@
+"""Tests for closed-form mortgage amortization and property schedules."""
+import numpy as np
+import pytest
+from planner.amortization import amortize, payoff_month, property_schedule
+
+
+def monthly_loop(account, n_years):
+    """The month-by-month amortization RetirementCalculator used to run"""
+    prop_value = account.get("property_value", 0)
+    mort_balance = account.get("mortgage_balance", 0)
+    monthly_rate = account.get("mortgage_rate", 0) / 100.0 / 12
+    payment = account.get("mortgage_payment", 0)
+    appreciation_rate = account.get("appreciation_rate", 0) / 100.0
+    rows = []
+    for _ in range(n_years):
+        prop_value *= (1 + appreciation_rate)
+        paid = 0
+        for _ in range(12):
+            if mort_balance <= 0:
+                break
+            interest = mort_balance * monthly_rate
+            principal = min(payment - interest, mort_balance)
+            principal = max(principal, 0)
+            mort_balance -= principal
+            paid += interest + principal
+        mort_balance = max(0, mort_balance)
+        net_income = 0
+        if account.get("real_estate_mode", "asset") == "income":
+            net_income = account.get("monthly_rent", 0) * 12 - paid - account.get("property_tax", 0)
+        rows.append((prop_value, mort_balance, paid, net_income))
+    return [np.array(column) for column in zip(*rows)]
+
+
+def house(**overrides):
+    account = {
+        "name": "House", "type": "Real Estate", "property_value": 500000,
+        "mortgage_balance": 300000, "mortgage_rate": 6.0, "mortgage_payment": 2500,
+        "property_tax": 4000, "monthly_rent": 3000, "appreciation_rate": 3,
+        "real_estate_mode": "income",
+    }
+    account.update(overrides)
+    return account
+
+
+# ---------------------------------------------------------------------------
+# Parity with the monthly loop
+# ---------------------------------------------------------------------------
+
+class TestPropertySchedule:
+    @pytest.mark.parametrize("overrides", [
+        {},
+        {"mortgage_payment": 9000},                        # paid off mid-horizon
+        {"mortgage_rate": 0.0, "mortgage_payment": 1000},  # interest-free
+        {"mortgage_payment": 1000},                        # never covers the interest
+        {"mortgage_balance": 0},
+        {"mortgage_balance": 1000, "mortgage_payment": 5000},  # paid off in month one
+        {"real_estate_mode": "asset"},
+        {"appreciation_rate": -2},
+        {"mortgage_rate": 0.0, "mortgage_payment": 0},
+    ])
+    def test_matches_monthly_loop(self, overrides):
+        account = house(**overrides)
+        value, mortgage, paid, net_income = monthly_loop(account, 40)
+        schedule = property_schedule(account, 40)
+        assert schedule.value == pytest.approx(value, rel=1e-12)
+        assert schedule.mortgage_balance == pytest.approx(mortgage, rel=1e-9, abs=1e-6)
+        assert schedule.payments == pytest.approx(paid, rel=1e-9, abs=1e-6)
+        assert schedule.net_income == pytest.approx(net_income, rel=1e-9, abs=1e-6)
+        assert schedule.equity == pytest.approx(value - mortgage, rel=1e-9, abs=1e-6)
+
+    def test_payoff_year_from_schedule(self):
+        schedule = property_schedule(house(mortgage_payment=9000), 40)
+        payoff_year = (schedule.payoff_month - 1) // 12
+        assert schedule.mortgage_balance[payoff_year] == 0
+        assert schedule.mortgage_balance[payoff_year - 1] > 0
+
+    def test_negative_rate_does_not_hang(self):
+        schedule = property_schedule(house(mortgage_rate=-1.0, mortgage_payment=0), 10)
+        assert np.all(np.diff(schedule.mortgage_balance) < 0)
+        assert schedule.payoff_month is None
+
+
+# ---------------------------------------------------------------------------
+# amortize() pieces
+# ---------------------------------------------------------------------------
+
+class TestAmortize:
+    def test_interest_plus_principal_is_payment(self):
+        result = amortize(200000, 0.05 / 12, 1500, 5)
+        assert result.interest + result.principal == pytest.approx(np.full(5, 18000))
+
+    def test_principal_sums_to_balance_once_paid_off(self):
+        result = amortize(50000, 0.04 / 12, 2000, 5)
+        assert result.principal.sum() == pytest.approx(50000)
+        assert result.balance[-1] == 0
+
+    def test_payment_below_interest_never_pays_off(self):
+        result = amortize(100000, 0.06 / 12, 400, 3)
+        assert result.payoff_month is None
+        assert result.interest == pytest.approx([6000] * 3)
+
+    @pytest.mark.parametrize("balance, rate, payment", [
+        (300000, 0.005, 2500), (1000, 0.01, 1010), (12000, 0.0, 1000), (12001, 0.0, 1000),
+    ])
+    def test_payoff_month(self, balance, rate, payment):
+        months, remaining = 0, balance
+        while remaining > 0:
+            remaining = remaining * (1 + rate) - payment
+            months += 1
+        assert payoff_month(balance, rate, payment) == months
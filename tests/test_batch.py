@@ -0,0 +1,99 @@
+"""Tests for batch evaluation of many plans."""
+import copy
+
+import pytest
+from planner import batch
+from planner.batch import PatchError, apply_patch, parse_path
+from planner.compiled import SharedTables
+from planner.engine import ProjectionEngine
+from tests.conftest import MINIMAL_CONFIG
+from tests.test_engine import full_config
+
+
+class TestPatch:
+    @pytest.mark.parametrize("path, parts", [
+        ("ss_start_age", ["ss_start_age"]),
+        ("accounts[0].annual_contribution", ["accounts", 0, "annual_contribution"]),
+        ("milestones.401k[1].expected", ["milestones", "401k", 1, "expected"]),
+    ])
+    def test_parse_path(self, path, parts):
+        assert parse_path(path) == parts
+
+    @pytest.mark.parametrize("path", ["", ".a", "a..b", "a[x]", "a[0", "[0]"])
+    def test_rejects_bad_paths(self, path):
+        with pytest.raises(PatchError):
+            parse_path(path)
+
+    def test_sets_values_without_touching_base(self):
+        base = copy.deepcopy(MINIMAL_CONFIG)
+        patched = apply_patch(base, {"accounts[1].current_balance": 1, "ss_annual": 2})
+        assert patched["accounts"][1]["current_balance"] == 1
+        assert patched["ss_annual"] == 2
+        assert base == MINIMAL_CONFIG
+
+    def test_untouched_parts_are_shared(self):
+        base = copy.deepcopy(MINIMAL_CONFIG)
+        patched = apply_patch(base, {"accounts[1].current_balance": 1})
+        assert patched["accounts"][0] is base["accounts"][0]
+        assert patched["accounts"][1] is not base["accounts"][1]
+        assert patched["milestones"] is base["milestones"]
+
+    @pytest.mark.parametrize("patch", [
+        {"accounts[5].current_balance": 1},
+        {"nothing.here": 1},
+        {"ss_annual.value": 1},
+        {"accounts[2]": {}},
+        ["ss_annual"],
+    ])
+    def test_rejects_bad_patches(self, patch):
+        with pytest.raises(PatchError):
+            apply_patch(MINIMAL_CONFIG, patch)
+
+
+class TestSharedTables:
+    def test_patched_configs_share_tables(self):
+        base = full_config()
+        tables = SharedTables()
+        first = ProjectionEngine(apply_patch(base, {"ss_annual": 1}), tables)
+        second = ProjectionEngine(apply_patch(base, {"accounts[0].annual_contribution": 1}), tables)
+        assert second.returns is first.returns
+        assert second.compiled is first.compiled
+        # The milestone table is rebuilt only when milestones change
+        third = ProjectionEngine(apply_patch(base, {"milestones.401k[0].expected": 1}), tables)
+        assert third.returns is not first.returns
+        assert third.compiled is first.compiled
+
+    def test_listed_configs_are_interned(self):
+        configs = batch.intern_shared([full_config(), full_config()])
+        assert configs[0]["milestones"] is configs[1]["milestones"]
+        assert configs[0]["events"] is configs[1]["events"]
+        assert configs[0]["accounts"][-1] is configs[1]["accounts"][-1]
+
+    def test_shared_tables_give_the_same_projections(self):
+        config = apply_patch(full_config(), {"ss_start_age": 70})
+        shared = ProjectionEngine(config, SharedTables()).project(62, "worst")
+        assert shared == ProjectionEngine(copy.deepcopy(config)).project(62, "worst")
+
+
+class TestRunBatch:
+    def test_results_follow_plan_order(self, monkeypatch):
+        monkeypatch.setattr(batch, "CHUNK_PLANS", 2)
+        patches = [{"ss_annual": 1000 * i} for i in range(5)]
+        results = batch.run_batch(patches, MINIMAL_CONFIG)
+        assert [r["index"] for r in results] == list(range(5))
+        for patch, result in zip(patches, results):
+            engine = ProjectionEngine(apply_patch(MINIMAL_CONFIG, patch))
+            expected = [engine.project_arrays(65, scenario).summary()
+                        for scenario in ("expected", "best", "worst")]
+            assert result["summary"] == pytest.approx(expected)
+
+    def test_bad_plans_get_errors(self):
+        results = batch.run_batch([MINIMAL_CONFIG, {"current_age": 40}])
+        assert "summary" in results[0]
+        assert "missing" in results[1]["error"]
+
+    def test_progress_per_chunk(self, monkeypatch):
+        monkeypatch.setattr(batch, "CHUNK_PLANS", 2)
+        calls = []
+        batch.run_batch([{}] * 5, MINIMAL_CONFIG, progress=lambda *p: calls.append(p))
+        assert calls == [(1, 3), (2, 3), (3, 3)]
@@ -0,0 +1,79 @@
+"""Tests for the benchmark harness (not the timings themselves)."""
+import threading
+
+import pytest
+from app import RetirementCalculator
+from benchmarks.configs import synthetic_config
+from benchmarks.loadtest import run_load, summarize
+from benchmarks.run import BENCHMARKS, compare, load_baseline, measure, run_matrix, save_baseline
+from planner.engine import ProjectionEngine
+from tests.conftest import flask_app
+from tests.test_engine import assert_projections_match
+
+
+class TestSyntheticConfig:
+    def test_sizes(self):
+        config = synthetic_config(accounts=7, horizon=30, ages=4, events=12, properties=2)
+        assert len(config["accounts"]) == 9
+        assert config["life_expectancy"] - config["current_age"] + 1 == 30
+        assert len(set(config["retirement_ages"])) == 4
+        assert len(config["events"]) == 12
+
+    def test_deterministic(self):
+        assert synthetic_config(seed=3) == synthetic_config(seed=3)
+
+    def test_engine_matches_calculator(self):
+        config = synthetic_config(accounts=6, horizon=40, ages=2, events=30, properties=3)
+        for retirement_age in config["retirement_ages"]:
+            expected = RetirementCalculator(config).project_scenario(retirement_age, "worst")
+            actual = ProjectionEngine(config).project(retirement_age, "worst")
+            assert_projections_match(actual, expected)
+
+
+class TestHarness:
+    def test_measure_is_per_call(self):
+        calls = []
+        seconds = measure(lambda: calls.append(1), repeat=2, min_time=0.001)
+        assert 0 < seconds < 0.001
+        assert len(calls) > 2
+
+    def test_compare_flags_regressions(self):
+        rows = compare({"a:x": 2.0, "b:x": 1.0, "c:x": 1.0}, {"a:x": 1.0, "b:x": 1.0}, 1.25)
+        assert [(key, regressed) for key, *_, regressed in rows] == [
+            ("a:x", True), ("b:x", False), ("c:x", False)]
+        assert rows[2][3] is None
+
+    def test_baseline_round_trip(self, tmp_path):
+        path = tmp_path / "baseline.json"
+        assert load_baseline(str(path)) == {}
+        save_baseline(str(path), {"base:engine": 0.5})
+        assert load_baseline(str(path)) == {"base:engine": 0.5}
+
+    def test_run_matrix_filter(self):
+        reported = []
+        results = run_matrix("horizon-10:", repeat=1, min_time=0.0, report=reported.append)
+        assert list(results) == [f"horizon-10:{name}" for name in BENCHMARKS]
+        assert len(reported) == len(BENCHMARKS)
+        assert all(seconds > 0 for seconds in results.values())
+        assert list(run_matrix("horizon-10:project", repeat=1, min_time=0.0,
+                               report=reported.append)) == ["horizon-10:project_scenario"]
+
+
+class TestLoadTest:
+    def test_summarize(self):
+        result = summarize([0.01 * i for i in range(1, 101)], 2.0, 3)
+        assert result["requests"] == 100 and result["errors"] == 3
+        assert result["rps"] == 50
+        assert result["p50_ms"] == pytest.approx(510)
+        assert result["p99_ms"] == pytest.approx(1000)
+
+    def test_run_load(self):
+        from werkzeug.serving import make_server
+        server = make_server("127.0.0.1", 0, flask_app, threaded=True)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            result = run_load(f"http://127.0.0.1:{server.port}", clients=2, duration=0.3, configs=2)
+        finally:
+            server.shutdown()
+        assert result["requests"] > 0 and result["errors"] == 0
@@ -0,0 +1,105 @@
+"""Tests for the projection result cache."""
+import copy
+
+from planner.cache import LRUCache, config_hash
+from tests.conftest import MINIMAL_CONFIG, stores
+from tests.test_routes import set_session_config
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+# ---------------------------------------------------------------------------
+# config_hash
+# ---------------------------------------------------------------------------
+
+class TestConfigHash:
+    def test_key_order_does_not_matter(self):
+        reordered = dict(reversed(list(MINIMAL_CONFIG.items())))
+        assert config_hash(reordered) == config_hash(MINIMAL_CONFIG)
+
+    def test_float_noise_and_integral_floats_normalize(self):
+        noisy = copy.deepcopy(MINIMAL_CONFIG)
+        noisy["inflation_rate"] = 2.5000000000001
+        noisy["current_age"] = 40.0
+        assert config_hash(noisy) == config_hash(MINIMAL_CONFIG)
+
+    def test_real_changes_change_the_hash(self):
+        changed = copy.deepcopy(MINIMAL_CONFIG)
+        changed["accounts"][0]["annual_contribution"] += 1
+        assert config_hash(changed) != config_hash(MINIMAL_CONFIG)
+
+
+# ---------------------------------------------------------------------------
+# LRUCache
+# ---------------------------------------------------------------------------
+
+class TestLRUCache:
+    def test_counts_hits_and_misses(self):
+        cache = LRUCache(maxsize=4)
+        assert cache.get("a") is None
+        cache.put("a", 1)
+        assert cache.get("a") == 1
+        stats = cache.stats()
+        assert (stats["hits"], stats["misses"]) == (1, 1)
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(maxsize=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.stats()["evictions"] == 1
+
+    def test_entries_expire_after_ttl(self):
+        clock = FakeClock()
+        cache = LRUCache(maxsize=2, ttl=10, clock=clock)
+        cache.put("a", 1)
+        clock.now = 10
+        assert cache.get("a") == 1
+        clock.now = 10.5
+        assert cache.get("a") is None
+        assert len(cache) == 0
+        assert cache.stats()["expirations"] == 1
+
+
+# ---------------------------------------------------------------------------
+# /api/calculate with the cache
+# ---------------------------------------------------------------------------
+
+class TestCalculateCache:
+    def test_repeat_request_is_served_from_cache(self, client):
+        stores.projection_cache.clear()
+        set_session_config(client, MINIMAL_CONFIG)
+        first = client.post("/api/calculate").get_json()
+        misses = stores.projection_cache.misses
+        second = client.post("/api/calculate").get_json()
+        assert stores.projection_cache.misses == misses
+        assert first == second
+
+    def test_new_retirement_age_only_projects_new_jobs(self, client):
+        stores.projection_cache.clear()
+        set_session_config(client, MINIMAL_CONFIG)
+        client.post("/api/calculate")
+        size = len(stores.projection_cache)
+
+        config = copy.deepcopy(MINIMAL_CONFIG)
+        config["retirement_ages"] = MINIMAL_CONFIG["retirement_ages"] + [60]
+        set_session_config(client, config)
+        misses = stores.projection_cache.misses
+        data = client.post("/api/calculate").get_json()
+        assert stores.projection_cache.misses - misses == 3
+        assert len(stores.projection_cache) == size + 3
+        assert set(data["projections"]) == {"60", "65"}
+
+    def test_stats_endpoint(self, client):
+        response = client.get("/api/cache/stats")
+        assert response.status_code == 200
+        assert {"hits", "misses", "size", "maxsize", "ttl"} <= response.get_json().keys()
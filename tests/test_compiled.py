@@ -0,0 +1,71 @@
+"""Tests for the compiled config indexes."""
+import numpy as np
+import pytest
+from app import RetirementCalculator
+from benchmarks.configs import synthetic_config
+from planner.compiled import EARLY, FULL, PRE_SS, CompiledConfig, access_phase
+from planner.engine import ProjectionEngine
+from tests.test_engine import assert_projections_match, full_config
+
+
+@pytest.fixture
+def compiled():
+    return CompiledConfig(full_config())
+
+
+class TestCompiledConfig:
+    def test_account_ids_follow_config_order(self, compiled):
+        config = full_config()
+        assert compiled.names == [a["name"] for a in config["accounts"]]
+        assert compiled.ids["Rental"] == len(config["accounts"]) - 2
+        assert "Rental" not in compiled.invest_ids
+        assert compiled.re_names == {"Rental", "Home"}
+        assert compiled.excluded_names == {"Home"}
+
+    @pytest.mark.parametrize("age, phase", [(45, EARLY), (59, EARLY), (60, PRE_SS), (67, FULL)])
+    def test_access_phase(self, age, phase):
+        assert access_phase(age, 67) == phase
+
+    def test_phase_names_and_masks_agree(self, compiled):
+        assert compiled.accessible_names(50, 67) == ("Roth IRA", "Taxable Brokerage", "Savings")
+        assert compiled.accessible_names(62, 67) == tuple(compiled.invest_names)
+        for names, mask in zip(compiled.phase_names, compiled.phase_masks):
+            assert [n for n, m in zip(compiled.invest_names, mask) if m] == list(names)
+
+    def test_events_indexed_by_year_and_account(self, compiled):
+        config = full_config()
+        assert sum(len(events) for events in compiled.events_by_year.values()) == len(config["events"])
+        assert [e["description"] for e in compiled.events_in(2040)] == ["New roof"]
+        assert compiled.events_in(1999) == []
+        assert [e["year"] for e in compiled.events_by_account["Roth IRA"]] == [2070]
+        assert compiled.last_invest_event_year == 2070
+
+
+class TestCalculatorUsesIndexes:
+    def test_projection_does_not_rescan_config(self):
+        config = full_config()
+        calc = RetirementCalculator(config)
+        expected = calc.project_scenario(60)
+        calc.config = dict(config, events=None)
+        assert calc.project_scenario(60) == expected
+
+    def test_thousands_of_events(self):
+        # Monthly cash flows over the whole horizon
+        config = synthetic_config(accounts=6, horizon=45, ages=1, events=0, properties=2)
+        names = [a["name"] for a in config["accounts"]]
+        config["events"] = [
+            {"year": 2025 + month // 12, "description": f"Flow {month}",
+             "amount": 500 if month % 3 else -800, "account": names[month % len(names)]}
+            for month in range(45 * 12)
+        ]
+        retirement_age = config["retirement_ages"][0]
+        expected = RetirementCalculator(config).project_scenario(retirement_age, "best")
+        actual = ProjectionEngine(config).project(retirement_age, "best")
+        assert_projections_match(actual, expected)
+        assert sum(len(p["events"]) for p in expected) == 45 * 12
+
+    def test_engine_access_matches_phase_masks(self):
+        engine = ProjectionEngine(full_config())
+        for age, row in zip(engine.ages, engine.access):
+            phase = access_phase(age, engine.ss_start_age)
+            assert np.array_equal(row, engine.compiled.phase_masks[phase])
@@ -0,0 +1,111 @@
+"""Tests for the columnar and binary /api/calculate encodings."""
+import numpy as np
+import pytest
+from planner.encoding import SERIES, columnar, layout, pack, unpack
+from planner.engine import SCENARIOS, ProjectionEngine
+from tests.conftest import MINIMAL_CONFIG
+from tests.test_engine import full_config
+from tests.test_routes import set_session_config
+
+
+@pytest.fixture
+def engine():
+    return ProjectionEngine(full_config())
+
+
+@pytest.fixture
+def projections(engine):
+    return [engine.project_arrays(age, scenario) for age in (55, 67) for scenario in SCENARIOS]
+
+
+def assert_columns_match_dicts(fields, meta, dicts):
+    """Check one projection's columns against its year-by-year dicts"""
+    for name in SERIES:
+        assert fields[name] == pytest.approx([p[name] for p in dicts])
+    for row, name in zip(fields["balances"], meta["accounts"]):
+        assert row == pytest.approx([p["balances"][name] for p in dicts])
+    for row, name in zip(fields["withdrawal_by_account"], meta["invest_accounts"]):
+        assert row == pytest.approx([p["withdrawal_by_account"].get(name, 0) for p in dicts])
+    for row, name in zip(fields["contributions"], meta["invest_accounts"]):
+        assert row == pytest.approx([p["contributions"].get(name, 0) for p in dicts])
+    for row, name in zip(fields["employer_match"], meta["match_accounts"]):
+        assert row == pytest.approx([p["employer_match"].get(name, 0) for p in dicts])
+
+
+# ---------------------------------------------------------------------------
+# Encoders
+# ---------------------------------------------------------------------------
+
+class TestColumnar:
+    def test_round_trips_to_dicts(self, engine, projections):
+        data = columnar(engine, projections, [])
+        assert data["years"] == [p["year"] for p in projections[0].to_dicts()]
+        assert data["events"] == [p["events"] for p in projections[0].to_dicts()]
+        for projection in projections:
+            fields = data["projections"][projection.retirement_age][projection.scenario]
+            assert_columns_match_dicts(fields, data, projection.to_dicts())
+
+
+class TestBinary:
+    def test_matches_columnar(self, engine, projections):
+        header, blocks = unpack(pack(engine, projections, []))
+        data = columnar(engine, projections, [])
+        for entry, block in zip(header["projections"], blocks):
+            fields = data["projections"][entry["retirement_age"]][entry["scenario"]]
+            for name, (start, count) in header["layout"].items():
+                rows = block[start:start + count]
+                expected = [fields[name]] if name in SERIES else fields[name]
+                assert np.array_equal(rows, np.array(expected).reshape(rows.shape))
+
+    def test_columns_are_eight_byte_aligned(self, engine, projections):
+        payload = pack(engine, projections, [])
+        length = int.from_bytes(payload[:4], "little")
+        assert (4 + length) % 8 == 0
+        header, blocks = unpack(payload)
+        assert [entry["offset"] for entry in header["projections"]] == [
+            i * blocks[0].nbytes for i in range(len(projections))]
+
+    def test_float32_halves_the_columns(self, engine, projections):
+        header64, blocks64 = unpack(pack(engine, projections, [], "float64"))
+        header32, blocks32 = unpack(pack(engine, projections, [], "float32"))
+        assert (header64["dtype"], header32["dtype"]) == ("float64", "float32")
+        assert header32["layout"] == header64["layout"]
+        assert blocks32.nbytes * 2 == blocks64.nbytes
+        assert np.allclose(blocks32, blocks64, rtol=1e-6)
+
+    def test_layout_rows(self, engine):
+        rows = layout(engine)
+        assert rows["balances"] == [len(SERIES), len(engine.account_names)]
+        assert rows["employer_match"][1] == 1
+
+
+# ---------------------------------------------------------------------------
+# POST /api/calculate with a format
+# ---------------------------------------------------------------------------
+
+class TestCalculateFormats:
+    def test_columnar_is_smaller_with_same_summary(self, client):
+        set_session_config(client, full_config())
+        default = client.post("/api/calculate")
+        compact = client.post("/api/calculate", json={"format": "columnar"})
+        assert compact.status_code == 200
+        assert compact.get_json()["summary"] == default.get_json()["summary"]
+        assert len(compact.data) * 2 < len(default.data)
+        packed = client.post("/api/calculate", json={"format": "binary", "dtype": "float32"})
+        assert len(packed.data) * 5 < len(default.data)
+
+    def test_binary_response(self, client):
+        set_session_config(client, MINIMAL_CONFIG)
+        response = client.post("/api/calculate", json={"format": "binary", "dtype": "float32"})
+        assert response.status_code == 200
+        assert response.mimetype == "application/octet-stream"
+        header, blocks = unpack(response.data)
+        assert blocks.dtype == np.float32
+        assert [(p["retirement_age"], p["scenario"]) for p in header["projections"]] == [
+            (65, scenario) for scenario in SCENARIOS]
+
+    @pytest.mark.parametrize("options", [{"format": "xml"}, {"format": "binary", "dtype": "int8"}])
+    def test_rejects_unknown_options(self, client, options):
+        response = client.post("/api/calculate", json=options)
+        assert response.status_code == 400
+        assert "error" in response.get_json()
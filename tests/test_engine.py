@@ -0,0 +1,378 @@
+"""Tests for the vectorized ProjectionEngine."""
+import copy
+import pickle
+
+import numpy as np
+import pytest
+from app import RetirementCalculator, get_default_config
+from planner.engine import ProjectionEngine
+from tests.conftest import MINIMAL_CONFIG
+
+
+RENTAL = {
+    "name": "Rental",
+    "type": "Real Estate",
+    "property_value": 400000,
+    "mortgage_balance": 250000,
+    "mortgage_rate": 6.5,
+    "mortgage_payment": 1900,
+    "property_tax": 5000,
+    "monthly_rent": 2800,
+    "appreciation_rate": 3,
+    "real_estate_mode": "income",
+}
+
+HOME = {
+    "name": "Home",
+    "type": "Real Estate",
+    "property_value": 600000,
+    "mortgage_balance": 300000,
+    "mortgage_rate": 3.0,
+    "mortgage_payment": 2500,
+    "appreciation_rate": 3,
+    "real_estate_mode": "asset",
+    "exclude_from_portfolio": True,
+}
+
+
+def full_config():
+    """Default config plus real estate, retirement-age events and a target income."""
+    config = get_default_config()
+    config["accounts"] += [dict(RENTAL), dict(HOME)]
+    config["events"] += [
+        {"year": 2070, "description": "Inheritance", "amount": 100000, "account": "Roth IRA"},
+        {"year": 2040, "description": "New roof", "amount": -20000, "account": "Home"},
+        {"year": 2041, "description": "Unknown account", "amount": 5000, "account": "Nope"},
+    ]
+    config["target_retirement_income"] = 90000
+    return config
+
+
+def assert_projections_match(actual, expected):
+    assert len(actual) == len(expected)
+    for got, want in zip(actual, expected):
+        assert got.keys() == want.keys()
+        for key, value in want.items():
+            if isinstance(value, dict):
+                assert got[key].keys() == value.keys(), key
+                for name in value:
+                    assert got[key][name] == pytest.approx(value[name], rel=1e-9, abs=1e-6)
+            elif isinstance(value, float):
+                assert got[key] == pytest.approx(value, rel=1e-9, abs=1e-6), key
+            else:
+                assert got[key] == value, key
+
+
+# ---------------------------------------------------------------------------
+# Parity with RetirementCalculator.project_scenario
+# ---------------------------------------------------------------------------
+
+class TestParity:
+    @pytest.mark.parametrize("scenario", ["expected", "best", "worst"])
+    @pytest.mark.parametrize("retirement_age", [40, 55, 65, 67, 75])
+    def test_minimal_config(self, retirement_age, scenario):
+        config = copy.deepcopy(MINIMAL_CONFIG)
+        expected = RetirementCalculator(config).project_scenario(retirement_age, scenario)
+        actual = ProjectionEngine(config).project(retirement_age, scenario)
+        assert_projections_match(actual, expected)
+
+    @pytest.mark.parametrize("scenario", ["expected", "best", "worst"])
+    @pytest.mark.parametrize("retirement_age", [35, 55, 62, 67])
+    def test_real_estate_and_events(self, retirement_age, scenario):
+        config = full_config()
+        expected = RetirementCalculator(config).project_scenario(retirement_age, scenario)
+        actual = ProjectionEngine(config).project(retirement_age, scenario)
+        assert_projections_match(actual, expected)
+
+    def test_four_percent_rule(self):
+        config = full_config()
+        config["target_retirement_income"] = 0
+        expected = RetirementCalculator(config).project_scenario(60)
+        actual = ProjectionEngine(config).project(60)
+        assert_projections_match(actual, expected)
+
+    def test_negative_balance_is_never_drawn(self):
+        config = full_config()
+        config["events"].append(
+            {"year": 2027, "description": "Overdraft", "amount": -400000, "account": "Savings"})
+        expected = RetirementCalculator(config).project_scenario(55, "worst")
+        actual = ProjectionEngine(config).project(55, "worst")
+        assert_projections_match(actual, expected)
+
+    @pytest.mark.parametrize("retirement_age", [30, 95])
+    def test_retirement_outside_horizon(self, retirement_age):
+        config = copy.deepcopy(MINIMAL_CONFIG)
+        expected = RetirementCalculator(config).project_scenario(retirement_age)
+        actual = ProjectionEngine(config).project(retirement_age)
+        assert_projections_match(actual, expected)
+
+
+STRATEGIES = [
+    {"type": "fixed_percent", "rate": 5},
+    {"type": "vpw"},
+    {"type": "guardrails"},
+    {"type": "guardrails", "upper": 5, "lower": 5, "order": "ordered"},
+    {"order": "ordered"},
+]
+
+
+class TestWithdrawalStrategies:
+    @pytest.mark.parametrize("scenario", ["expected", "worst"])
+    @pytest.mark.parametrize("retirement_age", [30, 55, 62, 67])
+    @pytest.mark.parametrize("strategy", STRATEGIES)
+    def test_parity(self, strategy, retirement_age, scenario):
+        config = full_config()
+        config["withdrawal_strategy"] = strategy
+        expected = RetirementCalculator(config).project_scenario(retirement_age, scenario)
+        actual = ProjectionEngine(config).project(retirement_age, scenario)
+        assert_projections_match(actual, expected)
+
+    @pytest.mark.parametrize("strategy", STRATEGIES)
+    def test_batched_paths_match_single_runs(self, strategy):
+        config = full_config()
+        config["withdrawal_strategy"] = strategy
+        engine = ProjectionEngine(config)
+        expected, std_dev = engine.return_moments(60)
+        shocks = np.random.default_rng(0).standard_normal((6, engine.n_years, 1))
+        rates = expected + shocks * std_dev
+        batch = engine.run(60, rates)
+        for i in range(len(rates)):
+            single = engine.run(60, rates[i])
+            np.testing.assert_allclose(batch.balances[i], single.balances[0], rtol=1e-12)
+
+    def test_ordered_draws_taxable_before_roth(self):
+        config = full_config()
+        config["withdrawal_strategy"] = {"order": "ordered"}
+        projection = ProjectionEngine(config).project(60)
+        year = next(p for p in projection if p["age"] == 60)
+        assert year["withdrawal_by_account"]["Taxable Brokerage"] > 0
+        assert year["withdrawal_by_account"]["Roth IRA"] == 0
+
+
+TAXES = [
+    {},
+    {"filing_status": "married_joint", "taxable_gain_share": 80, "state_rate": 5},
+]
+
+
+class TestTaxes:
+    @pytest.mark.parametrize("scenario", ["expected", "worst"])
+    @pytest.mark.parametrize("retirement_age", [30, 55, 62, 67])
+    @pytest.mark.parametrize("taxes", TAXES)
+    def test_parity(self, taxes, retirement_age, scenario):
+        config = full_config()
+        config["taxes"] = taxes
+        expected = RetirementCalculator(config).project_scenario(retirement_age, scenario)
+        actual = ProjectionEngine(config).project(retirement_age, scenario)
+        assert_projections_match(actual, expected)
+
+    @pytest.mark.parametrize("strategy", [STRATEGIES[2], STRATEGIES[3]])
+    def test_parity_with_strategies(self, strategy):
+        config = full_config()
+        config["taxes"] = {"state_rate": 3}
+        config["withdrawal_strategy"] = strategy
+        expected = RetirementCalculator(config).project_scenario(60, "worst")
+        actual = ProjectionEngine(config).project(60, "worst")
+        assert_projections_match(actual, expected)
+
+    def test_income_after_tax_meets_the_target(self):
+        config = full_config()
+        config["taxes"] = {"filing_status": "married_joint"}
+        engine = ProjectionEngine(config)
+        projection = engine.project_arrays(65)
+        retired = engine.ages >= 65
+        taxes = projection.run.taxes[0]
+        assert np.all(taxes[retired] > 0) and np.all(taxes[~retired] == 0)
+        np.testing.assert_allclose(
+            projection.total_income[retired] - engine.real_estate_income[retired],
+            90000 * engine.inflation[retired] / engine.inflation[65 - engine.current_age],
+            rtol=1e-6)
+
+    def test_batched_paths_match_single_runs(self):
+        config = full_config()
+        config["taxes"] = {"taxable_gain_share": 100}
+        engine = ProjectionEngine(config)
+        expected, std_dev = engine.return_moments(60)
+        shocks = np.random.default_rng(1).standard_normal((6, engine.n_years, 1))
+        rates = expected + shocks * std_dev
+        batch = engine.run(60, rates)
+        for i in range(len(rates)):
+            single = engine.run(60, rates[i])
+            np.testing.assert_allclose(batch.balances[i], single.balances[0], rtol=1e-12)
+            np.testing.assert_allclose(batch.taxes[i], single.taxes[0], rtol=1e-12)
+
+
+class TestYearViews:
+    @pytest.mark.parametrize("retirement_age", [35, 60, 95])
+    def test_views_equal_dicts(self, retirement_age):
+        projection = ProjectionEngine(full_config()).project_arrays(retirement_age, "worst")
+        dicts = projection.to_dicts()
+        assert len(projection) == len(dicts)
+        assert list(projection) == dicts
+        assert projection[-1] == dicts[-1]
+        assert list(projection[0]) == list(dicts[0])
+        with pytest.raises(IndexError):
+            projection[len(dicts)]
+        with pytest.raises(KeyError):
+            projection[0]["nope"]
+
+    def test_dicts_are_not_kept(self):
+        projection = ProjectionEngine(full_config()).project_arrays(60)
+        assert not hasattr(projection, "__dict__")
+        assert projection.to_dicts() is not projection.to_dicts()
+
+    def test_pickles_without_engine(self):
+        engine = ProjectionEngine(full_config())
+        projection = engine.project_arrays(60)
+        restored = pickle.loads(pickle.dumps(projection))
+        assert restored.engine is None
+        restored.engine = engine
+        assert restored.to_dicts() == projection.to_dicts()
+
+
+# ---------------------------------------------------------------------------
+# Depleted portfolios
+# ---------------------------------------------------------------------------
+
+def depleting_config():
+    """full_config with a target income it runs out of well before 90"""
+    return dict(full_config(), target_retirement_income=250000)
+
+
+class TestDepletion:
+    @pytest.mark.parametrize("retirement_age, scenario", [
+        (55, "expected"), (55, "worst"), (55, "best"), (62, "worst"),
+    ])
+    def test_short_circuit_matches_full_loop(self, retirement_age, scenario):
+        config = depleting_config()
+        fast = RetirementCalculator(config).project_scenario(retirement_age, scenario)
+        slow_calc = RetirementCalculator(config)
+        # No year is past the last investable event, so every year runs in full
+        slow_calc.compiled.last_invest_event_year = 10 ** 6
+        assert fast == slow_calc.project_scenario(retirement_age, scenario)
+        assert fast[-1]["total_portfolio"] == fast[-1]["balances"]["Rental"]
+        assert_projections_match(ProjectionEngine(config).project(retirement_age, scenario), fast)
+
+    def test_events_after_depletion_refill(self):
+        config = depleting_config()
+        projections = RetirementCalculator(config).project_scenario(55)
+        by_year = {p["year"]: p for p in projections}
+        assert by_year[2069]["balances"]["Roth IRA"] == 0
+        assert by_year[2070]["withdrawal_by_account"]["Roth IRA"] > 0
+
+    @pytest.mark.parametrize("config", [full_config(), depleting_config()])
+    def test_summary_only(self, config):
+        calc = RetirementCalculator(config)
+        summary = calc.project_scenario(55, "worst", summary_only=True)
+        expected = ProjectionEngine(config).project_arrays(55, "worst").summary()
+        assert summary.keys() == expected.keys()
+        for key, value in expected.items():
+            assert summary[key] == pytest.approx(value, rel=1e-9), key
+
+    def test_batched_recurrence_stops_when_every_path_is_depleted(self):
+        engine = ProjectionEngine(depleting_config())
+        expected, std_dev = engine.return_moments(55)
+        shocks = np.random.default_rng(3).standard_normal((40, engine.n_years))[:, :, None]
+        batched = engine.run(55, expected + shocks * std_dev)
+        assert batched.balances[:, -5:].sum() == 0
+        for i in range(0, 40, 7):
+            single = engine.run(55, expected + shocks[i] * std_dev)
+            for got, want in zip(batched, single):
+                np.testing.assert_allclose(got[i], want[0], rtol=1e-12, atol=1e-9)
+
+
+# ---------------------------------------------------------------------------
+# Array output
+# ---------------------------------------------------------------------------
+
+class TestProjectArrays:
+    def test_balances_are_accounts_by_years(self):
+        config = full_config()
+        engine = ProjectionEngine(config)
+        projection = engine.project_arrays(65)
+        n_years = config["life_expectancy"] - config["current_age"] + 1
+        assert projection.balances.shape == (len(config["accounts"]), n_years)
+
+    def test_one_engine_serves_every_scenario(self):
+        engine = ProjectionEngine(full_config())
+        worst = engine.project_arrays(60, "worst").total_portfolio
+        best = engine.project_arrays(60, "best").total_portfolio
+        assert np.all(best >= worst)
+
+    @pytest.mark.parametrize("retirement_age", [35, 60, 67])
+    def test_batched_scenarios_match_single_runs(self, retirement_age):
+        engine = ProjectionEngine(full_config())
+        for projection in engine.project_scenarios(retirement_age):
+            single = engine.project(retirement_age, projection.scenario)
+            assert_projections_match(projection.to_dicts(), single)
+
+    def test_variants_match_single_runs(self):
+        config = full_config()
+        engine = ProjectionEngine(config)
+        variants = [
+            {"inflation_rate": 1.5, "ss_start_age": 62, "salary": 90000},
+            {"target_retirement_income": 140000, "ss_annual": 0},
+            {"inflation_rate": 4.0, "ss_start_age": 70, "target_retirement_income": 0},
+        ]
+        keys = {"inflation_rate": "inflation_rate", "target_retirement_income": "target_income",
+                "ss_annual": "ss_annual", "ss_start_age": "ss_start_age", "salary": "salary"}
+        inputs = {name: np.array([v.get(key, config[key]) for v in variants], dtype=float)
+                  for key, name in keys.items()}
+        balances = np.array([[a["current_balance"] for a in engine.invest_accounts]] * 3, dtype=float)
+        balances[1, 0] = 0
+        inputs["current_balance"] = balances
+        rates = engine.scenario_returns(60, "worst")
+        run = engine.run_variants(60, rates, len(variants), **inputs)
+        for i, variant in enumerate(variants):
+            patched = dict(config, **variant)
+            patched["accounts"] = [dict(a) for a in config["accounts"]]
+            invest = [a for a in patched["accounts"] if a["type"] != "Real Estate"]
+            for account, balance in zip(invest, balances[i]):
+                account["current_balance"] = balance
+            single = ProjectionEngine(patched).run(60, rates)
+            np.testing.assert_allclose(run.balances[i], single.balances[0], rtol=1e-12)
+            np.testing.assert_allclose(run.total_withdrawal[i], single.total_withdrawal[0],
+                                       rtol=1e-12)
+
+    def test_excluded_property_not_in_total(self):
+        config = full_config()
+        engine = ProjectionEngine(config)
+        projection = engine.project_arrays(65)
+        home = [a["name"] for a in config["accounts"]].index("Home")
+        included = np.delete(projection.balances, home, axis=0).sum(axis=0)
+        assert projection.total_portfolio == pytest.approx(included)
+
+
+# ---------------------------------------------------------------------------
+# Summary figures
+# ---------------------------------------------------------------------------
+
+def reference_summary(projections, retirement_age):
+    """The /api/calculate summary as computed from year-by-year dicts"""
+    at_retirement = next((p for p in projections if p["age"] == retirement_age), None)
+    at_85 = next((p for p in projections if p["age"] == 85), None)
+    retirement_to_85 = [p for p in projections if retirement_age <= p["age"] <= 85]
+    last_positive = next((p for p in reversed(projections) if p["total_portfolio"] > 1000), None)
+    return {
+        "portfolio_at_retirement": at_retirement["total_portfolio"] if at_retirement else 0,
+        "avg_annual_income": (sum(p["total_income"] for p in retirement_to_85)
+                              / len(retirement_to_85) if retirement_to_85 else 0),
+        "portfolio_at_85": at_85["total_portfolio"] if at_85 else 0,
+        "portfolio_lasts_until_age": last_positive["age"] if last_positive else "N/A",
+    }
+
+
+class TestSummary:
+    @pytest.mark.parametrize("retirement_age, scenario", [
+        (45, "worst"), (62, "expected"), (67, "best"), (95, "expected"),
+    ])
+    def test_matches_dict_summary(self, retirement_age, scenario):
+        config = full_config()
+        config["target_retirement_income"] = 150000
+        projection = ProjectionEngine(config).project_arrays(retirement_age, scenario)
+        summary = projection.summary()
+        assert summary["retirement_age"] == retirement_age
+        assert summary["scenario"] == scenario
+        expected = reference_summary(projection.to_dicts(), retirement_age)
+        for key, value in expected.items():
+            assert summary[key] == pytest.approx(value, rel=1e-12), key
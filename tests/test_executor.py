@@ -0,0 +1,66 @@
+"""Tests for the shared projection pool."""
+import copy
+
+import pytest
+from planner import executor
+from planner.engine import SCENARIOS, ProjectionEngine
+from planner.montecarlo import run_monte_carlo
+from tests.conftest import MINIMAL_CONFIG
+
+
+@pytest.fixture
+def engine():
+    return ProjectionEngine(copy.deepcopy(MINIMAL_CONFIG))
+
+
+@pytest.fixture
+def pool():
+    executor.init_pool(2)
+    yield executor
+    executor.init_pool(0)
+
+
+def fail():
+    raise ValueError("boom")
+
+
+class TestInline:
+    def test_default_runs_inline(self):
+        assert not executor.is_parallel()
+        assert isinstance(executor.get_executor(), executor.InlineExecutor)
+
+    def test_inline_future_carries_exception(self):
+        future = executor.InlineExecutor().submit(fail)
+        with pytest.raises(ValueError):
+            future.result()
+
+    def test_run_jobs_reports_progress(self):
+        calls = []
+        results = executor.run_jobs(abs, [(-1,), (-2,)], lambda *p: calls.append(p))
+        assert results == [1, 2]
+        assert calls == [(1, 2), (2, 2)]
+
+    @pytest.mark.parametrize("n_items, n_parts", [(15, 4), (3, 8), (0, 2), (10, 1)])
+    def test_split_keeps_order_and_items(self, n_items, n_parts):
+        items = list(range(n_items))
+        batches = executor.split(items, n_parts)
+        assert [x for batch in batches for x in batch] == items
+        assert len(batches) <= max(n_parts, 1)
+
+
+class TestPool:
+    def test_start_pool_spawns_every_worker(self, pool):
+        pool.start_pool()
+        assert len(pool.get_executor()._processes) == 2
+
+    def test_pooled_projections_match_inline(self, engine, pool):
+        jobs = [(age, scenario) for age in (60, 65) for scenario in SCENARIOS]
+        pooled = executor.project_jobs(engine, jobs)
+        assert all(projection.engine is engine for projection in pooled)
+        assert [p.to_dicts() for p in pooled] == [engine.project(*job) for job in jobs]
+
+    def test_pooled_monte_carlo_matches_inline(self, engine, pool, monkeypatch):
+        monkeypatch.setattr("planner.montecarlo.CHUNK_ELEMENTS", 2000)
+        pooled = run_monte_carlo(engine, [65], n_paths=200, seed=3)
+        executor.init_pool(0)
+        assert pooled == run_monte_carlo(engine, [65], n_paths=200, seed=3)
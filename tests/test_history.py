@@ -0,0 +1,178 @@
+"""Tests for historical backtests over a memory-mapped returns dataset."""
+import copy
+
+import numpy as np
+import pytest
+from planner import history
+from planner.engine import ProjectionEngine
+from planner.history import Dataset, HistoryError
+from tests.conftest import MINIMAL_CONFIG
+
+
+def write_csv(path, rows, header="year,stocks,bonds,cash,inflation"):
+    path.write_text(header + "\n" + "\n".join(",".join(str(v) for v in row) for row in rows) + "\n")
+    return path
+
+
+def installed(path):
+    """Dataset.open of a CSV after converting it, as a deploy would"""
+    history.install(str(path))
+    return Dataset.open(str(path))
+
+
+def synthetic_rows(first_year=1900, n=60):
+    """Made-up returns, varied enough that every window differs"""
+    return [(first_year + i, 6 + 10 * np.sin(i), 3 + np.cos(i), 2, 2 + np.sin(i / 3))
+            for i in range(n)]
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    return installed(write_csv(tmp_path / "returns.csv", synthetic_rows()))
+
+
+@pytest.fixture
+def engine():
+    return ProjectionEngine(copy.deepcopy(MINIMAL_CONFIG))
+
+
+def flat_config():
+    """MINIMAL_CONFIG with constant returns and no inflation"""
+    config = copy.deepcopy(MINIMAL_CONFIG)
+    config["inflation_rate"] = 0
+    config["milestones"] = {
+        "401k": [{"years_before": 0, "expected": 6.0, "std_dev": 1.0}],
+        "Savings": [{"years_before": 0, "expected": 2.0, "std_dev": 0.5}],
+    }
+    return config
+
+
+class TestDataset:
+    def test_csv_is_converted_once_and_memory_mapped(self, tmp_path):
+        csv_path = write_csv(tmp_path / "returns.csv", synthetic_rows())
+        assert history.install(str(csv_path)) == str(tmp_path / "returns.npy")
+        converted = (tmp_path / "returns.npy").stat().st_mtime_ns
+        history.install(str(csv_path))
+        assert (tmp_path / "returns.npy").stat().st_mtime_ns == converted
+        dataset = Dataset.open(str(csv_path))
+        assert isinstance(dataset.data, np.memmap)
+        assert dataset.first_year == 1900
+        assert dataset.asset_classes == ("stocks", "bonds", "cash")
+
+    def test_open_never_converts(self, tmp_path):
+        csv_path = write_csv(tmp_path / "returns.csv", synthetic_rows())
+        with pytest.raises(HistoryError, match="python -m planner.history"):
+            Dataset.open(str(csv_path))
+        assert list(tmp_path.iterdir()) == [csv_path]
+
+    def test_command_line_converts_next_to_the_csv(self, tmp_path, capsys):
+        csv_path = write_csv(tmp_path / "returns.csv", synthetic_rows(n=5))
+        history.main([str(csv_path)])
+        assert "5 years from 1900" in capsys.readouterr().out
+        assert Dataset.open(str(csv_path)).first_year == 1900
+
+    def test_rows_are_sorted_by_year(self, tmp_path):
+        rows = synthetic_rows(n=5)
+        dataset = installed(write_csv(tmp_path / "returns.csv", rows[::-1]))
+        assert dataset.data["year"].tolist() == [1900, 1901, 1902, 1903, 1904]
+
+    def test_windows_are_views_of_the_file(self, dataset):
+        windows = dataset.windows("stocks", 10)
+        assert windows.shape == (51, 10)
+        assert np.shares_memory(windows, dataset.data)
+        assert windows[3].tolist() == dataset.data["stocks"][3:13].tolist()
+
+    def test_wrapped_windows_start_every_year(self, dataset):
+        windows = dataset.windows("stocks", 10, wrap=True)
+        assert windows.shape == (60, 10)
+        assert windows[55].tolist() == (dataset.data["stocks"][55:].tolist()
+                                        + dataset.data["stocks"][:5].tolist())
+
+    def test_real_returns_remove_inflation(self, tmp_path):
+        rows = [(2000 + i, 9.18, 4, 2, 3) for i in range(5)]
+        dataset = installed(write_csv(tmp_path / "returns.csv", rows))
+        real = dataset.real_returns(3)
+        assert real.shape == (3, 3, 3)
+        assert real[0] == pytest.approx(np.full((3, 3), 0.06))
+
+    def test_missing_dataset(self, tmp_path):
+        with pytest.raises(HistoryError, match="no historical returns dataset"):
+            Dataset.open(str(tmp_path / "returns.csv"))
+
+    @pytest.mark.parametrize("header, rows, message", [
+        ("year,stocks", [(2000, 5)], "needs year, inflation"),
+        ("year,stocks,inflation", [(2000, 5, 2), (2002, 5, 2)], "consecutive years"),
+        ("year,stocks,inflation", [(2000, "x", 2)], "must be numbers"),
+        ("year,stocks,inflation", [(2000, 5)], "expected 3 values"),
+    ])
+    def test_rejects_bad_csv(self, tmp_path, header, rows, message):
+        with pytest.raises(HistoryError, match=message):
+            history.read_csv(write_csv(tmp_path / "bad.csv", rows, header))
+
+
+class TestPrepare:
+    def test_default_asset_classes_by_account_type(self, engine, dataset):
+        plan = history.prepare(engine, dataset, {})
+        assert plan.asset_classes == ("stocks", "cash")
+        assert plan.weights.tolist() == [[1.0, 0.0], [0.0, 1.0]]
+
+    def test_names_win_over_types(self, engine, dataset):
+        plan = history.prepare(engine, dataset, {"asset_classes": {
+            "401k": {"stocks": 0.6, "bonds": 0.4}, "Savings": "bonds"}})
+        assert plan.asset_classes == ("stocks", "bonds")
+        assert plan.weights.tolist() == [[0.6, 0.0], [0.4, 1.0]]
+
+    @pytest.mark.parametrize("asset_classes, message", [
+        ({"401k": "gold"}, "unknown asset class"),
+        ({"401k": {"stocks": 0.5, "bonds": 0.4}}, "add up to 1"),
+        ({"401k": {"stocks": -1, "bonds": 2}}, "non-negative"),
+        (["stocks"], "must map"),
+    ])
+    def test_rejects_bad_asset_classes(self, engine, dataset, asset_classes, message):
+        with pytest.raises(HistoryError, match=message):
+            history.prepare(engine, dataset, {"asset_classes": asset_classes})
+
+    def test_short_dataset_needs_wrap(self, engine, tmp_path):
+        dataset = installed(write_csv(tmp_path / "returns.csv", synthetic_rows(n=20)))
+        with pytest.raises(HistoryError, match="wrap"):
+            history.prepare(engine, dataset, {})
+        assert history.prepare(engine, dataset, {"wrap": True}).wrap
+
+
+class TestRun:
+    def test_every_window_for_every_retirement_age(self, engine, dataset):
+        result = history.run(engine, dataset, [60, 65], history.prepare(engine, dataset, {}))
+        assert result["windows"] == 60 - engine.n_years + 1
+        assert result["first_year"] == 1900 and result["last_year"] == 1959
+        assert [r["retirement_age"] for r in result["results"]] == [60, 65]
+        windows = result["results"][0]["windows"]
+        assert windows["start_year"] == list(range(1900, 1900 + result["windows"]))
+        assert len(windows["final_portfolio"]) == result["windows"]
+
+    def test_constant_history_matches_expected_projection(self, tmp_path):
+        engine = ProjectionEngine(flat_config())
+        rows = [(1900 + i, 6, 4, 2, 0) for i in range(40)]
+        dataset = installed(write_csv(tmp_path / "returns.csv", rows))
+        result = history.run(engine, dataset, [65], history.prepare(engine, dataset, {}))
+        expected = engine.project_arrays(65).total_portfolio
+        bands = result["results"][0]["percentiles"]
+        assert bands["p5"] == pytest.approx(expected.tolist())
+        assert bands["p95"] == pytest.approx(expected.tolist())
+
+    def test_windows_match_single_runs(self, engine, dataset):
+        plan = history.prepare(engine, dataset, {})
+        result = history.run(engine, dataset, [62], plan)["results"][0]
+        rates = history.rates(engine, dataset, plan)
+        for w in (0, 7, len(rates) - 1):
+            single = engine.run_variants(62, rates[w:w + 1], 1, inflation_rate=[0.0])
+            final = engine.total_portfolio(single.balances)[0, -1]
+            assert result["windows"]["final_portfolio"][w] == pytest.approx(final)
+
+    def test_failed_windows_report_an_age(self, dataset):
+        config = copy.deepcopy(MINIMAL_CONFIG)
+        config["target_retirement_income"] = 1000000
+        engine = ProjectionEngine(config)
+        result = history.run(engine, dataset, [65], history.prepare(engine, dataset, {}))
+        ages = result["results"][0]["windows"]["failed_at_age"]
+        assert all(65 <= age <= 75 for age in ages)
+        assert result["results"][0]["success_probability"] == 0.0
@@ -0,0 +1,152 @@
+"""Tests for resuming projections from cached checkpoints."""
+import copy
+
+import numpy as np
+import pytest
+from planner.engine import ProjectionEngine
+from planner.incremental import first_change, resume
+from tests.conftest import stores
+from tests.test_engine import assert_projections_match, full_config
+from tests.test_routes import set_session_config
+
+
+def resumed_and_full(old_config, new_config, retirement_age, scenario):
+    base = ProjectionEngine(old_config).project_arrays(retirement_age, scenario)
+    engine = ProjectionEngine(new_config)
+    return resume(engine, base), engine.project_arrays(retirement_age, scenario)
+
+
+def edit_event(config):
+    config["events"].append(
+        {"year": 2040, "description": "Bonus", "amount": 30000, "account": "Taxable Brokerage"})
+
+
+def edit_retired_event(config):
+    config["events"].append(
+        {"year": 2080, "description": "Sale", "amount": 50000, "account": "Roth IRA"})
+
+
+def edit_contribution(config):
+    config["accounts"][1]["annual_contribution"] = 1000
+
+
+def edit_target_income(config):
+    config["target_retirement_income"] = 60000
+
+
+def edit_social_security(config):
+    config["ss_annual"] = 12000
+
+
+def edit_ss_start_age(config):
+    config["ss_start_age"] = 70
+
+
+def edit_milestone(config):
+    config["milestones"]["Roth IRA"][0]["expected"] = 5.0
+
+
+def edit_real_estate(config):
+    config["accounts"][-1]["property_value"] = 900000
+
+
+def edit_starting_balance(config):
+    config["accounts"][0]["current_balance"] = 1000
+
+
+# ---------------------------------------------------------------------------
+# resume() against a full recompute
+# ---------------------------------------------------------------------------
+
+class TestResume:
+    @pytest.mark.parametrize("edit", [
+        edit_event, edit_retired_event, edit_contribution, edit_target_income,
+        edit_social_security, edit_ss_start_age, edit_milestone, edit_real_estate,
+        edit_starting_balance,
+    ])
+    @pytest.mark.parametrize("retirement_age, scenario", [(55, "worst"), (67, "expected")])
+    def test_matches_full_recompute(self, edit, retirement_age, scenario):
+        new_config = full_config()
+        edit(new_config)
+        resumed, full = resumed_and_full(full_config(), new_config, retirement_age, scenario)
+        assert_projections_match(resumed.to_dicts(), full.to_dicts())
+
+    def test_unchanged_accounts_keep_cached_trajectory(self):
+        old_config = full_config()
+        new_config = full_config()
+        edit_event(new_config)
+        base = ProjectionEngine(old_config).project_arrays(67)
+        resumed = resume(ProjectionEngine(new_config), base)
+
+        taxable = ProjectionEngine(new_config).invest_names.index("Taxable Brokerage")
+        working = slice(0, 67 - old_config["current_age"])
+        old, new = base.run.balances[0, working], resumed.run.balances[0, working]
+        untouched = np.delete(np.arange(old.shape[1]), taxable)
+        assert np.array_equal(old[:, untouched], new[:, untouched])
+        # Years before the event come straight from the checkpoint
+        assert np.array_equal(old[:2040 - 2025, taxable], new[:2040 - 2025, taxable])
+        assert not np.array_equal(old[:, taxable], new[:, taxable])
+
+    def test_retired_only_change_keeps_working_years(self):
+        new_config = full_config()
+        edit_retired_event(new_config)
+        base = ProjectionEngine(full_config()).project_arrays(60)
+        resumed = resume(ProjectionEngine(new_config), base)
+        cutoff = 2080 - 2025
+        assert np.array_equal(base.run.balances[0, :cutoff], resumed.run.balances[0, :cutoff])
+
+    @pytest.mark.parametrize("key, value", [("current_age", 36), ("life_expectancy", 95)])
+    def test_new_horizon_is_not_resumable(self, key, value):
+        new_config = full_config()
+        new_config[key] = value
+        base = ProjectionEngine(full_config()).project_arrays(65)
+        assert resume(ProjectionEngine(new_config), base) is None
+
+    def test_new_account_is_not_resumable(self):
+        new_config = full_config()
+        new_config["accounts"].insert(0, dict(new_config["accounts"][0], name="Second 401k"))
+        base = ProjectionEngine(full_config()).project_arrays(65)
+        assert resume(ProjectionEngine(new_config), base) is None
+
+    def test_taxes_are_not_resumable(self):
+        new_config = full_config()
+        new_config["taxes"] = {}
+        base = ProjectionEngine(full_config()).project_arrays(65)
+        assert resume(ProjectionEngine(new_config), base) is None
+
+    def test_first_change(self):
+        old = np.zeros((5, 3))
+        new = old.copy()
+        assert first_change(old, new) == 5
+        new[3, 1] = 1
+        assert first_change(old, new) == 3
+
+
+# ---------------------------------------------------------------------------
+# /api/calculate resuming from the previous request
+# ---------------------------------------------------------------------------
+
+class TestCalculateResume:
+    def test_edited_config_matches_fresh_calculation(self, client):
+        stores.projection_cache.clear()
+        set_session_config(client, full_config())
+        client.post("/api/calculate")
+
+        config = full_config()
+        edit_event(config)
+        set_session_config(client, config)
+        resumed = client.post("/api/calculate").get_json()
+
+        stores.projection_cache.clear()
+        with client.session_transaction() as sess:
+            sess.pop("projection_key")
+        fresh = client.post("/api/calculate").get_json()
+        for age, scenarios in fresh["projections"].items():
+            for scenario, projections in scenarios.items():
+                assert_projections_match(resumed["projections"][age][scenario], projections)
+
+    def test_session_tracks_last_config(self, client):
+        set_session_config(client, copy.deepcopy(full_config()))
+        client.post("/api/calculate")
+        with client.session_transaction() as sess:
+            assert len(sess["projection_key"]) == 64
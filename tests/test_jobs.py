@@ -0,0 +1,178 @@
+"""Tests for the background job queue."""
+import threading
+
+import pytest
+from planner.executor import InlineExecutor
+from planner.jobs import (
+    CANCELLED, DONE, FAILED, QUEUED, RUNNING, JobLimitError, JobQueue, SQLiteJobStore,
+)
+from tests.test_cache import FakeClock
+
+
+def blocking(job, release):
+    """Job function that reports progress until release is set"""
+    job.progress(0, 1)
+    while not release.wait(0.01):
+        job.progress(0, 1)
+    return "released"
+
+
+class Deferred(InlineExecutor):
+    """Pool that holds on to the job it is given instead of running it"""
+
+    def submit(self, fn, *args):
+        self.pending = (fn, args)
+
+
+@pytest.fixture
+def queue():
+    return JobQueue(workers=2, per_owner=2)
+
+
+class TestJobQueue:
+    def test_runs_job_and_keeps_result(self, queue):
+        job = queue.submit("alice", "test", lambda job, x: x * 2, 21)
+        assert job.wait(5)
+        assert job.status == DONE
+        assert queue.get("alice", job.id).to_dict()["result"] == 42
+
+    def test_progress_is_reported(self, queue):
+        def count(job):
+            for i in range(1, 4):
+                job.progress(i, 3)
+        job = queue.submit("alice", "test", count)
+        job.wait(5)
+        assert job.to_dict()["progress"] == {"done": 3, "total": 3}
+
+    def test_failure_is_recorded_without_details(self, queue):
+        job = queue.submit("alice", "test", lambda job: 1 / 0)
+        job.wait(5)
+        assert job.status == FAILED
+        assert job.to_dict()["error"] == "Calculation failed"
+        assert "result" not in job.to_dict()
+
+    def test_other_owners_cannot_see_or_cancel(self, queue):
+        job = queue.submit("alice", "test", lambda job: None)
+        assert queue.get("bob", job.id) is None
+        assert queue.cancel("bob", job.id) is None
+
+    def test_cancel_stops_running_job(self, queue):
+        release = threading.Event()
+        job = queue.submit("alice", "test", blocking, release)
+        queue.cancel("alice", job.id)
+        assert job.wait(5)
+        assert job.status == CANCELLED
+        release.set()
+
+    def test_per_owner_limit(self, queue):
+        release = threading.Event()
+        queue.submit("alice", "test", blocking, release)
+        queue.submit("alice", "test", blocking, release)
+        with pytest.raises(JobLimitError):
+            queue.submit("alice", "test", blocking, release)
+        # Another owner is not affected
+        other = queue.submit("bob", "test", lambda job: None)
+        release.set()
+        assert other.wait(5)
+
+    def test_cancelled_queued_job_never_runs(self):
+        pool = Deferred()
+        queue = JobQueue(pool=pool)
+        ran = []
+        job = queue.submit("alice", "test", lambda job: ran.append(1))
+        assert job.status == QUEUED
+        queue.cancel("alice", job.id)
+        assert job.status == CANCELLED
+        fn, args = pool.pending
+        fn(*args)
+        assert ran == []
+        # A cancelled job no longer counts against the limit
+        assert queue.store.active_count("alice") == 0
+
+    def test_finished_jobs_expire(self):
+        clock = FakeClock()
+        queue = JobQueue(pool=InlineExecutor(), ttl=10, clock=clock)
+        job = queue.submit("alice", "test", lambda job: None)
+        clock.now = 11
+        queue.submit("alice", "test", lambda job: None)
+        assert queue.get("alice", job.id) is None
+        assert len(queue.store) == 1
+
+
+class TestSharedStore:
+    """Two queues on one database stand in for two server workers"""
+
+    @pytest.fixture
+    def workers(self, tmp_path):
+        path = str(tmp_path / "jobs.db")
+        return (JobQueue(per_owner=2, store=SQLiteJobStore(path)),
+                JobQueue(per_owner=2, store=SQLiteJobStore(path)))
+
+    def test_result_is_visible_to_other_workers(self, workers):
+        first, second = workers
+        job = first.submit("alice", "test", lambda job, x: {"doubled": x * 2}, 21)
+        assert first.wait(job.id, 5)
+        polled = second.get("alice", job.id)
+        assert polled.status == DONE
+        assert polled.to_dict()["result"] == {"doubled": 42}
+        assert second.get("bob", job.id) is None
+
+    def test_progress_is_visible_to_other_workers(self, workers):
+        first, second = workers
+        release = threading.Event()
+        job = first.submit("alice", "test", blocking, release)
+        while job.status != RUNNING or job.total is None:
+            job.wait(0.01)
+        assert second.get("alice", job.id).to_dict()["progress"] == {"done": 0, "total": 1}
+        release.set()
+        assert first.wait(job.id, 5)
+
+    def test_cancel_from_another_worker(self, workers):
+        first, second = workers
+        release = threading.Event()
+        job = first.submit("alice", "test", blocking, release)
+        second.cancel("alice", job.id)
+        assert job.wait(5)
+        assert job.status == CANCELLED
+        assert second.get("alice", job.id).status == CANCELLED
+        release.set()
+
+    def test_cancelled_queued_job_never_runs(self, tmp_path):
+        path = str(tmp_path / "jobs.db")
+        pool = Deferred()
+        first = JobQueue(pool=pool, store=SQLiteJobStore(path))
+        second = JobQueue(store=SQLiteJobStore(path))
+        ran = []
+        job = first.submit("alice", "test", lambda job: ran.append(1))
+        assert second.cancel("alice", job.id).status == CANCELLED
+        fn, args = pool.pending
+        fn(*args)
+        assert ran == []
+        assert job.status == CANCELLED
+        assert job.wait(0)
+
+    def test_limit_counts_every_worker(self, workers):
+        first, second = workers
+        release = threading.Event()
+        first.submit("alice", "test", blocking, release)
+        second.submit("alice", "test", blocking, release)
+        with pytest.raises(JobLimitError):
+            first.submit("alice", "test", blocking, release)
+        release.set()
+
+    def test_abandoned_jobs_fail_and_finished_jobs_expire(self, tmp_path):
+        clock = FakeClock()
+        path = str(tmp_path / "jobs.db")
+        # The worker that accepted this job dies before running it
+        lost = JobQueue(pool=Deferred(), store=SQLiteJobStore(path, clock), clock=clock)
+        job = lost.submit("alice", "test", lambda job: None)
+        queue = JobQueue(pool=InlineExecutor(), ttl=10, store=SQLiteJobStore(path, clock),
+                         clock=clock)
+        clock.now = 11
+        queue.submit("bob", "test", lambda job: None)
+        abandoned = queue.get("alice", job.id)
+        assert abandoned.status == FAILED
+        assert abandoned.to_dict()["error"] == "Calculation was interrupted"
+        clock.now = 22
+        queue.submit("bob", "test", lambda job: None)
+        assert queue.get("alice", job.id) is None
@@ -0,0 +1,111 @@
+"""Tests for request timings, counters and the sampling profiler."""
+import pytest
+from app import RetirementCalculator
+from planner import metrics
+from planner.engine import ProjectionEngine
+from tests.test_engine import depleting_config, full_config
+
+
+class TestRegistry:
+    def test_counter_renders_per_label(self):
+        registry = metrics.Registry()
+        counter = registry.counter("things_total", "Things", ("kind",))
+        counter.inc(kind="a")
+        counter.inc(2, kind='b"c')
+        assert counter.value(kind="a") == 1
+        assert registry.render() == (
+            "# HELP things_total Things\n"
+            "# TYPE things_total counter\n"
+            'things_total{kind="a"} 1\n'
+            'things_total{kind="b\\"c"} 2\n'
+        )
+
+    def test_histogram_buckets_are_cumulative(self):
+        registry = metrics.Registry()
+        histogram = registry.histogram("took_seconds", "Took", ("phase",), buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 5.0):
+            histogram.observe(value, phase="x")
+        lines = registry.render().splitlines()
+        assert 'took_seconds_bucket{phase="x",le="0.1"} 1' in lines
+        assert 'took_seconds_bucket{phase="x",le="1.0"} 2' in lines
+        assert 'took_seconds_bucket{phase="x",le="+Inf"} 3' in lines
+        assert 'took_seconds_sum{phase="x"} 5.55' in lines
+        assert 'took_seconds_count{phase="x"} 3' in lines
+        assert histogram.count(phase="x") == 3
+
+    def test_collected_values_are_read_at_render(self):
+        registry = metrics.Registry()
+        values = {"size": 1}
+        registry.collected("size", "Size", "gauge", lambda: values["size"])
+        values["size"] = 7
+        assert registry.render().splitlines()[-1] == "size 7"
+
+    def test_names_are_unique(self):
+        registry = metrics.Registry()
+        registry.counter("a_total", "A")
+        with pytest.raises(ValueError):
+            registry.counter("a_total", "A again")
+
+
+class TestTimings:
+    def test_phases_accumulate_in_order(self):
+        ticks = iter([0.0, 1.0, 1.5, 2.0, 2.25, 3.0, 3.5, 4.0])
+        timings = metrics.Timings(clock=lambda: next(ticks))
+        with timings.phase("session"):
+            pass
+        with timings.phase("project"):
+            pass
+        with timings.phase("session"):
+            pass
+        assert timings.phases == {"session": 1.0, "project": 0.25}
+        assert timings.header(timings.elapsed()) == \
+            "session;dur=1000.000, project;dur=250.000, total;dur=4000.000"
+
+
+class TestSamplingProfiler:
+    def test_disabled_by_default(self):
+        assert metrics.SamplingProfiler().start() is None
+
+    def test_samples_a_share_of_requests(self):
+        draws = iter([0.3, 0.7])
+        profiler = metrics.SamplingProfiler(rate=0.5, top=5, random=lambda: next(draws))
+        profile = profiler.start()
+        assert profile is not None
+        ProjectionEngine(full_config()).project_arrays(60)
+        report = profiler.report(profile)
+        assert "function calls" in report
+        assert profiler.start() is None
+
+
+class TestWorkCounters:
+    @pytest.fixture(autouse=True)
+    def counting(self):
+        metrics.enable_counters()
+        yield
+        metrics.enable_counters(False)
+
+    def test_calculator_counts_full_and_depleted_years(self):
+        full = metrics.calculator_years.value(mode="full")
+        depleted = metrics.calculator_years.value(mode="depleted")
+        rental = metrics.calculator_account_years.value(type="Real Estate")
+        config = depleting_config()
+        projections = RetirementCalculator(config).project_scenario(55, "worst")
+        filled = metrics.calculator_years.value(mode="depleted") - depleted
+        ran = metrics.calculator_years.value(mode="full") - full
+        assert filled > 0 and filled + ran == len(projections)
+        assert metrics.calculator_account_years.value(type="Real Estate") - rental == 2 * ran
+
+    def test_engine_counts_simulated_years(self):
+        engine = ProjectionEngine(full_config())
+        before = metrics.engine_account_years.value()
+        path_years = metrics.engine_path_years.value()
+        engine.project_scenarios(60)
+        assert metrics.engine_path_years.value() - path_years == 3 * engine.n_years
+        assert metrics.engine_account_years.value() - before == \
+            3 * engine.n_years * len(engine.invest_names)
+
+    def test_off_by_default(self):
+        metrics.enable_counters(False)
+        before = metrics.engine_path_years.value()
+        ProjectionEngine(full_config()).project_arrays(60)
+        assert metrics.engine_path_years.value() == before
@@ -0,0 +1,80 @@
+"""Tests for the compiled milestone return tables."""
+import numpy as np
+import pytest
+from app import RetirementCalculator, get_default_config
+from planner.milestones import SCENARIO_SHIFTS, MilestoneTable, milestone_for
+
+
+MILESTONES = {
+    "Stocks": [
+        {"years_before": 20, "expected": 10.0, "std_dev": 3.0},
+        {"years_before": 2.5, "expected": 6.0, "std_dev": 2.0},
+        {"years_before": -3, "expected": 3.0, "std_dev": 0.5},
+    ],
+    "Cash": [{"years_before": 0, "expected": 1.0, "std_dev": 0.1}],
+}
+
+
+@pytest.fixture
+def table():
+    return MilestoneTable(MILESTONES, ["Stocks", "Cash", "No milestones"])
+
+
+# ---------------------------------------------------------------------------
+# Lookups against the milestone rule
+# ---------------------------------------------------------------------------
+
+class TestMilestoneTable:
+    @pytest.mark.parametrize("scenario", list(SCENARIO_SHIFTS))
+    @pytest.mark.parametrize("name", ["Stocks", "Cash", "No milestones"])
+    def test_rate_matches_rule_everywhere(self, table, name, scenario):
+        for years_to_retirement in range(-60, 80):
+            milestone = milestone_for(MILESTONES.get(name, []), years_to_retirement)
+            expected = (milestone["expected"]
+                        + SCENARIO_SHIFTS[scenario] * milestone["std_dev"]) / 100.0
+            assert table.rate(name, years_to_retirement, scenario) == pytest.approx(expected)
+
+    def test_unknown_account_uses_default(self, table):
+        assert table.rate("Elsewhere", 10, "best") == pytest.approx(0.06)
+
+    def test_unknown_scenario_is_expected(self, table):
+        assert table.rate("Stocks", 30, "median") == table.rate("Stocks", 30)
+
+    def test_moments_for_array_of_years(self, table):
+        years = np.array([40, 20, 3, 2, -3, -10])
+        expected, std_dev = table.moments(years)
+        assert expected.shape == (6, 3)
+        assert expected[:, 0] == pytest.approx([0.10, 0.10, 0.06, 0.03, 0.03, 0.03])
+        assert std_dev[:, 1] == pytest.approx([0.001] * 6)
+
+    def test_size_follows_breakpoints_not_their_range(self):
+        milestones = {"Far": [{"years_before": 10 ** 9, "expected": 8.0, "std_dev": 2.0},
+                              {"years_before": -10 ** 9, "expected": 2.0, "std_dev": 1.0}]}
+        table = MilestoneTable(milestones, ["Far"])
+        assert table.size == 3
+        assert table.rate("Far", 30) == pytest.approx(0.02)
+        assert table.rate("Far", 10 ** 9) == pytest.approx(0.08)
+        expected, _ = table.moments(np.array([-10 ** 9 - 1, 0, 10 ** 9]))
+        assert expected[:, 0] == pytest.approx([0.02, 0.02, 0.08])
+
+    def test_no_milestones_at_all(self):
+        table = MilestoneTable({}, ["Only"])
+        assert table.size == 1
+        assert table.rate("Only", 12) == pytest.approx(0.05)
+
+
+# ---------------------------------------------------------------------------
+# RetirementCalculator compiles its table once
+# ---------------------------------------------------------------------------
+
+class TestCalculatorTable:
+    def test_table_covers_investable_accounts(self):
+        calc = RetirementCalculator(get_default_config())
+        names = [a["name"] for a in get_default_config()["accounts"]
+                 if a["type"] != "Real Estate"]
+        assert calc.returns.account_names == names
+
+    def test_lookup_does_not_touch_milestones(self, config):
+        calc = RetirementCalculator(config)
+        calc.config = dict(config, milestones=None)
+        assert calc.get_return_for_account_and_year("401k", 25) == pytest.approx(0.09)
@@ -0,0 +1,78 @@
+"""Tests for the batched Monte Carlo mode."""
+import copy
+
+import numpy as np
+import pytest
+from planner.engine import ProjectionEngine
+from planner.montecarlo import PERCENTILES, MonteCarloError, chunk_sizes, prepare, run_monte_carlo
+from tests.conftest import MINIMAL_CONFIG
+
+
+@pytest.fixture
+def engine():
+    return ProjectionEngine(copy.deepcopy(MINIMAL_CONFIG))
+
+
+class TestRunMonteCarlo:
+    def test_same_seed_reproduces_results(self, engine):
+        first = run_monte_carlo(engine, [60, 65], n_paths=200, seed=7)
+        second = run_monte_carlo(engine, [60, 65], n_paths=200, seed=7)
+        assert first == second
+
+    def test_different_seeds_differ(self, engine):
+        first = run_monte_carlo(engine, [65], n_paths=200, seed=1)
+        second = run_monte_carlo(engine, [65], n_paths=200, seed=2)
+        assert first["results"][0]["percentiles"] != second["results"][0]["percentiles"]
+
+    def test_seed_reported_when_not_given(self, engine):
+        result = run_monte_carlo(engine, [65], n_paths=10)
+        assert isinstance(result["seed"], int)
+        assert result == run_monte_carlo(engine, [65], n_paths=10, seed=result["seed"])
+
+    def test_percentile_bands_are_ordered(self, engine):
+        result = run_monte_carlo(engine, [65], n_paths=500, seed=3)["results"][0]
+        bands = np.array([result["percentiles"][f"p{p}"] for p in PERCENTILES])
+        assert np.all(np.diff(bands, axis=0) >= 0)
+
+    def test_success_probability_matches_failure_histogram(self, engine):
+        result = run_monte_carlo(engine, [60], n_paths=500, seed=4)["results"][0]
+        failures = sum(result["failure_ages"]["count"])
+        assert result["success_probability"] == pytest.approx(1 - failures / 500)
+        assert min(result["failure_ages"]["age"]) == 60
+
+    def test_zero_volatility_matches_expected_scenario(self):
+        config = copy.deepcopy(MINIMAL_CONFIG)
+        for milestones in config["milestones"].values():
+            for milestone in milestones:
+                milestone["std_dev"] = 0.0
+        engine = ProjectionEngine(config)
+        result = run_monte_carlo(engine, [65], n_paths=20, seed=5)["results"][0]
+        expected = [p["total_portfolio"] for p in engine.project(65)]
+        assert result["percentiles"]["p5"] == pytest.approx(expected)
+        assert result["percentiles"]["p95"] == pytest.approx(expected)
+
+    def test_small_chunks_cover_every_path(self, engine, monkeypatch):
+        monkeypatch.setattr("planner.montecarlo.CHUNK_ELEMENTS", 1000)
+        sizes = chunk_sizes(engine, 300)
+        assert len(sizes) > 1
+        assert sum(sizes) == 300
+        result = run_monte_carlo(engine, [65], n_paths=300, seed=9)["results"][0]
+        assert len(result["percentiles"]["p50"]) == engine.n_years
+
+
+class TestPrepare:
+    def test_defaults(self):
+        assert prepare({}) == (1000, None)
+        assert prepare({}, seed=0) == (1000, 0)
+        assert prepare({"paths": 5, "seed": 3}) == (5, 3)
+
+    @pytest.mark.parametrize("options, message", [
+        ({"paths": True}, "whole number"),
+        ({"paths": 2.5}, "whole number"),
+        ({"seed": "7"}, "whole number"),
+        ({"paths": 0}, "between 1 and"),
+        ({"seed": -1}, "non-negative"),
+    ])
+    def test_rejects(self, options, message):
+        with pytest.raises(MonteCarloError, match=message):
+            prepare(options)
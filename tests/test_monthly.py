@@ -0,0 +1,155 @@
+"""Tests for the monthly time step."""
+import numpy as np
+import pytest
+from planner.engine import ProjectionEngine
+from planner.monthly import MonthlyError, MonthlyGrid, compile_monthly
+from tests.test_engine import full_config
+
+
+def monthly_engine(retirement_month=1, **changes):
+    config = full_config()
+    config.update(time_step="monthly", retirement_month=retirement_month, **changes)
+    return ProjectionEngine(config)
+
+
+def month_by_month(engine, retirement_age, rates):
+    """One path stepped a month at a time with plain floats"""
+    paid_in = sum(engine.contributions(retirement_age))
+    ss_income = engine.ss_schedule(retirement_age)
+    worked = engine.monthly.working_months(retirement_age - engine.current_age, engine.n_years)
+    balances = engine.start_balances.astype(float).copy()
+    history, withdrawn = [], []
+    initial, months_retired = None, 0
+    for t in range(engine.n_years):
+        growth = (1 + rates[t]) ** (1 / 12)
+        mask = engine.access[t]
+        total = 0.0
+        for month in range(12):
+            balances = balances * growth
+            if month < worked[t]:
+                balances = balances + paid_in[t] / worked[t]
+                continue
+            if initial is None:
+                target = engine.target_income
+                initial = target if target > 0 else balances.sum() * 0.04
+            desired = initial / 12 * (1 + engine.inflation_rate) ** (months_retired / 12)
+            months_retired += 1
+            needed = max(desired - ss_income[t] / (12 - worked[t]), 0)
+            accessible = (balances * mask).sum()
+            amount = min(needed, accessible)
+            share = amount / accessible if accessible > 0 else 0.0
+            balances = balances - balances * mask * (balances > 0) * share
+            total += amount
+        balances = balances + engine.invest_events[t]
+        history.append(balances)
+        withdrawn.append(total)
+    return np.array(history), np.array(withdrawn)
+
+
+class TestMonthlyRun:
+    @pytest.mark.parametrize("retirement_month", [1, 7, 12])
+    @pytest.mark.parametrize("retirement_age", [55, 62])
+    @pytest.mark.parametrize("scenario", ["expected", "worst"])
+    def test_matches_month_by_month_loop(self, scenario, retirement_age, retirement_month):
+        engine = monthly_engine(retirement_month)
+        rates = engine.scenario_returns(retirement_age, scenario)
+        run = engine.run(retirement_age, rates)
+        balances, withdrawn = month_by_month(engine, retirement_age, rates)
+        np.testing.assert_allclose(run.balances[0], balances, rtol=1e-9, atol=1e-6)
+        np.testing.assert_allclose(run.total_withdrawal[0], withdrawn, rtol=1e-9, atol=1e-6)
+
+    def test_four_percent_rule(self):
+        engine = monthly_engine(4, target_retirement_income=0)
+        rates = engine.scenario_returns(60, "expected")
+        run = engine.run(60, rates)
+        balances, withdrawn = month_by_month(engine, 60, rates)
+        np.testing.assert_allclose(run.balances[0], balances, rtol=1e-9, atol=1e-6)
+        np.testing.assert_allclose(run.total_withdrawal[0], withdrawn, rtol=1e-9, atol=1e-6)
+
+    def test_flat_returns_match_annual(self):
+        # Events differ: annually they come before the year's withdrawal
+        config = dict(full_config(), inflation_rate=0, events=[])
+        annual = ProjectionEngine(config)
+        monthly = ProjectionEngine(dict(config, time_step="monthly"))
+        rates = np.zeros((annual.n_years, len(annual.start_balances)))
+        expected, actual = annual.run(62, rates), monthly.run(62, rates)
+        np.testing.assert_allclose(actual.balances, expected.balances, rtol=1e-12, atol=1e-6)
+        np.testing.assert_allclose(actual.total_withdrawal, expected.total_withdrawal, rtol=1e-12)
+        np.testing.assert_allclose(actual.initial_withdrawal, expected.initial_withdrawal)
+
+    def test_mid_year_retirement_splits_the_year(self):
+        engine = monthly_engine(7, inflation_rate=0, ss_start_age=60)
+        year = 62 - engine.current_age
+        contributions, _ = engine.contributions(62)
+        np.testing.assert_allclose(contributions[year], contributions[year - 1] / 2)
+        ss_income = engine.ss_schedule(62)
+        assert ss_income[year] == pytest.approx(ss_income[year + 1] / 2)
+        run = engine.run(62, np.zeros((engine.n_years, len(engine.start_balances))))
+        assert run.requested[0, year] == pytest.approx((90000 - ss_income[year + 1]) / 2)
+        assert run.requested[0, year - 1] == 0
+
+    def test_batched_paths_match_single_runs(self):
+        engine = monthly_engine(9)
+        expected, std_dev = engine.return_moments(60)
+        shocks = np.random.default_rng(2).standard_normal((6, engine.n_years, 1))
+        rates = expected + shocks * std_dev
+        batch = engine.run(60, rates)
+        for i in range(len(rates)):
+            single = engine.run(60, rates[i])
+            np.testing.assert_allclose(batch.balances[i], single.balances[0], rtol=1e-12)
+            np.testing.assert_allclose(batch.total_withdrawal[i], single.total_withdrawal[0],
+                                       rtol=1e-12)
+
+    def test_variants_match_single_runs(self):
+        engine = monthly_engine(5)
+        targets = [0, 60000, 150000]
+        run = engine.run_variants(60, engine.scenario_returns(60), 3, target_income=targets)
+        for i, target in enumerate(targets):
+            single = monthly_engine(5, target_retirement_income=target).run(
+                60, engine.scenario_returns(60))
+            np.testing.assert_allclose(run.balances[i], single.balances[0], rtol=1e-12)
+
+    def test_projection_dicts(self):
+        projection = monthly_engine(7).project(62, "worst")
+        year = next(p for p in projection if p["age"] == 62)
+        assert year["withdrawal"] > 0 and year["total_income"] > 0
+
+    def test_annual_ignores_retirement_month(self):
+        config = full_config()
+        expected = ProjectionEngine(config).run(60, ProjectionEngine(config).scenario_returns(60))
+        actual = ProjectionEngine(dict(config, retirement_month=7)).run(
+            60, ProjectionEngine(config).scenario_returns(60))
+        np.testing.assert_array_equal(actual.balances, expected.balances)
+
+
+class TestGrid:
+    def test_working_months(self):
+        grid = MonthlyGrid(4)
+        assert grid.working_months(2, 5).tolist() == [12, 12, 3, 0, 0]
+        assert grid.working_months(-1, 2).tolist() == [0, 0]
+
+    def test_paid_in_factor(self):
+        grid = MonthlyGrid(1)
+        rates = np.array([0.0, 0.07, -0.3])
+        growth, log_growth = grid.compound(rates)
+        factor = grid.paid_in_factor(rates, log_growth, 5)
+        np.testing.assert_allclose(factor, [(growth[i] ** np.arange(5)).sum() for i in range(3)])
+
+
+class TestCompile:
+    def test_annual_by_default(self):
+        assert compile_monthly({"accounts": []}) is None
+
+    @pytest.mark.parametrize("changes, message", [
+        ({"time_step": "daily"}, "time_step must be one of"),
+        ({"retirement_month": 0}, "retirement_month"),
+        ({"retirement_month": 6.5}, "retirement_month"),
+        ({"retirement_month": True}, "retirement_month"),
+        ({"taxes": {}}, "no taxes"),
+        ({"withdrawal_strategy": {"type": "vpw"}}, "constant withdrawal strategy"),
+        ({"withdrawal_strategy": {"order": "ordered"}}, "proportional draws"),
+    ])
+    def test_rejects(self, changes, message):
+        config = {**full_config(), "time_step": "monthly", **changes}
+        with pytest.raises(MonthlyError, match=message):
+            compile_monthly(config)
@@ -1,11 +1,19 @@
 """Integration tests for Flask routes."""
 import json
+
+import app as app_module
+import pytest
 from app import get_default_config
-from tests.conftest import MINIMAL_CONFIG
+from planner import history, metrics
+from tests.conftest import MINIMAL_CONFIG, flask_app, stores
 
 
 def set_session_config(client, config):
-    """Helper: put a config into the Flask session before a request."""
+    """Helper: put a config into the Flask session before a request.
+
+    This is how older versions stored configs; the next request moves it
+    into the config store.
+    """
     with client.session_transaction() as sess:
         sess["config"] = config
 
@@ -22,7 +30,8 @@ class TestIndex:
     def test_loads_default_config_on_first_visit(self, client):
         client.get("/")
         with client.session_transaction() as sess:
-            assert "config" in sess
+            assert "config_id" in sess
+            assert "config" not in sess
 
 
 # ---------------------------------------------------------------------------
@@ -79,6 +88,42 @@ class TestPostConfig:
         assert response.get_json()["current_age"] == MINIMAL_CONFIG["current_age"]
 
 
+    def test_rejects_invalid_config(self, client):
+        response = client.post("/api/config", json=dict(MINIMAL_CONFIG, current_age="forty"))
+        assert response.status_code == 400
+        assert "current_age" in response.get_json()["error"]
+        # The previous config is kept
+        assert client.get("/api/config").get_json() == get_default_config()
+
+    def test_cookie_holds_only_the_config_id(self, client):
+        client.post("/api/config", json=MINIMAL_CONFIG)
+        with client.session_transaction() as sess:
+            assert set(sess.keys()) == {"config_id"}
+            assert stores.config_store.get(sess["config_id"]).config == MINIMAL_CONFIG
+
+
+class TestLegacySessionConfig:
+    def test_cookie_config_moves_to_store(self, client):
+        set_session_config(client, MINIMAL_CONFIG)
+        response = client.get("/api/config")
+        assert response.get_json() == MINIMAL_CONFIG
+        with client.session_transaction() as sess:
+            assert "config" not in sess
+            assert stores.config_store.get(sess["config_id"]).config == MINIMAL_CONFIG
+
+    def test_invalid_cookie_config_falls_back_to_defaults(self, client):
+        set_session_config(client, {"accounts": "broken"})
+        assert client.get("/api/config").get_json() == get_default_config()
+
+    def test_stored_config_that_no_longer_compiles_falls_back_to_defaults(self, client):
+        stores.config_store.backend.save("stale", {"accounts": "broken"})
+        with client.session_transaction() as sess:
+            sess["config_id"] = "stale"
+        response = client.get("/api/config")
+        assert response.status_code == 200
+        assert response.get_json() == get_default_config()
+
+
 # ---------------------------------------------------------------------------
 # POST /api/reset
 # ---------------------------------------------------------------------------
@@ -98,6 +143,20 @@ class TestResetConfig:
         assert len(data["config"]["accounts"]) == len(default["accounts"])
 
 
+class TestCreateApp:
+    def test_each_app_has_its_own_stores(self):
+        other = app_module.create_app()
+        assert other is not flask_app
+        assert other.extensions["planner"].config_store is not stores.config_store
+        assert other.extensions["planner"].projection_cache is not stores.projection_cache
+
+    def test_warm_caches_the_default_config(self):
+        warmed = app_module.create_app(warm=True).extensions["planner"]
+        stored = warmed.config_store.save(get_default_config())
+        for age in stored.config["retirement_ages"]:
+            assert warmed.projection_cache.get((stored.key, age, "expected")) is not None
+
+
 # ---------------------------------------------------------------------------
 # POST /api/calculate
 # ---------------------------------------------------------------------------
@@ -139,3 +198,433 @@ class TestCalculate:
         assert response.status_code == 200
         data = response.get_json()
         assert "projections" in data
+
+
+class TestCalculateMonteCarlo:
+    def post(self, client, options):
+        set_session_config(client, MINIMAL_CONFIG)
+        return client.post(
+            "/api/calculate",
+            data=json.dumps({"mode": "monte_carlo", **options}),
+            content_type="application/json",
+        )
+
+    def test_returns_result_per_retirement_age(self, client):
+        data = self.post(client, {"paths": 100, "seed": 1}).get_json()
+        assert data["mode"] == "monte_carlo"
+        assert [r["retirement_age"] for r in data["results"]] == MINIMAL_CONFIG["retirement_ages"]
+        assert set(data["results"][0]["percentiles"]) == {"p5", "p25", "p50", "p75", "p95"}
+
+    def test_seed_makes_results_reproducible(self, client):
+        first = self.post(client, {"paths": 50, "seed": 11}).get_json()
+        second = self.post(client, {"paths": 50, "seed": 11}).get_json()
+        assert first == second
+
+    def test_rejects_too_many_paths(self, client):
+        response = self.post(client, {"paths": 10**9})
+        assert response.status_code == 400
+
+    def test_rejects_non_integer_seed(self, client):
+        response = self.post(client, {"paths": 10, "seed": "abc"})
+        assert response.status_code == 400
+
+    @pytest.mark.parametrize("options", [
+        {"paths": True}, {"paths": 3.9}, {"paths": "42"},
+        {"paths": 10, "seed": True}, {"paths": 10, "seed": 3.9}, {"paths": 10, "seed": "42"},
+    ])
+    def test_rejects_values_that_are_not_whole_numbers(self, client, options):
+        response = self.post(client, options)
+        assert response.status_code == 400
+        assert "must be a whole number" in response.get_json()["error"]
+
+
+class TestCalculateBacktest:
+    @pytest.fixture(autouse=True)
+    def dataset(self, tmp_path, monkeypatch):
+        rows = [f"{1900 + i},{6 + (i % 7) - 3},3,2,2" for i in range(60)]
+        path = tmp_path / "returns.csv"
+        path.write_text("year,stocks,bonds,cash,inflation\n" + "\n".join(rows) + "\n")
+        monkeypatch.setattr(app_module, "HISTORY_DATA", str(path))
+        monkeypatch.setattr(app_module, "_history", {})
+        return path
+
+    def post(self, client, options):
+        set_session_config(client, MINIMAL_CONFIG)
+        return client.post("/api/calculate", json={"mode": "backtest", **options})
+
+    def test_warm_up_converts_the_dataset(self, dataset):
+        app_module.warm_up(flask_app)
+        assert dataset.with_suffix(".npy").exists()
+
+    def test_warm_up_survives_a_read_only_dataset(self, dataset, monkeypatch):
+        def read_only(csv_path, npy_path):
+            raise PermissionError(13, "Read-only file system", npy_path)
+        monkeypatch.setattr(history, "convert", read_only)
+        assert app_module.warm_up(flask_app) is not None
+        assert not dataset.with_suffix(".npy").exists()
+
+    def test_unconverted_dataset_is_not_converted_by_a_request(self, client, dataset):
+        response = self.post(client, {})
+        assert response.status_code == 400
+        assert "python -m planner.history" in response.get_json()["error"]
+        assert not dataset.with_suffix(".npy").exists()
+
+    def test_returns_result_per_retirement_age(self, client, dataset):
+        history.install(str(dataset))
+        data = self.post(client, {}).get_json()
+        assert data["mode"] == "backtest"
+        assert data["windows"] == 60 - 36 + 1
+        assert data["asset_classes"] == {"401k": {"stocks": 1.0}, "Savings": {"cash": 1.0}}
+        assert [r["retirement_age"] for r in data["results"]] == MINIMAL_CONFIG["retirement_ages"]
+        assert data["results"][0]["windows"]["start_year"][0] == 1900
+
+    def test_rejects_unknown_asset_class(self, client, dataset):
+        history.install(str(dataset))
+        response = self.post(client, {"asset_classes": {"401k": "gold"}})
+        assert response.status_code == 400
+        assert "gold" in response.get_json()["error"]
+
+    def test_missing_dataset(self, client, tmp_path, monkeypatch):
+        monkeypatch.setattr(app_module, "HISTORY_DATA", str(tmp_path / "none.csv"))
+        response = self.post(client, {})
+        assert response.status_code == 400
+        assert "dataset" in response.get_json()["error"]
+
+
+# ---------------------------------------------------------------------------
+# Lazy results: POST /api/calculate with lazy, then GET /api/results/...
+# ---------------------------------------------------------------------------
+
+class TestLazyResults:
+    def calculate(self, client):
+        set_session_config(client, MINIMAL_CONFIG)
+        return client.post("/api/calculate", json={"lazy": True}).get_json()
+
+    def test_returns_summary_and_handle_only(self, client):
+        data = self.calculate(client)
+        assert "projections" not in data
+        assert data["retirement_ages"] == [65]
+        assert data["scenarios"] == ["expected", "best", "worst"]
+        assert len(data["summary"]) == 3
+        assert isinstance(data["result"], str)
+
+    def test_detail_matches_eager_projection(self, client):
+        handle = self.calculate(client)["result"]
+        eager = client.post("/api/calculate").get_json()
+        detail = client.get(f"/api/results/{handle}/65/worst").get_json()
+        assert detail["projections"]["65"] == {"worst": eager["projections"]["65"]["worst"]}
+        assert detail["summary"] == [s for s in eager["summary"] if s["scenario"] == "worst"]
+
+    def test_detail_recomputes_after_eviction(self, client):
+        handle = self.calculate(client)["result"]
+        stores.projection_cache.clear()
+        response = client.get(f"/api/results/{handle}/65/best?format=columnar")
+        assert response.status_code == 200
+        assert "best" in response.get_json()["projections"]["65"]
+
+    def test_detail_binary(self, client):
+        handle = self.calculate(client)["result"]
+        response = client.get(f"/api/results/{handle}/65/expected?format=binary")
+        assert response.mimetype == "application/octet-stream"
+
+    def test_stale_handle_is_not_found(self, client):
+        handle = self.calculate(client)["result"]
+        config = dict(MINIMAL_CONFIG, ss_annual=1000)
+        set_session_config(client, config)
+        client.post("/api/calculate", json={"lazy": True})
+        response = client.get(f"/api/results/{handle}/65/expected")
+        assert response.status_code == 404
+
+    def test_unknown_age_or_scenario_is_not_found(self, client):
+        handle = self.calculate(client)["result"]
+        assert client.get(f"/api/results/{handle}/70/expected").status_code == 404
+        assert client.get(f"/api/results/{handle}/65/median").status_code == 404
+
+    def test_rejects_unknown_format(self, client):
+        handle = self.calculate(client)["result"]
+        response = client.get(f"/api/results/{handle}/65/expected?format=xml")
+        assert response.status_code == 400
+
+
+# ---------------------------------------------------------------------------
+# Streaming: POST /api/calculate with stream
+# ---------------------------------------------------------------------------
+
+class TestCalculateStream:
+    def stream(self, client, config=MINIMAL_CONFIG, **options):
+        set_session_config(client, config)
+        response = client.post("/api/calculate", json={"stream": True, **options})
+        assert response.status_code == 200
+        assert response.mimetype == "application/x-ndjson"
+        return [json.loads(line) for line in response.data.decode().splitlines()]
+
+    def test_start_projections_done(self, client):
+        config = dict(MINIMAL_CONFIG, retirement_ages=[60, 65])
+        lines = self.stream(client, config)
+        assert lines[0]["type"] == "start"
+        assert lines[0]["retirement_ages"] == [60, 65]
+        assert [line["type"] for line in lines[1:]] == ["projection"] * 6 + ["done"]
+
+    def test_lines_match_eager_response(self, client):
+        lines = self.stream(client)
+        eager = client.post("/api/calculate").get_json()
+        for line in lines[1:-1]:
+            age, scenario = str(line["retirement_age"]), line["scenario"]
+            assert line["projection"] == eager["projections"][age][scenario]
+            assert line["summary"] in eager["summary"]
+
+    def test_lazy_stream_sends_summaries_only(self, client):
+        lines = self.stream(client, lazy=True)
+        assert all("projection" not in line for line in lines)
+        detail = client.get(f"/api/results/{lines[0]['result']}/65/best")
+        assert detail.status_code == 200
+
+    def test_columnar_stream(self, client):
+        lines = self.stream(client, format="columnar")
+        assert len(lines[1]["columns"]["total_portfolio"]) == 36
+
+    def test_cached_jobs_stream_first(self, client):
+        stores.projection_cache.clear()
+        config = dict(MINIMAL_CONFIG, retirement_ages=[65])
+        set_session_config(client, config)
+        client.post("/api/calculate")
+        lines = self.stream(client, dict(MINIMAL_CONFIG, retirement_ages=[60, 65]))
+        ages = [line["retirement_age"] for line in lines[1:-1]]
+        assert ages == [65, 65, 65, 60, 60, 60]
+
+    def test_binary_stream_is_rejected(self, client):
+        response = client.post("/api/calculate", json={"stream": True, "format": "binary"})
+        assert response.status_code == 400
+
+
+# ---------------------------------------------------------------------------
+# Background jobs: POST /api/calculate with async, then /api/jobs/<id>
+# ---------------------------------------------------------------------------
+
+class TestAsyncJobs:
+    def submit(self, client, **options):
+        set_session_config(client, MINIMAL_CONFIG)
+        response = client.post("/api/calculate", json={"async": True, **options})
+        assert response.status_code == 202
+        data = response.get_json()
+        assert data["url"] == f"/api/jobs/{data['id']}"
+        assert stores.job_queue.wait(data["id"], 10)
+        return data
+
+    def test_result_matches_sync_response(self, client):
+        job = self.submit(client)
+        data = client.get(job["url"]).get_json()
+        assert data["status"] == "done"
+        assert data["progress"] == {"done": 3, "total": 3}
+        assert data["result"] == client.post("/api/calculate").get_json()
+
+    def test_lazy_job_handle_serves_detail(self, client):
+        job = self.submit(client, lazy=True)
+        result = client.get(job["url"]).get_json()["result"]
+        assert client.get(f"/api/results/{result['result']}/65/best").status_code == 200
+
+    def test_monte_carlo_job(self, client):
+        job = self.submit(client, mode="monte_carlo", paths=50, seed=1)
+        data = client.get(job["url"]).get_json()
+        sync = client.post("/api/calculate",
+                           json={"mode": "monte_carlo", "paths": 50, "seed": 1}).get_json()
+        assert data["result"] == sync
+        assert data["progress"]["done"] == data["progress"]["total"]
+
+    def test_other_sessions_cannot_see_job(self, client):
+        job = self.submit(client)
+        other = flask_app.test_client()
+        assert other.get(job["url"]).status_code == 404
+        assert other.delete(job["url"]).status_code == 404
+
+    def test_cancel_finished_job_keeps_result(self, client):
+        job = self.submit(client)
+        data = client.delete(job["url"]).get_json()
+        assert data["status"] == "done"
+
+    def test_unknown_job_is_not_found(self, client):
+        assert client.get("/api/jobs/nope").status_code == 404
+
+    def test_limit_returns_429(self, client, monkeypatch):
+        monkeypatch.setattr(stores.job_queue, "per_owner", 0)
+        response = client.post("/api/calculate", json={"async": True})
+        assert response.status_code == 429
+
+    def test_binary_async_is_rejected(self, client):
+        response = client.post("/api/calculate", json={"async": True, "format": "binary"})
+        assert response.status_code == 400
+
+
+# ---------------------------------------------------------------------------
+# POST /api/batch/calculate
+# ---------------------------------------------------------------------------
+
+class TestBatchCalculate:
+    def test_configs_match_single_calculations(self, client):
+        other = dict(MINIMAL_CONFIG, ss_annual=12000)
+        data = client.post("/api/batch/calculate",
+                           json={"configs": [MINIMAL_CONFIG, other]}).get_json()
+        assert data["plans"] == 2
+        for config, result in zip([MINIMAL_CONFIG, other], data["results"]):
+            set_session_config(client, config)
+            assert result["summary"] == client.post("/api/calculate").get_json()["summary"]
+            assert "projections" not in result
+
+    def test_base_with_overrides(self, client):
+        data = client.post("/api/batch/calculate", json={
+            "base": MINIMAL_CONFIG,
+            "overrides": [{}, {"accounts[0].annual_contribution": 0}],
+        }).get_json()
+        first, second = (r["summary"][0]["portfolio_at_retirement"] for r in data["results"])
+        assert second < first
+
+    def test_optional_projections(self, client):
+        data = client.post("/api/batch/calculate",
+                           json={"base": MINIMAL_CONFIG, "projections": True}).get_json()
+        set_session_config(client, MINIMAL_CONFIG)
+        eager = client.post("/api/calculate").get_json()
+        assert data["results"][0]["projections"] == eager["projections"]
+
+    def test_bad_override_reports_error_per_plan(self, client):
+        data = client.post("/api/batch/calculate", json={
+            "base": MINIMAL_CONFIG, "overrides": [{"accounts[9].name": "x"}, {}],
+        }).get_json()
+        assert "error" in data["results"][0]
+        assert "summary" in data["results"][1]
+
+    def test_async_batch(self, client):
+        response = client.post("/api/batch/calculate",
+                               json={"base": MINIMAL_CONFIG, "async": True})
+        assert response.status_code == 202
+        job = response.get_json()
+        assert stores.job_queue.wait(job["id"], 10)
+        result = client.get(job["url"]).get_json()["result"]
+        assert result["plans"] == 1
+
+    @pytest.mark.parametrize("body", [
+        {},
+        {"configs": [MINIMAL_CONFIG], "base": MINIMAL_CONFIG},
+        {"configs": []},
+        {"configs": MINIMAL_CONFIG},
+        {"base": [MINIMAL_CONFIG]},
+        {"base": MINIMAL_CONFIG, "format": "binary"},
+    ])
+    def test_rejects_bad_requests(self, client, body):
+        assert client.post("/api/batch/calculate", json=body).status_code == 400
+
+
+# ---------------------------------------------------------------------------
+# POST /api/sweep
+# ---------------------------------------------------------------------------
+
+class TestSweep:
+    PARAMETERS = (
+        {"path": "ss_annual", "start": 0, "stop": 40000, "steps": 3},
+        {"path": "accounts[0].annual_contribution", "values": [0, 20000]},
+    )
+
+    def test_grid_and_tornado(self, client):
+        set_session_config(client, MINIMAL_CONFIG)
+        data = client.post("/api/sweep", json={"parameters": self.PARAMETERS}).get_json()
+        assert data["retirement_age"] == MINIMAL_CONFIG["retirement_ages"][0]
+        assert data["parameters"][0]["values"] == [0, 20000, 40000]
+        assert len(data["grid"]["portfolio_at_85"]) == 3
+        assert len(data["grid"]["portfolio_at_85"][0]) == 2
+        assert {bar["path"] for bar in data["tornado"]["portfolio_at_85"]} == \
+            {p["path"] for p in self.PARAMETERS}
+
+    def test_async_sweep(self, client):
+        set_session_config(client, MINIMAL_CONFIG)
+        sync = client.post("/api/sweep", json={"parameters": self.PARAMETERS}).get_json()
+        response = client.post("/api/sweep", json={"parameters": self.PARAMETERS, "async": True})
+        assert response.status_code == 202
+        job = response.get_json()
+        assert stores.job_queue.wait(job["id"], 10)
+        assert client.get(job["url"]).get_json()["result"] == sync
+
+    @pytest.mark.parametrize("body", [
+        {},
+        {"parameters": []},
+        {"parameters": [{"path": "ss_annual"}]},
+        {"parameters": [{"path": "ss_annual", "values": [1]}], "scenario": "p50"},
+    ])
+    def test_rejects_bad_requests(self, client, body):
+        assert client.post("/api/sweep", json=body).status_code == 400
+
+
+# ---------------------------------------------------------------------------
+# POST /api/solve
+# ---------------------------------------------------------------------------
+
+class TestSolve:
+    def test_max_withdrawal(self, client):
+        set_session_config(client, MINIMAL_CONFIG)
+        data = client.post("/api/solve", json={"goal": "max_withdrawal"}).get_json()
+        assert data["retirement_age"] == MINIMAL_CONFIG["retirement_ages"][0]
+        assert data["scenario"] == "worst"
+        assert data["max_withdrawal"] > 0
+
+    def test_async_solve(self, client):
+        set_session_config(client, MINIMAL_CONFIG)
+        body = {"goal": "earliest_retirement_age", "scenario": "p10", "paths": 50}
+        sync = client.post("/api/solve", json=body).get_json()
+        response = client.post("/api/solve", json={**body, "async": True})
+        assert response.status_code == 202
+        job = response.get_json()
+        assert stores.job_queue.wait(job["id"], 10)
+        assert client.get(job["url"]).get_json()["result"] == sync
+
+    @pytest.mark.parametrize("body", [{}, {"goal": "max_withdrawal", "scenario": "p75"}])
+    def test_rejects_bad_requests(self, client, body):
+        assert client.post("/api/solve", json=body).status_code == 400
+
+
+# ---------------------------------------------------------------------------
+# Instrumentation
+# ---------------------------------------------------------------------------
+
+class TestInstrumentation:
+    def test_calculate_reports_phases(self, client, monkeypatch):
+        monkeypatch.setattr(app_module, "SERVER_TIMING", True)
+        set_session_config(client, MINIMAL_CONFIG)
+        response = client.post("/api/calculate")
+        phases = [entry.split(";")[0] for entry in response.headers["Server-Timing"].split(", ")]
+        assert phases == ["session", "project", "summary", "serialize", "total"]
+
+    def test_server_timing_off_by_default(self, client):
+        set_session_config(client, MINIMAL_CONFIG)
+        assert "Server-Timing" not in client.post("/api/calculate").headers
+
+    def test_server_timing_with_metrics_token(self, client, monkeypatch):
+        monkeypatch.setattr(app_module, "METRICS_TOKEN", "scrape-secret")
+        set_session_config(client, MINIMAL_CONFIG)
+        wrong = client.post("/api/calculate", headers={"Authorization": "Bearer guess"})
+        assert "Server-Timing" not in wrong.headers
+        right = client.post("/api/calculate", headers={"Authorization": "Bearer scrape-secret"})
+        assert "total;dur=" in right.headers["Server-Timing"]
+
+    def test_metrics_endpoint(self, client):
+        client.post("/api/calculate")
+        response = client.get("/api/metrics")
+        assert response.status_code == 200
+        assert response.content_type.startswith("text/plain; version=0.0.4")
+        body = response.get_data(as_text=True)
+        assert "# TYPE planner_request_seconds histogram" in body
+        assert 'planner_phase_seconds_count{endpoint="calculate",phase="project"}' in body
+        assert 'planner_projection_cache_lookups_total{result="hits"}' in body
+        assert 'planner_jobs_total{status="submitted"}' in body
+
+    def test_metrics_need_login_or_token_with_auth(self, client, monkeypatch):
+        monkeypatch.setattr(app_module, "AUTH_ENABLED", True)
+        monkeypatch.setattr(app_module, "METRICS_TOKEN", "scrape")
+        assert client.get("/api/metrics").status_code == 401
+        wrong = {"Authorization": "Bearer nope"}
+        assert client.get("/api/metrics", headers=wrong).status_code == 401
+        right = {"Authorization": "Bearer scrape"}
+        assert client.get("/api/metrics", headers=right).status_code == 200
+
+    def test_sampled_request_is_logged(self, client, monkeypatch, caplog):
+        monkeypatch.setattr(app_module, "profiler", metrics.SamplingProfiler(rate=1.0, top=3))
+        with caplog.at_level("INFO"):
+            client.post("/api/calculate")
+        assert any("Profile of POST /api/calculate" in r.getMessage() for r in caplog.records)
@@ -0,0 +1,118 @@
+"""Tests for the withdrawal and retirement-age solvers."""
+import numpy as np
+import pytest
+from planner import solver
+from planner.engine import ProjectionEngine
+from planner.solver import SolveError
+from tests.test_engine import full_config
+
+
+def plan_holds(config, retirement_age, scenario, floor=0):
+    engine = ProjectionEngine(config)
+    run = engine.run(retirement_age, engine.scenario_returns(retirement_age, scenario))
+    return bool(solver.holds(engine, run, retirement_age, floor)[0])
+
+
+class TestMaxWithdrawal:
+    @pytest.mark.parametrize("scenario, floor", [("expected", 0), ("worst", 250000), ("best", 0)])
+    def test_is_the_largest_target_that_holds(self, scenario, floor):
+        config = full_config()
+        result = solver.solve(ProjectionEngine(config), {
+            "goal": "max_withdrawal", "retirement_age": 60, "scenario": scenario, "floor": floor})
+        best = result["max_withdrawal"]
+        assert plan_holds(dict(config, target_retirement_income=best), 60, scenario, floor)
+        assert not plan_holds(dict(config, target_retirement_income=best + 2), 60, scenario, floor)
+        assert result["evaluations"] < 200
+
+    def test_worst_case_is_below_expected(self):
+        engine = ProjectionEngine(full_config())
+        expected = solver.solve(engine, {"goal": "max_withdrawal", "scenario": "expected"})
+        worst = solver.solve(engine, {"goal": "max_withdrawal", "scenario": "worst"})
+        assert worst["max_withdrawal"] < expected["max_withdrawal"]
+
+    def test_unreachable_floor(self):
+        result = solver.solve(ProjectionEngine(full_config()), {
+            "goal": "max_withdrawal", "floor": 1e12})
+        assert result["max_withdrawal"] is None
+
+    def test_monte_carlo_percentile(self):
+        engine = ProjectionEngine(full_config())
+        result = solver.solve(engine, {
+            "goal": "max_withdrawal", "retirement_age": 60, "scenario": "p10",
+            "paths": 200, "seed": 7})
+        assert result["success_probability"] >= 0.9
+        assert result["paths"] == 200 and result["seed"] == 7
+        plan = solver.prepare(engine, {"goal": "max_withdrawal", "retirement_age": 60,
+                                       "scenario": "p10", "paths": 200, "seed": 7})
+        checker = solver._Checker(engine, plan)
+        assert checker.share(60, [result["max_withdrawal"] + 2])[0] < 0.9
+
+
+class TestEarliestRetirementAge:
+    @pytest.mark.parametrize("scenario", ["worst", "expected"])
+    def test_is_the_first_age_that_holds(self, scenario):
+        config = full_config()
+        result = solver.solve(ProjectionEngine(config), {
+            "goal": "earliest_retirement_age", "scenario": scenario})
+        age = result["earliest_retirement_age"]
+        assert result["target_income"] == config["target_retirement_income"]
+        assert plan_holds(config, age, scenario)
+        assert not plan_holds(config, age - 1, scenario)
+        assert result["evaluations"] <= 8
+
+    def test_target_income_override(self):
+        engine = ProjectionEngine(full_config())
+        modest = solver.solve(engine, {"goal": "earliest_retirement_age", "target_income": 60000})
+        lavish = solver.solve(engine, {"goal": "earliest_retirement_age", "target_income": 200000})
+        assert modest["earliest_retirement_age"] < lavish["earliest_retirement_age"]
+
+    def test_monte_carlo_is_reproducible(self):
+        engine = ProjectionEngine(full_config())
+        options = {"goal": "earliest_retirement_age", "scenario": "p10", "paths": 100}
+        assert solver.solve(engine, options) == solver.solve(engine, options)
+
+    def test_never_safe(self):
+        result = solver.solve(ProjectionEngine(full_config()), {
+            "goal": "earliest_retirement_age", "target_income": 1e9})
+        assert result["earliest_retirement_age"] is None
+        assert "success_probability" not in result
+
+
+def test_holds_requires_funded_withdrawals():
+    engine = ProjectionEngine(full_config())
+    run = engine.run_variants(60, engine.scenario_returns(60), 2,
+                              target_income=np.array([50000, 5e6]))
+    assert solver.holds(engine, run, 60, 0).tolist() == [True, False]
+
+
+@pytest.mark.parametrize("options", [
+    {},
+    {"goal": "cheapest_house"},
+    {"goal": "max_withdrawal", "scenario": "p90"},
+    {"goal": "max_withdrawal", "scenario": "median"},
+    {"goal": "max_withdrawal", "retirement_age": 20},
+    {"goal": "max_withdrawal", "retirement_age": "60"},
+    {"goal": "max_withdrawal", "floor": "lots"},
+    {"goal": "max_withdrawal", "paths": 0},
+    {"goal": "earliest_retirement_age", "target_income": True},
+    {"goal": "earliest_retirement_age", "seed": -1},
+])
+def test_rejects_bad_requests(options):
+    with pytest.raises(SolveError):
+        solver.prepare(ProjectionEngine(full_config()), options)
+
+
+@pytest.mark.parametrize("strategy", ["fixed_percent", "vpw"])
+@pytest.mark.parametrize("goal", solver.GOALS)
+def test_rejects_strategies_without_a_target(goal, strategy):
+    config = full_config()
+    config["withdrawal_strategy"] = {"type": strategy}
+    with pytest.raises(SolveError, match=f"{strategy} withdrawal strategy does not use"):
+        solver.prepare(ProjectionEngine(config), {"goal": goal})
+
+
+@pytest.mark.parametrize("goal", solver.GOALS)
+def test_guardrails_follow_the_target(goal):
+    config = full_config()
+    config["withdrawal_strategy"] = {"type": "guardrails"}
+    assert solver.prepare(ProjectionEngine(config), {"goal": goal}).goal == goal
@@ -0,0 +1,145 @@
+"""Tests for server-side config storage."""
+import copy
+import os
+
+import pytest
+from planner.store import ConfigError, ConfigStore, SQLiteBackend, compile_config, validate
+from tests.conftest import MINIMAL_CONFIG
+
+
+@pytest.fixture
+def store():
+    return ConfigStore(SQLiteBackend(":memory:"))
+
+
+class TestValidate:
+    def test_accepts_minimal_config(self):
+        validate(MINIMAL_CONFIG)
+
+    @pytest.mark.parametrize("change, message", [
+        ({"current_age": None}, "current_age"),
+        ({"retirement_ages": [65, "sixty"]}, "retirement_ages"),
+        ({"accounts": [{"type": "401k"}]}, "account"),
+        ({"events": [{"year": 2030, "account": "401k"}]}, "event"),
+        ({"milestones": []}, "milestones"),
+        ({"withdrawal_strategy": {"type": "annuity"}}, "withdrawal_strategy type"),
+        ({"withdrawal_strategy": {"type": "vpw", "rate": 4}}, "does not take rate"),
+        ({"taxes": {"filing_status": "head"}}, "taxes filing_status"),
+        ({"taxes": {"state_rate": -1}}, "taxes state_rate"),
+        ({"milestones": {"401k": {}}}, "milestones for 401k"),
+        ({"milestones": {"401k": [{"years_before": 2.5, "expected": 6, "std_dev": 1}]}},
+         "whole-number years_before"),
+        ({"milestones": {"401k": [{"years_before": 10 ** 9, "expected": 6, "std_dev": 1}]}},
+         "within 150"),
+        ({"milestones": {"401k": [{"years_before": 5, "expected": "6", "std_dev": 1}]}},
+         "expected return"),
+        ({"milestones": {"401k": [{"years_before": 5, "expected": 6, "std_dev": -1}]}},
+         "std_dev"),
+        ({"time_step": "weekly"}, "time_step"),
+        ({"time_step": "monthly", "taxes": {}}, "monthly time_step"),
+        ({"retirement_month": 13}, "retirement_month"),
+    ])
+    def test_rejects_bad_fields(self, change, message):
+        with pytest.raises(ConfigError, match=message):
+            validate(dict(MINIMAL_CONFIG, **change))
+
+    def test_rejects_missing_keys_and_non_objects(self):
+        config = dict(MINIMAL_CONFIG)
+        del config["events"]
+        with pytest.raises(ConfigError, match="events"):
+            validate(config)
+        with pytest.raises(ConfigError):
+            validate([MINIMAL_CONFIG])
+
+    def test_compile_failure_is_a_config_error(self):
+        config = copy.deepcopy(MINIMAL_CONFIG)
+        del config["accounts"][0]["current_balance"]
+        with pytest.raises(ConfigError):
+            compile_config(config)
+
+
+class TestConfigStore:
+    def test_round_trip(self, store):
+        stored = store.save(copy.deepcopy(MINIMAL_CONFIG))
+        assert store.get(stored.id).config == MINIMAL_CONFIG
+        assert stored.engine.current_age == MINIMAL_CONFIG["current_age"]
+
+    def test_unknown_id(self, store):
+        assert store.get("missing") is None
+
+    def test_id_follows_contents(self, store):
+        first = store.save(copy.deepcopy(MINIMAL_CONFIG))
+        assert store.save(copy.deepcopy(MINIMAL_CONFIG)) is first
+        changed = store.save(dict(MINIMAL_CONFIG, ss_annual=1000))
+        assert changed.id != first.id
+        assert changed.key != first.key
+        assert len(store.backend) == 2
+
+    def test_ui_only_keys_change_id_but_not_key(self, store):
+        first = store.save(copy.deepcopy(MINIMAL_CONFIG))
+        labelled = store.save(dict(MINIMAL_CONFIG, profile="Plan B"))
+        assert labelled.id != first.id
+        assert labelled.key == first.key
+
+    def test_reads_through_to_backend(self, store):
+        stored = store.save(copy.deepcopy(MINIMAL_CONFIG))
+        store.cache.clear()
+        loaded = store.get(stored.id)
+        assert loaded.config == MINIMAL_CONFIG
+        assert store.get(stored.id) is loaded
+
+    def test_database_is_shared_between_stores(self, tmp_path):
+        path = str(tmp_path / "configs.db")
+        stored = ConfigStore(SQLiteBackend(path)).save(copy.deepcopy(MINIMAL_CONFIG))
+        assert ConfigStore(SQLiteBackend(path)).get(stored.id).config == MINIMAL_CONFIG
+
+    def test_expired_rows_are_deleted_on_save(self):
+        now = [1000.0]
+        backend = SQLiteBackend(":memory:", ttl=100, clock=lambda: now[0])
+        backend.save("old", {"a": 1})
+        backend.save("used", {"b": 2})
+        now[0] = 1050.0
+        backend.touch("used")
+        now[0] = 1120.0
+        backend.save("new", {"c": 3})
+        assert backend.load("old") is None
+        assert backend.load("used") == {"b": 2}
+        assert len(backend) == 2
+
+    def test_store_touches_configs_it_serves(self):
+        now = [1000.0]
+        store = ConfigStore(SQLiteBackend(":memory:", ttl=100, clock=lambda: now[0]),
+                            touch_interval=0)
+        kept = store.save(copy.deepcopy(MINIMAL_CONFIG))
+        dropped = store.save(dict(MINIMAL_CONFIG, ss_annual=1000))
+        now[0] = 1080.0
+        store.get(kept.id)
+        now[0] = 1150.0
+        store.save(dict(MINIMAL_CONFIG, ss_annual=2000))
+        assert store.backend.load(kept.id) is not None
+        assert store.backend.load(dropped.id) is None
+
+    def test_stored_config_that_no_longer_compiles(self, store):
+        store.backend.save("stale", {"accounts": "broken"})
+        with pytest.raises(ConfigError):
+            store.get("stale")
+
+    @pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork")
+    def test_forked_process_opens_its_own_connection(self, tmp_path):
+        backend = SQLiteBackend(str(tmp_path / "configs.db"))
+        backend.save("parent", {"a": 1})
+        parent_conn = backend._conn
+        read, write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                backend.save("child", {"b": 2})
+                ok = backend.load("parent") == {"a": 1} and backend._conn is not parent_conn
+                os.write(write, b"1" if ok else b"0")
+            finally:
+                os._exit(0)
+        os.close(write)
+        os.waitpid(pid, 0)
+        assert os.read(read, 1) == b"1"
+        assert backend.load("child") == {"b": 2}
+        assert backend._conn is parent_conn
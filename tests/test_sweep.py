@@ -0,0 +1,107 @@
+"""Tests for sensitivity sweeps."""
+import pytest
+from planner import sweep
+from planner.batch import apply_patch
+from planner.engine import ProjectionEngine
+from planner.sweep import SweepError
+from tests.test_engine import full_config
+
+
+def summary_metrics(config, retirement_age, scenario="expected"):
+    summary = ProjectionEngine(config).project_arrays(retirement_age, scenario).summary()
+    lasts_until = summary["portfolio_lasts_until_age"]
+    return {
+        "portfolio_lasts_until_age": None if lasts_until == "N/A" else lasts_until,
+        "portfolio_at_85": summary["portfolio_at_85"],
+    }
+
+
+class TestParameterValues:
+    def test_range_keeps_whole_numbers(self):
+        path, values = sweep.parameter_values(
+            {"path": "ss_start_age", "start": 62, "stop": 70, "steps": 5})
+        assert path == "ss_start_age"
+        assert values == [62, 64, 66, 68, 70]
+        assert all(isinstance(v, int) for v in values)
+
+    def test_explicit_values(self):
+        assert sweep.parameter_values({"path": "inflation_rate", "values": [2, 3.5]}) == \
+            ("inflation_rate", [2, 3.5])
+
+    @pytest.mark.parametrize("spec", [
+        {"path": "inflation_rate"},
+        {"path": "inflation_rate", "start": 1, "stop": 2, "steps": 1},
+        {"path": "inflation_rate", "values": ["high"]},
+        {"path": "a..b", "values": [1]},
+        "inflation_rate",
+    ])
+    def test_rejects_bad_specs(self, spec):
+        with pytest.raises(SweepError):
+            sweep.parameter_values(spec)
+
+
+class TestSweep:
+    @pytest.mark.parametrize("paths", [
+        # Handled by run_variants
+        ("inflation_rate", "accounts[0].annual_contribution"),
+        ("ss_start_age", "target_retirement_income"),
+        # Need their own engines
+        ("life_expectancy", "milestones.401k[0].expected"),
+        # Mixed
+        ("accounts[0].current_balance", "accounts[4].monthly_rent"),
+    ])
+    def test_grid_matches_patched_projections(self, paths):
+        config = full_config()
+        values = {
+            "inflation_rate": [1.0, 4.5],
+            "accounts[0].annual_contribution": [0, 30000],
+            "ss_start_age": [62, 70],
+            "target_retirement_income": [0, 150000],
+            "life_expectancy": [80, 100],
+            "milestones.401k[0].expected": [3.0, 11.0],
+            "accounts[0].current_balance": [0, 2000000],
+            "accounts[4].monthly_rent": [0, 9000],
+        }
+        result = sweep.sweep(config, [{"path": p, "values": values[p]} for p in paths], 60)
+        for i, first in enumerate(values[paths[0]]):
+            for j, second in enumerate(values[paths[1]]):
+                expected = summary_metrics(apply_patch(config, {paths[0]: first, paths[1]: second}), 60)
+                for metric, value in expected.items():
+                    assert result["grid"][metric][i][j] == pytest.approx(value, rel=1e-9), metric
+
+    def test_tornado_moves_one_parameter_at_a_time(self):
+        config = full_config()
+        parameters = [
+            {"path": "ss_annual", "values": [20000, 30000]},
+            {"path": "accounts[0].annual_contribution", "start": 0, "stop": 40000, "steps": 5},
+        ]
+        result = sweep.sweep(config, parameters, 62, "worst")
+        assert result["base"] == pytest.approx(summary_metrics(config, 62, "worst"))
+        bars = result["tornado"]["portfolio_at_85"]
+        contribution = next(bar for bar in bars if bar["path"] == parameters[1]["path"])
+        assert contribution["low_value"] == 0 and contribution["high_value"] == 40000
+        assert contribution["high"] == pytest.approx(summary_metrics(
+            apply_patch(config, {parameters[1]["path"]: 40000}), 62, "worst")["portfolio_at_85"])
+        swings = [abs(bar["high"] - bar["low"]) for bar in bars]
+        assert swings == sorted(swings, reverse=True)
+
+    def test_grid_shape(self):
+        result = sweep.sweep(full_config(), [
+            {"path": "inflation_rate", "start": 1, "stop": 5, "steps": 50},
+            {"path": "salary", "start": 50000, "stop": 250000, "steps": 50},
+        ])
+        grid = result["grid"]["portfolio_lasts_until_age"]
+        assert len(grid) == 50 and all(len(row) == 50 for row in grid)
+
+    @pytest.mark.parametrize("parameters, options", [
+        ([], {}),
+        ([{"path": "accounts[99].current_balance", "values": [1]}], {}),
+        ([{"path": "ss_annual", "values": [1]}] * 2, {}),
+        ([{"path": "ss_annual", "values": [1]}], {"scenario": "median"}),
+        ([{"path": "ss_annual", "values": [1]}], {"retirement_age": "65"}),
+        ([{"path": p, "values": list(range(30))} for p in ("ss_annual", "salary", "inflation_rate")],
+         {}),
+    ])
+    def test_rejects_bad_requests(self, parameters, options):
+        with pytest.raises(SweepError):
+            sweep.prepare(full_config(), parameters, **options)
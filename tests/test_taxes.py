@@ -0,0 +1,116 @@
+"""Tests for the federal tax on withdrawals."""
+import numpy as np
+import pytest
+from planner.taxes import STANDARD_DEDUCTION, Brackets, TaxError, TaxTable, compile_taxes, parse
+from planner.withdrawals import Ordered, Proportional
+
+TYPES = ["401k", "Taxable", "Roth IRA"]
+
+
+def table(n_years=3, other_income=0.0, **spec):
+    return TaxTable(parse(spec), TYPES, np.full(n_years, other_income))
+
+
+class TestBrackets:
+    def test_progressive_rates(self):
+        brackets = Brackets([0, 100, 300], [0.1, 0.2, 0.3])
+        assert brackets(np.array([0.0, 50.0, 100.0, 250.0, 400.0])).tolist() == pytest.approx(
+            [0, 5, 10, 40, 80])
+
+
+class TestTax:
+    def test_ordinary_income_after_the_deduction(self):
+        deduction = STANDARD_DEDUCTION["single"]
+        assert table().tax(0, 50000.0 + deduction, 0.0, 0.0, 1.0) == pytest.approx(5914)
+
+    def test_gains_stack_on_ordinary_income(self):
+        deduction = STANDARD_DEDUCTION["single"]
+        assert table().tax(0, 40000.0 + deduction, 20000.0, 0.0, 1.0) == pytest.approx(6309)
+
+    def test_gains_use_the_deduction_left_over(self):
+        assert table().tax(0, 0.0, STANDARD_DEDUCTION["single"] + 40000.0, 0.0, 1.0) == 0
+
+    def test_part_of_social_security_is_taxable(self):
+        assert table().tax(0, 20000.0, 0.0, 30000.0, 1.0) == pytest.approx(760)
+
+    def test_small_social_security_is_not_taxed(self):
+        assert table().tax(0, 0.0, 0.0, 40000.0, 1.0) == 0
+
+    def test_brackets_follow_inflation(self):
+        tax = table(filing_status="married_joint", state_rate=4)
+        income = np.array([80000.0, 300000.0])
+        np.testing.assert_allclose(tax.tax(0, income * 1.5, 0.0, 0.0, 1.5),
+                                   tax.tax(0, income, 0.0, 0.0, 1.0) * 1.5)
+
+    def test_per_path_index(self):
+        tax = table()
+        paths = tax.tax(0, np.array([60000.0, 90000.0]), 0.0, 0.0, np.array([1.0, 1.5]))
+        assert paths[1] == pytest.approx(tax.tax(0, 60000.0, 0.0, 0.0, 1.0) * 1.5)
+
+    def test_other_income_is_ordinary(self):
+        assert table(other_income=30000.0).tax(1, 20000.0, 0.0, 0.0, 1.0) == pytest.approx(
+            table().tax(1, 50000.0, 0.0, 0.0, 1.0))
+
+    def test_roth_withdrawals_are_free(self):
+        tax = table(taxable_gain_share=50)
+        drawn = np.array([[50000.0, 40000.0, 1e6]])
+        assert tax.tax_on(0, drawn, 0.0, 1.0) == pytest.approx(
+            tax.tax(0, 50000.0, 20000.0, 0.0, 1.0))
+
+
+class TestGrossUp:
+    @pytest.mark.parametrize("order", [Proportional(), Ordered(TYPES)])
+    def test_net_meets_the_need(self, order):
+        tax = table(state_rate=5)
+        pre = np.array([[600000.0, 200000.0, 100000.0], [50000.0, 0.0, 900000.0]])
+        needed = np.array([80000.0, 60000.0])
+        ss = np.array([30000.0, 0.0])
+        amount, drawn, paid, requested = tax.gross_up(
+            2, pre, np.ones(3), needed, ss, 1.05, order)
+        np.testing.assert_allclose(amount - paid, needed, rtol=1e-9)
+        np.testing.assert_allclose(paid, tax.tax_on(2, drawn, ss, 1.05))
+        np.testing.assert_allclose(drawn.sum(axis=1), amount)
+        np.testing.assert_allclose(requested, amount)
+
+    def test_tax_on_other_income_is_drawn(self):
+        tax = table(other_income=40000.0)
+        amount, _, paid, _ = tax.gross_up(
+            0, np.array([[1e6, 0.0, 0.0]]), np.ones(3), np.array([0.0]), 60000.0, 1.0,
+            Proportional())
+        assert paid[0] > 0 and amount[0] == pytest.approx(paid[0])
+
+    def test_short_balance_draws_everything(self):
+        tax = table()
+        amount, _, paid, requested = tax.gross_up(
+            0, np.array([[30000.0, 0.0, 0.0]]), np.ones(3), np.array([50000.0]), 0.0, 1.0,
+            Proportional())
+        assert amount[0] == 30000
+        assert requested[0] == pytest.approx(50000 + paid[0])
+
+    def test_inaccessible_accounts_are_left(self):
+        tax = table()
+        amount, drawn, _, _ = tax.gross_up(
+            0, np.array([[1e6, 20000.0, 0.0]]), np.array([0.0, 1.0, 1.0]), np.array([10000.0]),
+            0.0, 1.0, Proportional())
+        assert drawn[0, 0] == 0 and amount[0] == pytest.approx(10000)
+
+
+class TestParse:
+    def test_off_by_default(self):
+        assert parse(None) is None
+        assert compile_taxes({"accounts": []}, np.zeros(1)) is None
+
+    def test_defaults(self):
+        assert parse({}) == {"filing_status": "single", "taxable_gain_share": 50.0,
+                             "state_rate": 0.0}
+
+    @pytest.mark.parametrize("spec, message", [
+        ("single", "must be an object"),
+        ({"filing_status": "separate"}, "filing_status must be one of"),
+        ({"state_rate": 20}, "between 0 and 15"),
+        ({"taxable_gain_share": True}, "between 0 and 100"),
+        ({"brackets": []}, "does not take brackets"),
+    ])
+    def test_rejects_bad_specs(self, spec, message):
+        with pytest.raises(TaxError, match=message):
+            parse(spec)
@@ -0,0 +1,93 @@
+"""Tests for the batched withdrawal strategies."""
+import numpy as np
+import pytest
+from planner.withdrawals import (
+    FINAL_YEARS, Constant, FixedPercent, Guardrails, Ordered, Proportional, Retired, StrategyError,
+    VPW, parse,
+)
+
+
+def retired(**fields):
+    values = {"initial": 40000.0, "initial_invested": 1000000.0, "previous": 40000.0,
+              "invested": 1000000.0, "growth": 1.05, "years_retired": 5, "years_left": 30}
+    values.update(fields)
+    return Retired(**values)
+
+
+class TestAmounts:
+    def test_constant_grows_with_inflation(self):
+        assert Constant().amount(retired(), 0.03) == pytest.approx(40000 * 1.03 ** 5)
+
+    def test_fixed_percent_follows_the_balance(self):
+        amounts = FixedPercent(5).amount(retired(invested=np.array([0.0, 2e5, -1.0])), 0.03)
+        assert amounts.tolist() == pytest.approx([0.0, 10000.0, 0.0])
+
+    def test_vpw_pays_out_everything_in_the_last_year(self):
+        vpw = VPW(4)
+        assert vpw.amount(retired(invested=123456.0, years_left=1), 0.03) == pytest.approx(123456.0)
+        assert vpw.payout_rate(30) == pytest.approx(0.04 / (1.04 * (1 - 1.04 ** -30)))
+        assert VPW(0).payout_rate(20) == pytest.approx(1 / 20)
+
+    def test_guardrails_follow_inflation_inside_the_rails(self):
+        assert Guardrails(20, 20, 10).amount(retired(), 0.03) == pytest.approx(41200)
+
+    def test_guardrails_start_from_the_initial_withdrawal(self):
+        assert Guardrails(20, 20, 10).amount(retired(years_retired=0, previous=0.0), 0.03) == 40000
+
+    def test_guardrails_cut_and_raise(self):
+        rails = Guardrails(20, 20, 10)
+        invested = np.array([600000.0, 1000000.0, 1600000.0])
+        amounts = rails.amount(retired(invested=invested), 0.0)
+        assert amounts.tolist() == pytest.approx([36000, 40000, 44000])
+
+    def test_guardrails_do_not_cut_near_the_end(self):
+        amount = Guardrails(20, 20, 10).amount(
+            retired(invested=600000.0, years_left=FINAL_YEARS), 0.0)
+        assert amount == pytest.approx(40000)
+
+    def test_guardrails_skip_inflation_after_a_loss_above_the_initial_rate(self):
+        amount = Guardrails(50, 50, 10).amount(retired(invested=900000.0, growth=0.9), 0.03)
+        assert amount == pytest.approx(40000)
+
+
+class TestDraws:
+    def test_proportional_draws_the_same_share(self):
+        pre = np.array([[100.0, 300.0, -50.0]])
+        drawn = Proportional().draw(pre, np.array([1.0, 1.0, 1.0]), np.array([35.0]))
+        np.testing.assert_allclose(drawn, [[10.0, 30.0, 0.0]])
+
+    def test_ordered_empties_tiers_in_turn(self):
+        order = Ordered(["Roth IRA", "401k", "Taxable", "Savings"])
+        pre = np.array([[100.0, 100.0, 30.0, 10.0], [100.0, 100.0, 30.0, 10.0]])
+        drawn = order.draw(pre, np.ones(4), np.array([20.0, 90.0]))
+        np.testing.assert_allclose(drawn, [[0, 0, 15, 5], [0, 50, 30, 10]])
+
+    def test_ordered_skips_inaccessible_accounts(self):
+        order = Ordered(["Taxable", "401k", "Roth IRA"])
+        pre = np.array([[10.0, 100.0, 100.0]])
+        drawn = order.draw(pre, np.array([1.0, 0.0, 1.0]), np.array([50.0]))
+        np.testing.assert_allclose(drawn, [[10, 0, 40]])
+
+
+class TestParse:
+    def test_default_is_not_dynamic(self):
+        withdrawals = parse(None, ["401k"])
+        assert isinstance(withdrawals.strategy, Constant)
+        assert not withdrawals.dynamic
+
+    def test_parameters_and_order(self):
+        withdrawals = parse({"type": "guardrails", "upper": 25, "order": "ordered"}, ["401k"])
+        assert withdrawals.strategy.upper == 0.25 and withdrawals.strategy.lower == 0.2
+        assert isinstance(withdrawals.order, Ordered)
+        assert withdrawals.dynamic
+
+    @pytest.mark.parametrize("spec, message", [
+        ("vpw", "must be an object"),
+        ({"type": "annuity"}, "type must be one of"),
+        ({"order": "alphabetical"}, "order must be one of"),
+        ({"type": "fixed_percent", "rate": 150}, "between 0 and 100"),
+        ({"type": "fixed_percent", "return_rate": 4}, "does not take return_rate"),
+    ])
+    def test_rejects_bad_specs(self, spec, message):
+        with pytest.raises(StrategyError, match=message):
+            parse(spec, ["401k"])